@@ -0,0 +1,249 @@
+"""Caching of results derived from slow-to-parse source files.
+
+Each cached result lives under data/interim/cache/ and is keyed by a hash of
+the source files' names, sizes, modification times and contents (see
+file_fingerprint), the code of the function that built it (see
+function_fingerprint), and any extra parameters.
+A changed source (or loader) simply produces a new key; the stale entry is
+removed when the new one is written.
+
+load_cached serves single source files as Parquet; caregivers.pipeline
+builds on the same keys for whole pipeline stages.
+"""
+
+
+import hashlib
+import json
+import logging
+import os
+import types
+import pandas as pd
+
+from pathlib import Path
+from cleaning.utils import get_project_root
+
+
+PROJECT_ROOT = get_project_root()
+CACHE_DIR = PROJECT_ROOT / 'data/interim/cache'
+
+# bump to invalidate every cache entry at once (e.g. after a pandas upgrade)
+CACHE_VERSION = 1
+
+# bytes hashed at each end of a source file (see content_hash)
+HASH_BLOCK = 2 ** 20
+
+
+def content_hash(path, block=HASH_BLOCK):
+    '''Hash of the first and last `block` bytes of a file, or of all of it
+       if it is no larger than two blocks. Reading the whole of a multi-GB
+       MIMIC table on every run would cost more than the cache saves, but a
+       rewrite of a CSV nearly always changes its ends (the header, the last
+       rows), and that of a gzipped one its trailer (CRC and length).'''
+    size = Path(path).stat().st_size
+    digest = hashlib.sha1()
+
+    with open(path, 'rb') as file:
+        if size <= 2 * block:
+            digest.update(file.read())
+
+        else:
+            digest.update(file.read(block))
+            file.seek(-block, os.SEEK_END)
+            digest.update(file.read(block))
+
+    return digest.hexdigest()
+
+
+def file_fingerprint(path):
+    '''Cheap identity of a file: its name, size, modification time and
+       content_hash. The hash catches a rewrite that keeps the size and
+       modification time (e.g. by `touch -r`, `cp -p` or rsync), unless
+       it only changes the middle of a large file.'''
+    path = Path(path)
+    stat = path.stat()
+
+    return {'name': path.name,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'hash': content_hash(path)}
+
+
+def source_fingerprint(path):
+    '''file_fingerprint of a file, or a hash over the file_fingerprints of
+       every file below a directory.'''
+    path = Path(path)
+
+    if not path.is_dir():
+        return file_fingerprint(path)
+
+    files = sorted(file for file in path.rglob('*') if file.is_file())
+
+    return {'name': path.name,
+            'files': make_key([[str(file.relative_to(path)),
+                                file_fingerprint(file)] for file in files])}
+
+
+def _code_payload(code):
+    '''Bytes identifying a code object, including any nested code objects
+       (lambdas, comprehensions) but not their memory addresses.'''
+    consts = [_code_payload(const) if hasattr(const, 'co_code')
+              else repr(const).encode()
+              for const in code.co_consts]
+
+    return code.co_code + b'|'.join(consts) + repr(code.co_names).encode()
+
+
+def code_fingerprint(func):
+    '''Hash of a function's bytecode and constants, so that editing a loader
+       invalidates whatever it cached.'''
+    return hashlib.sha1(_code_payload(func.__code__)).hexdigest()
+
+
+def _names(code):
+    names = set(code.co_names)
+
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            names |= _names(const)
+
+    return names
+
+
+def _is_own(obj):
+    return getattr(obj, '__module__', None) is not None and\
+        obj.__module__.split('.')[0] == 'cleaning'
+
+
+def _is_plain(value):
+    '''Whether value is built only from plain data, so that its repr is
+       stable across processes (unlike e.g. that of a function).'''
+    if isinstance(value, dict):
+        return all(_is_plain(key) and _is_plain(item)
+                   for key, item in value.items())
+
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return all(_is_plain(item) for item in value)
+
+    return value is None or isinstance(value, (str, int, float, Path))
+
+
+def function_fingerprint(func):
+    '''Like code_fingerprint, but also covers every function and simple
+       module-level value (dicts, lists, strings, ...) of this package that
+       func refers to by name, directly or through the functions it calls.
+       Editing a helper thus invalidates the results of its callers.'''
+    parts = {}
+    todo = [func]
+
+    while todo:
+        func = todo.pop()
+        name = '{}.{}'.format(func.__module__, func.__qualname__)
+
+        if name in parts:
+            continue
+
+        parts[name] = code_fingerprint(func)
+        names = _names(func.__code__)
+        scopes = [func.__globals__]
+
+        # functions used as attributes of other modules of this package,
+        # e.g. `mimic.load_tables` inside compute.readmission
+        scopes += [vars(value) for value in func.__globals__.values()
+                   if isinstance(value, types.ModuleType) and
+                   value.__name__.split('.')[0] == 'cleaning']
+
+        for scope in scopes:
+            for key in names & set(scope):
+                value = scope[key]
+
+                if callable(value) and hasattr(value, '__code__'):
+                    if _is_own(value):
+                        todo.append(value)
+
+                elif _is_plain(value):
+                    parts['{}:{}'.format(name, key)] = repr(value)
+
+    return make_key(parts)
+
+
+def make_key(*parts):
+    '''Short, stable hash of any JSON-serializable parts.'''
+    payload = json.dumps([CACHE_VERSION] + list(parts),
+                         sort_keys=True,
+                         default=str)
+
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+def source_stem(path):
+    '''"ADMISSIONS.csv.gz" -> "ADMISSIONS".'''
+    name = Path(path).name
+
+    for suffix in ('.gz', '.csv', '.json'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+
+    return name
+
+
+def write_cached(write, path, remove_stale=True):
+    '''Atomically writes to path using write(tmp_path), then removes older
+       entries of the same name ("<name>.<key><suffix>").
+
+       remove_stale : If False, only write path (for files not named after
+                      a key).'''
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp_path = path.with_name(path.name + '.tmp')
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+    if not remove_stale:
+        return
+
+    name = path.name[:-len(path.suffix)].rsplit('.', 1)[0]
+
+    for stale in path.parent.glob('{}.*{}'.format(name, path.suffix)):
+        stale_name = stale.name[:-len(path.suffix)].rsplit('.', 1)[0]
+
+        if stale != path and stale_name == name:
+            stale.unlink()
+
+
+def write_parquet(df, path):
+    '''Atomically writes df to path, removing older entries of the same name.
+    '''
+    write_cached(lambda tmp_path: df.to_parquet(tmp_path, index=False), path)
+
+
+def load_cached(source, build, namespace, params=None, cache_dir=None,
+                use_cache=True):
+    '''Returns build(source), served from a Parquet copy whenever the source,
+       the build function and params are all unchanged.
+
+       source    : Path to the source file (plain or gzipped), or to a
+                   directory of source files.
+       build     : Function taking the source path and returning a DataFrame.
+       namespace : Subdirectory of the cache to store the entry in.
+       params    : Extra JSON-serializable values that affect the result.
+    '''
+    if not use_cache:
+        return build(source)
+
+    key = make_key(source_fingerprint(source),
+                   function_fingerprint(build),
+                   params)
+
+    path = Path(cache_dir or CACHE_DIR) / namespace /\
+        '{}.{}.parquet'.format(source_stem(source), key)
+
+    if path.is_file():
+        return pd.read_parquet(path)
+
+    logging.info('Caching {} to {}...'.format(source, path))
+
+    df = build(source)
+    write_parquet(df, path)
+
+    return df
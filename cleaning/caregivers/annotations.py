@@ -1,77 +1,102 @@
+import numpy as np
 import pandas as pd
-from cleaning.clinical_regex import (
-    join_id_with_annotations,
-    has_only_one_annotation_value_per_id
-)
+from cleaning.clinical_regex import read_cr_data
+from cleaning.caregivers import notes
 from cleaning.utils import get_project_root
 
 
 PROJECT_ROOT = get_project_root()
 
+PATH_ANNOTATIONS = PROJECT_ROOT / "data/raw/kmd_annotations_1163_11.19.20.csv"
+PATH_ORIGINAL = notes.PATH_ORIGINAL
 
-def process_annotations(df):
-    """Takes a ClinicalRegex output file and returns a DataFrame
-    containing only the
+
+# ClinicalRegex label -> annotation column; add a label here to add a
+# family role (the n-th label is bit n of the ANNOTATION code)
+LABELS = {
+    "L1_annotation": "ANNOTATION_CHILD",
+    "L2_annotation": "ANNOTATION_SPOUSE"
+}
+
+# ClinicalRegex codes meaning the role is absent (missing values are too)
+NEGATIVE_CODES = [0, 9]
+
+
+def process_annotations(df, labels=LABELS):
+    """Takes ClinicalRegex annotations (see read_cr_data) and returns a
+    DataFrame containing only the
         * id (HADM_ID in this case), and
-        * annotation values (0, 1, 9 in this case) for each
+        * whether any annotation of the id was positive for each
         * label (ANNOTATION_CHILD and ANNOTATION_SPOUSE in this case).
+    
+    Annotation Key:
+        1 = "true positive" -> True
+        9 = "false positive" -> False
+        0 = "true negative" -> False
+        missing -> False
+    Any other code (e.g. 5) counts as positive.
     """
-    df = join_id_with_annotations(df)
-    df = df.rename(columns={
-        "id": "HADM_ID",
-        "L1_annotation": "ANNOTATION_CHILD",
-        "L2_annotation": "ANNOTATION_SPOUSE"
-    })
-    
-    df = df[[
-        "HADM_ID",
-        "ANNOTATION_CHILD",
-        "ANNOTATION_SPOUSE"
-    ]]
-    
-    df = df.groupby("HADM_ID", as_index=False)\
-           .agg(lambda s: s.unique())
+    cols = list(labels.values())
+    
+    df = df.rename(columns=dict(labels, id="HADM_ID"))
+    
+    positive = ~df[cols].fillna(0)\
+                        .isin(NEGATIVE_CODES)
+    
+    df = positive.groupby(df["HADM_ID"])\
+                 .any()\
+                 .reset_index()
     
     return df
 
 
-def resolve_annotations(df):
-    """Handles missing annotations and converts
-    to boolean values.
+def resolve_annotations(df, labels=LABELS):
+    """Admissions without annotations are negative for every label."""
+    cols = list(labels.values())
     
-    Annotation Key:
-        1 = "true positive" -> 1 -> True
-        9 = "false positive" -> 0 -> False
-        0 = "true negative" -> 0 -> False
-    """
-    cols = [
-        "ANNOTATION_CHILD",
-        "ANNOTATION_SPOUSE"
-    ]
-    
-    for col in cols:
-        df[col] = df[col].replace(9, 0)
-        df[col] = df[col].fillna(0)
-        df[col] = df[col].astype(bool)
+    df[cols] = df[cols].fillna(False)\
+                       .astype(bool)
         
     return df
 
 
-def add_computed_columns(df):
-    only_child = df["ANNOTATION_CHILD"] & ~df["ANNOTATION_SPOUSE"]
-    only_spouse = ~df["ANNOTATION_CHILD"] & df["ANNOTATION_SPOUSE"]
-    neither = ~df["ANNOTATION_CHILD"] & ~df["ANNOTATION_SPOUSE"]
-    both = df["ANNOTATION_CHILD"] & df["ANNOTATION_SPOUSE"]
-    any_ = df["ANNOTATION_CHILD"] | df["ANNOTATION_SPOUSE"]
+def annotation_values(names):
+    """The ANNOTATION value of each code (bit n set if the n-th label is
+    positive), e.g. 0 -> NEITHER, 1 -> CHILD, 2 -> SPOUSE, 3 -> BOTH."""
+    values = []
     
-    df["ANNOTATION_BOTH"] = both
-    df["ANNOTATION_ANY"] = any_
+    for code in range(2 ** len(names)):
+        positive = [name for i, name in enumerate(names) if code >> i & 1]
+        
+        if len(positive) == 0:
+            values.append("NEITHER")
+        elif len(positive) == 1:
+            values.append(positive[0])
+        elif len(positive) == len(names) == 2:
+            values.append("BOTH")
+        else:
+            values.append("+".join(positive))
+    
+    return values
+
+
+def add_computed_columns(df, labels=LABELS):
+    cols = list(labels.values())
+    names = [col.replace("ANNOTATION_", "") for col in cols]
+    
+    df["ANNOTATION_BOTH"] = df[cols].all(axis="columns")
+    df["ANNOTATION_ANY"] = df[cols].any(axis="columns")
     
     # all ANNOTATION_ columns in one category
-    df.loc[only_child, "ANNOTATION"] = "CHILD"
-    df.loc[only_spouse, "ANNOTATION"] = "SPOUSE"
-    df.loc[both, "ANNOTATION"] = "BOTH"
-    df.loc[neither, "ANNOTATION"] = "NEITHER"
+    codes = sum(df[col].to_numpy().astype(int) << i for i, col in enumerate(cols))
+    values = annotation_values(names)
+    
+    # categories in sorted order, as they are for a column of strings
+    categories = sorted(values)
+    category_codes = np.array([categories.index(value) for value in values])
+    
+    df["ANNOTATION"] = pd.Categorical.from_codes(category_codes[codes],
+                                                 categories=categories)
     
     return df
 
@@ -82,24 +107,23 @@ def merge_original_data(df_annotations, df_original):
     return df
 
 
-def process(df_annotations, df_original):
-    df = process_annotations(df_annotations)
+def process(df_annotations, df_original, labels=LABELS):
+    df = process_annotations(df_annotations, labels)
     df = merge_original_data(df, df_original)
-    df = resolve_annotations(df)
-    df = add_computed_columns(df)
+    df = resolve_annotations(df, labels)
+    df = add_computed_columns(df, labels)
     
     return df
     
     
-def load_data():
-    path_annotations = PROJECT_ROOT / "data/raw/kmd_annotations_1163_11.19.20.csv"
-    path_original = PROJECT_ROOT / "data/raw/caregivers_set13Jul2020.csv"
+def source_paths():
+    return [PATH_ANNOTATIONS, PATH_ORIGINAL]
 
-    df_annotations = pd.read_csv(path_annotations)
-    df_original = pd.read_csv(path_original)
 
-    assert has_only_one_annotation_value_per_id(df_annotations).all()
-    
+def load_data():
+    df_annotations = read_cr_data(PATH_ANNOTATIONS)
+    df_original = notes.load_notes(PATH_ORIGINAL)
+
     df = process(df_annotations, df_original)
     
     return df
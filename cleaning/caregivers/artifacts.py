@@ -0,0 +1,315 @@
+"""The paper's tables and model summaries, as artifacts of caregivers.build,
+named after the notebooks they reproduce (e.g. tables/table-2 is
+notebooks/tables/table-2.ipynb).
+
+Every artifact is built from the same admission level data
+(main.load_data), loaded once per run and only if something is out of
+date.
+
+Usage:
+    python -m cleaning.caregivers.artifacts [--workers N] [--force] [NAME ...]
+
+NAME may be a pattern, e.g. "tables/*" or "models/with-neither/*".
+"""
+import argparse
+import fnmatch
+import logging
+import pandas as pd
+
+from tableone import TableOne
+
+from cleaning.caregivers import (
+    build,
+    main,
+    models,
+    pipeline
+)
+from cleaning.caregivers.build import Artifact
+from notebooks.models.ref import FORMULA_CONTROL, FORMULA_CONTROL_WITH_GOC
+from notebooks.tables.ref import (
+    columns,
+    columns_elixhauser,
+    columns_vent,
+    nonnormal
+)
+
+
+ANNOTATION_INDICATORS = [
+    "ANNOTATION_CHILD",
+    "ANNOTATION_SPOUSE",
+    "ANNOTATION_BOTH",
+    "ANNOTATION_ANY"
+]
+
+SUMMARY_RESPONSES = [
+    "IDENTIFIED_CONV_GOC",
+    "IDENTIFIED_CONV_LIM",
+    "MORTALITY_3MO_FROM_HADM_ADMIT",
+    "HOSPITAL_EXPIRE_FLAG"
+]
+
+# notebook name prefix -> response, of notebooks/models/with-neither
+OUTCOMES = {
+    "goc": "IDENTIFIED_CONV_GOC",
+    "lim": "IDENTIFIED_CONV_LIM",
+    "mortality_hospital": "HOSPITAL_EXPIRE_FLAG",
+    "mortality_3mo": "MORTALITY_3MO_FROM_HADM_ADMIT",
+    "mortality_6mo": "MORTALITY_6MO_FROM_ICU_OUT",
+    "mortality_1y": "MORTALITY_1Y_FROM_HADM_ADMIT"
+}
+
+ANNOTATION_NEITHER = "C(ANNOTATION, Treatment(reference='NEITHER'))"
+
+OUTCOME_EXPOSURES = [
+    "ANNOTATION_CHILD",
+    "ANNOTATION_SPOUSE",
+    "ANNOTATION_CHILD + ANNOTATION_SPOUSE",
+    ANNOTATION_NEITHER
+]
+
+# additional exposures of the mortality outcomes
+MORTALITY_EXPOSURES = {
+    "adjusted": [
+        ANNOTATION_NEITHER + " + IDENTIFIED_CONV_GOC",
+        ANNOTATION_NEITHER + " * IDENTIFIED_CONV_GOC"
+    ],
+    "unadjusted": [
+        "IDENTIFIED_CONV_GOC"
+    ]
+}
+
+
+def select(df, subset=None):
+    """The admissions of a subset of the data, as the notebooks filter it."""
+    if subset == "without-neither":
+        df = df[df["ANNOTATION"] != "NEITHER"]
+
+    elif subset == "has-spouse":
+        df = df[(df["ANNOTATION"] != "NEITHER") &\
+                (df["ANNOTATION"] != "CHILD")]
+
+    elif subset == "has-spouse_known-marital-status":
+        df = select(df, "has-spouse")
+        df = df[df["MARITAL_STATUS"] != "UNKNOWN/NOT SPECIFIED"]
+
+    elif subset == "survived":
+        df = df[~df["HOSPITAL_EXPIRE_FLAG"].astype(bool)]
+
+    elif subset is not None:
+        raise ValueError("Unknown subset {}".format(subset))
+
+    return models.drop_unused_categories(df)
+
+
+def table_one(df, columns, groupby=None, nonnormal=None, pval=False,
+              subset=None):
+    return TableOne(
+        select(df, subset),
+        columns=columns,
+        groupby=groupby,
+        nonnormal=nonnormal,
+        pval=pval
+    ).tableone
+
+
+def table_one_by_indicator(df, columns, nonnormal=None, pval=True,
+                           subset=None):
+    """table_one grouped by each of the ANNOTATION_INDICATORS, side by
+    side."""
+    return pd.concat([
+        table_one(df, columns, groupby, nonnormal, pval, subset)
+        for groupby in ANNOTATION_INDICATORS
+    ], axis=1)
+
+
+def annotation_crosstab(df):
+    return pd.crosstab(
+        df["ANNOTATION_SPOUSE"],
+        df["ANNOTATION_CHILD"],
+        margins=True,
+        margins_name="Total"
+    )
+
+
+def model_summary(df, reference, subset=None):
+    """The models of a summary notebook: each of the SUMMARY_RESPONSES on
+    ANNOTATION, adjusted (with and without GOC conversations as a control)
+    and unadjusted."""
+    df = models.model_data(select(df, subset))
+    exposure = "C(ANNOTATION, Treatment(reference='{}'))".format(reference)
+
+    controls = {
+        "adjusted": (FORMULA_CONTROL, SUMMARY_RESPONSES),
+        "adjusted, with GOC": (FORMULA_CONTROL_WITH_GOC,
+                               [response for response in SUMMARY_RESPONSES
+                                if response != "IDENTIFIED_CONV_GOC"]),
+        "unadjusted": (None, SUMMARY_RESPONSES)
+    }
+
+    return pd.concat({
+        name: models.run_logits(df,
+                                [(response, exposure) for response in responses],
+                                control,
+                                disp=False)
+        for name, (control, responses) in controls.items()
+    }, names=["model"])
+
+
+def refit_model(df, response, reference, subset=None):
+    """One adjusted model of a summary notebook, refit on a subset of its
+    data (e.g. to check a model that doesn't converge)."""
+    df = models.model_data(select(df, subset))
+    exposure = "C(ANNOTATION, Treatment(reference='{}'))".format(reference)
+
+    return models.run_logits(df, [(response, exposure)], FORMULA_CONTROL,
+                             disp=False)
+
+
+def outcome_models(df, response, adjusted=True):
+    """The models of one of the per outcome notebooks: the response on each
+    of the OUTCOME_EXPOSURES (and the MORTALITY_EXPOSURES)."""
+    df = models.model_data(df)
+    kind = "adjusted" if adjusted else "unadjusted"
+    exposures = list(OUTCOME_EXPOSURES)
+
+    if response not in ("IDENTIFIED_CONV_GOC", "IDENTIFIED_CONV_LIM"):
+        exposures += MORTALITY_EXPOSURES[kind]
+
+    return models.run_logits(df,
+                             [(response, exposure) for exposure in exposures],
+                             FORMULA_CONTROL if adjusted else None,
+                             disp=False)
+
+
+ARTIFACTS = {
+    "tables/table-1": Artifact(table_one, {
+        "columns": columns,
+        "nonnormal": nonnormal
+    }),
+    "tables/table-2": Artifact(table_one, {
+        "columns": columns,
+        "groupby": "ANNOTATION",
+        "nonnormal": nonnormal,
+        "pval": True
+    }),
+    "tables/table-2_larger": Artifact(table_one_by_indicator, {
+        "columns": columns,
+        "nonnormal": nonnormal
+    }),
+    "tables/table-2_without-neither": Artifact(table_one, {
+        "columns": columns,
+        "groupby": "ANNOTATION",
+        "nonnormal": nonnormal,
+        "pval": True,
+        "subset": "without-neither"
+    }),
+    "tables/table-4": Artifact(table_one, {
+        "columns": columns,
+        "groupby": "ANNOTATION",
+        "nonnormal": nonnormal,
+        "pval": True,
+        "subset": "survived"
+    }),
+    "tables/table-4_larger": Artifact(table_one_by_indicator, {
+        "columns": columns,
+        "nonnormal": nonnormal,
+        "subset": "survived"
+    }),
+    "tables/table-elixhauser": Artifact(table_one, {
+        "columns": columns_elixhauser,
+        "groupby": "ANNOTATION",
+        "nonnormal": nonnormal,
+        "pval": True
+    }),
+    "tables/table-vent": Artifact(table_one, {
+        "columns": columns_vent,
+        "groupby": "ANNOTATION",
+        "nonnormal": nonnormal,
+        "pval": True
+    }),
+    "tables/table-goc-2018-model-results": Artifact(table_one_by_indicator, {
+        "columns": ["IDENTIFIED_CONV_GOC", "IDENTIFIED_CONV_LIM"]
+    }),
+    "tables/other": Artifact(annotation_crosstab),
+    "models/with-neither/summary": Artifact(model_summary, {
+        "reference": "NEITHER"
+    }),
+    "models/with-neither/summary-ref-spouse": Artifact(model_summary, {
+        "reference": "SPOUSE"
+    }),
+    "models/without-neither/summary": Artifact(model_summary, {
+        "reference": "SPOUSE",
+        "subset": "without-neither"
+    }),
+    "models/has-spouse/summary": Artifact(model_summary, {
+        "reference": "SPOUSE",
+        "subset": "has-spouse"
+    }),
+    # the adjusted GOC model of that notebook doesn't converge, as every
+    # admission of unknown marital status has a GOC conversation; the
+    # notebook refits it without them
+    "models/has-spouse/summary_goc_known-marital-status": Artifact(refit_model, {
+        "response": "IDENTIFIED_CONV_GOC",
+        "reference": "SPOUSE",
+        "subset": "has-spouse_known-marital-status"
+    })
+}
+
+# notebooks/models/with-neither/<outcome>_(un)adjusted
+for outcome, response in OUTCOMES.items():
+    for kind, adjusted in [("adjusted", True), ("unadjusted", False)]:
+        ARTIFACTS["models/with-neither/{}_{}".format(outcome, kind)] =\
+            Artifact(outcome_models, {"response": response,
+                                      "adjusted": adjusted})
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(
+        description="Build the paper's tables and model summaries.")
+    parser.add_argument("names", nargs="*", default=["*"],
+                        help="artifacts (or patterns) to build, default all")
+    parser.add_argument("--output-dir", default=build.OUTPUT_DIR,
+                        help="directory to write the artifacts to")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes building artifacts")
+    parser.add_argument("--force", action="store_true",
+                        help="rebuild artifacts even if up to date")
+    parser.add_argument("--list", action="store_true",
+                        help="only list the artifacts and whether they are "
+                             "up to date")
+
+    return parser.parse_args(args)
+
+
+def select_artifacts(patterns, artifacts=ARTIFACTS):
+    return {name: artifact for name, artifact in artifacts.items()
+            if any(fnmatch.fnmatch(name, pattern) for pattern in patterns)}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    args = parse_args()
+    artifacts = select_artifacts(args.names)
+
+    # the key of the admission level data, without loading it
+    data_key = pipeline.stage_keys(main.STAGES, "hadm")["hadm"]
+
+    if args.list:
+        outdated = build.outdated(artifacts, data_key, args.output_dir)
+
+        for name in artifacts:
+            print("{} {}".format("outdated  " if name in outdated else "up to date",
+                                 name))
+
+    else:
+        built = build.build(artifacts,
+                            main.load_data,
+                            data_key,
+                            args.output_dir,
+                            workers=args.workers,
+                            force=args.force)
+
+        print("Built {} of {} artifacts in {}.".format(len(built),
+                                                      len(artifacts),
+                                                      args.output_dir))
@@ -0,0 +1,155 @@
+"""Builds the paper's tables and model summaries ("artifacts") from one
+shared admission-level dataset, without running the notebooks.
+
+An artifact is a function of the admission-level data (plus any keyword
+parameters) returning a DataFrame, which is written to reports/<name>.csv.
+Its key is a hash of
+    * its function's code (and that of the helpers it calls),
+    * its parameters, and
+    * the key of the data (e.g. that of the pipeline stage producing it,
+      which covers every source file and stage upstream of it),
+and the keys of the artifacts built last time are kept in a manifest next
+to them. Artifacts whose key is unchanged (and whose file still exists) are
+skipped; the data is only loaded if some artifact is out of date. The others
+are built in parallel worker processes, which each get the data once.
+
+See caregivers.artifacts for the paper's artifacts and the command line.
+"""
+import json
+import logging
+import os
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from cleaning.cache import function_fingerprint, make_key
+from cleaning.utils import get_project_root
+
+
+PROJECT_ROOT = get_project_root()
+OUTPUT_DIR = PROJECT_ROOT / "reports"
+MANIFEST_FILE = "manifest.json"
+
+# params : keyword arguments of func, besides the data
+Artifact = namedtuple("Artifact", ["func", "params"], defaults=[None])
+
+
+def artifact_key(name, artifact, data_key):
+    return make_key(name,
+                    function_fingerprint(artifact.func),
+                    artifact.params,
+                    data_key)
+
+
+def artifact_path(name, output_dir=None):
+    return Path(output_dir or OUTPUT_DIR) / "{}.csv".format(name)
+
+
+def load_manifest(output_dir=None):
+    """Artifact name -> key of the artifacts built last time."""
+    path = Path(output_dir or OUTPUT_DIR) / MANIFEST_FILE
+
+    if not path.is_file():
+        return {}
+
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_manifest(manifest, output_dir=None):
+    with open(Path(output_dir or OUTPUT_DIR) / MANIFEST_FILE, "w") as file:
+        json.dump(manifest, file, indent=4, sort_keys=True)
+
+
+def outdated(artifacts, data_key, output_dir=None):
+    """Name -> key of the artifacts whose key changed since they were last
+    built, or whose file is missing."""
+    manifest = load_manifest(output_dir)
+    keys = {name: artifact_key(name, artifact, data_key)
+            for name, artifact in artifacts.items()}
+
+    return {name: key for name, key in keys.items()
+            if manifest.get(name) != key or
+            not artifact_path(name, output_dir).is_file()}
+
+
+# the data of each worker process, so it is only sent over once
+_DATA = None
+
+
+def _init_worker(df):
+    global _DATA
+    _DATA = df
+
+
+def _build_artifact(args):
+    name, artifact, output_dir = args
+    result = artifact.func(_DATA, **(artifact.params or {}))
+
+    path = artifact_path(name, output_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    result.to_csv(tmp_path)
+    os.replace(tmp_path, path)
+
+    return name
+
+
+def build(artifacts, load_data, data_key, output_dir=None, workers=1,
+          force=False):
+    """Builds the out of date artifacts and returns their names.
+
+    artifacts : Dict of artifact name -> Artifact.
+    load_data : Function returning the data every artifact is built from.
+    data_key  : Key identifying that data without loading it.
+    force     : Rebuild every artifact, even if up to date.
+    """
+    output_dir = Path(output_dir or OUTPUT_DIR)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    if force:
+        todo = {name: artifact_key(name, artifact, data_key)
+                for name, artifact in artifacts.items()}
+
+    else:
+        todo = outdated(artifacts, data_key, output_dir)
+
+    logging.info("Building {} of {} artifacts...".format(len(todo),
+                                                        len(artifacts)))
+
+    if not todo:
+        return []
+
+    manifest = load_manifest(output_dir)
+    tasks = [(name, artifacts[name], output_dir) for name in todo]
+    df = load_data()
+
+    try:
+        if workers > 1:
+            with ProcessPoolExecutor(workers,
+                                     initializer=_init_worker,
+                                     initargs=(df,)) as executor:
+                futures = [executor.submit(_build_artifact, task)
+                           for task in tasks]
+
+                # record each artifact as soon as it is written, so those
+                # already built are kept if a later one fails
+                for future in as_completed(futures):
+                    name = future.result()
+                    manifest[name] = todo[name]
+                    logging.info("Built {}.".format(name))
+
+        else:
+            _init_worker(df)
+
+            for task in tasks:
+                name = _build_artifact(task)
+                manifest[name] = todo[name]
+                logging.info("Built {}.".format(name))
+
+    finally:
+        _init_worker(None)
+        save_manifest(manifest, output_dir)
+
+    return sorted(todo)
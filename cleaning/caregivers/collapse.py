@@ -1,71 +1,109 @@
+import numpy as np
 import pandas as pd
 
 
-def ethnicity(df):
-    df["ETHNICITY"] = df["ETHNICITY"].replace({
-        "^ASIAN.*": "OTHER",
-        "^BLACK.*": "OTHER",
-        "^HISPANIC.*": "OTHER",
-        "^WHITE.*": "(NON-HISPANIC) WHITE",
-        "AMERICAN INDIAN/ALASKA NATIVE FEDERALLY RECOGNIZED TRIBE": "OTHER",
-        "PORTUGUESE": "OTHER",
-        "MIDDLE EASTERN": "OTHER",
-        "MULTI RACE ETHNICITY": "OTHER", 
-        "UNABLE TO OBTAIN": "UNKNOWN/NOT SPECIFIED",
-        "PATIENT DECLINED TO ANSWER": "UNKNOWN/NOT SPECIFIED"
-    }, regex=True)
-    
-    return df
+# column -> how its values are collapsed:
+#   replace : Dicts of regex -> value, applied in order (each to the results
+#             of the ones before), as by Series.replace(..., regex=True).
+#   map     : Dict of value -> value, for whole values only.
+#   keep    : Values to keep; any other value (or a missing one) becomes
+#             `other`.
+#   missing : Value of missing values (default: they stay missing).
+RULES = {
+    "ETHNICITY": {
+        "replace": [{
+            "^ASIAN.*": "OTHER",
+            "^BLACK.*": "OTHER",
+            "^HISPANIC.*": "OTHER",
+            "^WHITE.*": "(NON-HISPANIC) WHITE",
+            "AMERICAN INDIAN/ALASKA NATIVE FEDERALLY RECOGNIZED TRIBE": "OTHER",
+            "PORTUGUESE": "OTHER",
+            "MIDDLE EASTERN": "OTHER",
+            "MULTI RACE ETHNICITY": "OTHER",
+            "UNABLE TO OBTAIN": "UNKNOWN/NOT SPECIFIED",
+            "PATIENT DECLINED TO ANSWER": "UNKNOWN/NOT SPECIFIED"
+        }]
+    },
+    "MARITAL_STATUS": {
+        "replace": [{
+            "SINGLE": "NOT MARRIED",
+            "WIDOWED": "NOT MARRIED",
+            "DIVORCED": "NOT MARRIED",
+            "SEPARATED": "NOT MARRIED"
+        }],
+        "missing": "UNKNOWN/NOT SPECIFIED"
+    },
+    "LANGUAGE": {
+        "keep": ["ENGL", "PTUN", "SPAN", "RUSS"],
+        "other": "OTHER"
+    },
+    "DISCHARGE_LOCATION": {
+        "replace": [{
+            ".*HOSPICE.*": "HOSPICE",
+            "ICF": "SNF",
+            "REHAB/DISTINCT PART HOSP": "SNF",
+            "SHORT TERM HOSPITAL": "OTHER",
+            "DISC-TRAN TO FEDERAL HC": "OTHER",
+            "DISCH-TRAN TO PSYCH HOSP": "OTHER",
+            "OTHER FACILITY": "OTHER"
+        }],
+        "map": {
+            "DEAD/EXPIRED": "DEATH",
+            "HOME HEALTH CARE": "HOME",
+            "HOSPICE": "FACILITY",
+            "LONG TERM CARE HOSPITAL": "FACILITY",
+            "SNF": "FACILITY",
+            "OTHER": "FACILITY",
+            "LEFT AGAINST MEDICAL ADVI": "UNKNOWN/NOT SPECIFIED"
+        }
+    }
+}
 
 
-def discharge_location(df):
-    df["DISCHARGE_LOCATION"] = df["DISCHARGE_LOCATION"].replace({
-        ".*HOSPICE.*": "HOSPICE",
-        "ICF": "SNF",
-        "REHAB/DISTINCT PART HOSP": "SNF",
-        "SHORT TERM HOSPITAL": "OTHER",
-        "DISC-TRAN TO FEDERAL HC": "OTHER",
-        "DISCH-TRAN TO PSYCH HOSP": "OTHER",
-        "OTHER FACILITY": "OTHER"
-    }, regex=True)
-    
-    df["DISCHARGE_LOCATION"] = df["DISCHARGE_LOCATION"].replace({
-        "DEAD/EXPIRED": "DEATH",
-        "HOME HEALTH CARE": "HOME",
-        "HOSPICE": "FACILITY",
-        "LONG TERM CARE HOSPITAL": "FACILITY",
-        "SNF": "FACILITY",
-        "OTHER": "FACILITY",
-        "LEFT AGAINST MEDICAL ADVI": "UNKNOWN/NOT SPECIFIED"
-    })
-    
-    return df
+def collapse_values(values, rule):
+    """The collapsed value of each of `values` (distinct, non-missing), as
+    a Series indexed by the original values."""
+    collapsed = pd.Series(values, index=values, dtype=object)
 
+    for replace in rule.get("replace", []):
+        collapsed = collapsed.replace(replace, regex=True)
 
-def marital_status(df):
-    df["MARITAL_STATUS"] = df["MARITAL_STATUS"].replace({
-        "SINGLE": "NOT MARRIED",
-        "WIDOWED": "NOT MARRIED",
-        "DIVORCED": "NOT MARRIED",
-        "SEPARATED": "NOT MARRIED"
-    }, regex=True)
-    
-    df["MARITAL_STATUS"] = df["MARITAL_STATUS"].fillna("UNKNOWN/NOT SPECIFIED")
-    
-    return df
+    if "map" in rule:
+        collapsed = collapsed.replace(rule["map"])
 
+    if "keep" in rule:
+        collapsed = collapsed.where(collapsed.isin(rule["keep"]), rule["other"])
 
-def language(df):
-    is_engl = df["LANGUAGE"] == "ENGL"
-    is_ptun = df["LANGUAGE"] == "PTUN"
-    is_span = df["LANGUAGE"] == "SPAN"
-    is_russ = df["LANGUAGE"] == "RUSS"
-    
-    to_keep = is_engl | is_ptun | is_span | is_russ
-        
-    df.loc[~to_keep, "LANGUAGE"] = "OTHER"
-    
-    return df
+    return collapsed
+
+
+def collapse_column(s, rule):
+    """Collapses a column as a categorical: the rule is applied to its (few)
+    categories rather than to every row, and each row only has its code
+    remapped."""
+    s = s.astype("category").cat.remove_unused_categories()
+    codes = s.cat.codes.to_numpy()
+
+    missing = rule["other"] if "keep" in rule else rule.get("missing", np.nan)
+
+    # collapsed value of each code, with that of missing values (code -1)
+    # last, and only as a category if there are any
+    collapsed = list(collapse_values(s.cat.categories, rule)) + [missing]
+    used = collapsed if (codes == -1).any() else collapsed[:-1]
+    categories = sorted({value for value in used if pd.notna(value)})
+    new_codes = np.array([categories.index(value) if value in categories
+                          else -1 for value in collapsed])
+
+    return pd.Series(pd.Categorical.from_codes(new_codes[codes],
+                                               categories=categories),
+                     index=s.index,
+                     name=s.name)
+
+
+def collapse(df, rules=RULES):
+    """Collapses every column of `rules` in one pass."""
+    return df.assign(**{col: collapse_column(df[col], rule)
+                        for col, rule in rules.items()})
 
 
 def hospital_expire_flag_to_bool(df):
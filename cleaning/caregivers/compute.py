@@ -53,27 +53,54 @@ def elixhauser_scores(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def readmission(df: pd.DataFrame) -> pd.DataFrame:
-    # reload mimic data (more readable than efficient)
-    df_m = mimic.load_data()
-    df_m = df_m[["SUBJECT_ID", "HADM_ID", "ADMITTIME"]].drop_duplicates()
+READMISSION_WINDOWS = (30, 90, 365)
+
+
+def readmissions(df_m: pd.DataFrame, windows=READMISSION_WINDOWS) -> pd.DataFrame:
+    """Readmission features of each admission in `df_m` (with columns
+    SUBJECT_ID, HADM_ID, ADMITTIME and DISCHTIME), from a single sort by
+    subject and ADMITTIME:
+        * HAS_READMISSION: whether the subject has any later admission
+        * DAYS_TO_READMISSION: days from discharge to the next admission
+        * READMISSION_<n>D: whether that is at most n days, for n in windows
+        * N_READMISSIONS: number of later admissions of the subject
+    """
+    df_m = df_m[["SUBJECT_ID", "HADM_ID", "ADMITTIME", "DISCHTIME"]]\
+        .drop_duplicates()\
+        .sort_values(["SUBJECT_ID", "ADMITTIME"])\
+        .reset_index(drop=True)
     
     # check each ADMITTIME only has one HADM_ID associated with it
     # for a given subject
-    assert (df_m.groupby(["ADMITTIME", "SUBJECT_ID"])["HADM_ID"].nunique() == 1).all()
+    assert not df_m.duplicated(["SUBJECT_ID", "ADMITTIME"]).any()
+    
+    # the next row is the next admission if it's of the same subject
+    has_next = df_m["SUBJECT_ID"].shift(-1) == df_m["SUBJECT_ID"]
+    next_admittime = df_m["ADMITTIME"].shift(-1).where(has_next)
+    
+    df_m["HAS_READMISSION"] = has_next
+    df_m["DAYS_TO_READMISSION"] = next_admittime.subtract(df_m["DISCHTIME"]) / np.timedelta64(1, "D")
     
-    # find the admittimes of the last hospital admit for each patient
-    df_subj = df_m.groupby("SUBJECT_ID")\
-                  .agg(ADMITTIME_LATEST=("ADMITTIME", "max"))\
-                  .reset_index()
+    for days in windows:
+        df_m["READMISSION_{}D".format(days)] = df_m["DAYS_TO_READMISSION"] <= days
     
-    df_m = df_m.merge(df_subj)
+    df_m["N_READMISSIONS"] = df_m.groupby("SUBJECT_ID").cumcount(ascending=False)
+    
+    return df_m.drop(columns=["ADMITTIME", "DISCHTIME"])
+
+
+def readmission(df: pd.DataFrame, tables=None, windows=READMISSION_WINDOWS) -> pd.DataFrame:
+    """Adds the readmission features of `readmissions` to `df`.
     
-    df_m["HAS_READMISSION"] = df_m["ADMITTIME"] < df_m["ADMITTIME_LATEST"]
+    tables : MIMIC tables from mimic.load_tables(); loaded if not given.
+    """
+    if tables is None:
+        tables = mimic.load_tables(["ADMISSIONS", "ICUSTAYS"])
     
-    df_m = df_m[["SUBJECT_ID", "HADM_ID", "HAS_READMISSION"]].drop_duplicates()
+    # only admissions with an ICU stay count, as in the merged MIMIC data
+    df_m = tables["ADMISSIONS"][["SUBJECT_ID", "HADM_ID", "ADMITTIME", "DISCHTIME"]]\
+        .merge(tables["ICUSTAYS"][["SUBJECT_ID", "HADM_ID"]].drop_duplicates())
     
-    df = df.merge(df_m)
+    df = df.merge(readmissions(df_m, windows))
     
     return df
-    
\ No newline at end of file
@@ -1,17 +1,64 @@
 import pandas as pd
 
 
-def earliest_sofa(df: pd.DataFrame) -> pd.DataFrame:
-    """Return a DataFrame of the earliest available SOFA value
-    for each given HADM_ID.
+FIRST_ICU_COLS = ["SOFA", "VENT_TIME_FROM_ICU", "VENT_FIRST_48_ICU"]
+LAST_ICU_COLS = ["MORTALITY_6MO_FROM_ICU_OUT"]
+
+
+def icu_index(df: pd.DataFrame) -> pd.DataFrame:
+    """Row labels of the first (earliest INTIME) and last (latest OUTTIME)
+    ICU stay row of each HADM_ID, from one sort per column.
+    
+    The sorts are stable, so among tied rows the first one in `df` is picked,
+    exactly like groupby(...).idxmin()/idxmax().
     """
+    first = df[["HADM_ID", "INTIME"]]\
+        .sort_values(["HADM_ID", "INTIME"])\
+        .drop_duplicates("HADM_ID")
     
-    # earliest INTIME (transfer to ICU) for a given HADM_ID
-    earliest = df.groupby("HADM_ID")["INTIME"].idxmin()
+    last = df[["HADM_ID", "OUTTIME"]]\
+        .sort_values(["HADM_ID", "OUTTIME"], ascending=[True, False])\
+        .drop_duplicates("HADM_ID")
     
-    df = df.loc[earliest, ["HADM_ID", "SOFA"]]
+    index = pd.DataFrame({"FIRST": first.index}, index=first["HADM_ID"])\
+        .join(pd.DataFrame({"LAST": last.index}, index=last["HADM_ID"]))
     
-    return df
+    return index
+
+
+def first_icu(df: pd.DataFrame, cols, index=None) -> pd.DataFrame:
+    """Values of `cols` at the first ICU stay of each HADM_ID."""
+    if index is None:
+        index = icu_index(df)
+    
+    return df.loc[index["FIRST"], ["HADM_ID"] + list(cols)]
+
+
+def last_icu(df: pd.DataFrame, cols, index=None) -> pd.DataFrame:
+    """Values of `cols` at the last ICU stay of each HADM_ID."""
+    if index is None:
+        index = icu_index(df)
+    
+    return df.loc[index["LAST"], ["HADM_ID"] + list(cols)]
+
+
+def icu_features(df: pd.DataFrame,
+                 first_cols=FIRST_ICU_COLS,
+                 last_cols=LAST_ICU_COLS) -> pd.DataFrame:
+    """All first and last ICU stay features of each HADM_ID in one frame."""
+    index = icu_index(df)
+    
+    df_first = first_icu(df, first_cols, index).set_index("HADM_ID")
+    df_last = last_icu(df, last_cols, index).set_index("HADM_ID")
+    
+    return df_first.join(df_last).reset_index()
+
+
+def earliest_sofa(df: pd.DataFrame, index=None) -> pd.DataFrame:
+    """Return a DataFrame of the earliest available SOFA value
+    for each given HADM_ID.
+    """
+    return first_icu(df, ["SOFA"], index)
 
 
 def vent_total_hours(df: pd.DataFrame) -> pd.DataFrame:
@@ -34,32 +81,17 @@ def vent_total_count(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def vent_time_from_first_icu(df: pd.DataFrame) -> pd.DataFrame:
+def vent_time_from_first_icu(df: pd.DataFrame, index=None) -> pd.DataFrame:
     """Time between INTIME for first ICUSTAY and ventilation event."""
-
-    # earliest INTIME (transfer to ICU) for a given HADM_ID
-    earliest = df.groupby("HADM_ID")["INTIME"].idxmin()
-
-    df = df.loc[earliest, ["HADM_ID", "VENT_TIME_FROM_ICU"]]
-    
-    return df
+    return first_icu(df, ["VENT_TIME_FROM_ICU"], index)
 
 
-def vent_first_48_first_icu(df: pd.DataFrame) -> pd.DataFrame:
+def vent_first_48_first_icu(df: pd.DataFrame, index=None) -> pd.DataFrame:
     """Whether, for the first ICUSTAY, the first ventilation event
        began within the first 48 hours.
     """
-    
-    earliest = df.groupby("HADM_ID")["INTIME"].idxmin()
-    
-    df = df.loc[earliest, ["HADM_ID", "VENT_FIRST_48_ICU"]]
-    
-    return df
+    return first_icu(df, ["VENT_FIRST_48_ICU"], index)
 
 
-def post_icu_mortality(df: pd.DataFrame) -> pd.DataFrame:
-    latest = df.groupby("HADM_ID")["OUTTIME"].idxmax()
-    
-    df = df.loc[latest, ["HADM_ID", "MORTALITY_6MO_FROM_ICU_OUT"]]
-    
-    return df
+def post_icu_mortality(df: pd.DataFrame, index=None) -> pd.DataFrame:
+    return last_icu(df, ["MORTALITY_6MO_FROM_ICU_OUT"], index)
@@ -1,7 +1,11 @@
+import argparse
+import logging
 import pandas as pd
 
+from pathlib import Path
+
 from cleaning.utils import (
-    handle_datetime_types,
+    aggregate,
     squish
 )
 from cleaning.caregivers import (
@@ -11,41 +15,122 @@ from cleaning.caregivers import (
     compute,
     collapse,
     impute,
-    hadm
+    hadm,
+    pipeline
 )
+from cleaning.caregivers.pipeline import Stage
 
 
-def process_all():
-    df = annotations.load_data()
-    df = df.merge(mimic.load_data())
-    df = df.merge(neuroner.load_data())
-    df = handle_datetime_types(df)
-    df = compute.time_to_vent(df)
-    df = compute.time_to_death(df)
-    df = compute.los_hadm(df)
-    df = compute.admission_age(df)
-    df = compute.elixhauser_scores(df)
-    df = compute.readmission(df)
-    df = impute.admission_age(df)
-    df = collapse.hospital_expire_flag_to_bool(df)
-    df = collapse.ethnicity(df)
-    df = collapse.marital_status(df)
-    df = collapse.language(df)
-    df = collapse.discharge_location(df)
-    
-    return df
+KEYS = ["SUBJECT_ID", "HADM_ID"]
 
+# columns of the hospital admission level data, in order
+HADM_COLUMNS = [
+    "HADM_ID",
+    "SUBJECT_ID",
+    "SEX",
+    "MARITAL_STATUS",
+    "ETHNICITY",
+    "LANGUAGE",
+    "ADMISSION_AGE",
+    "LOS_HADM",
+    "DISCHARGE_LOCATION",
+    "N_ICUSTAYS",
+    "N_TEXTS",
+    "ANNOTATION_CHILD",
+    "ANNOTATION_SPOUSE",
+    "ANNOTATION_BOTH",
+    "ANNOTATION_ANY",
+    "ANNOTATION",
+    "IDENTIFIED_CONV_GOC",
+    "IDENTIFIED_CONV_LIM",
+    "HOSPITAL_EXPIRE_FLAG",
+    "MORTALITY_3MO_FROM_HADM_ADMIT",
+    "MORTALITY_1Y_FROM_HADM_ADMIT",
+    "HAS_READMISSION",
+    "DAYS_TO_READMISSION",
+    "READMISSION_30D",
+    "READMISSION_90D",
+    "READMISSION_365D",
+    "N_READMISSIONS",
+    "VENT_TIME_FROM_HADM",
+    "VENT_FIRST_48_HADM",
+    "CONGESTIVE_HEART_FAILURE",
+    "CARDIAC_ARRHYTHMIAS",
+    "VALVULAR_DISEASE",
+    "PULMONARY_CIRCULATION",
+    "PERIPHERAL_VASCULAR",
+    "HYPERTENSION",
+    "PARALYSIS",
+    "OTHER_NEUROLOGICAL",
+    "CHRONIC_PULMONARY",
+    "DIABETES_UNCOMPLICATED",
+    "DIABETES_COMPLICATED",
+    "HYPOTHYROIDISM",
+    "RENAL_FAILURE",
+    "LIVER_DISEASE",
+    "PEPTIC_ULCER",
+    "AIDS",
+    "LYMPHOMA",
+    "METASTATIC_CANCER",
+    "SOLID_TUMOR",
+    "RHEUMATOID_ARTHRITIS",
+    "COAGULOPATHY",
+    "OBESITY",
+    "WEIGHT_LOSS",
+    "FLUID_ELECTROLYTE",
+    "BLOOD_LOSS_ANEMIA",
+    "DEFICIENCY_ANEMIAS",
+    "ALCOHOL_ABUSE",
+    "DRUG_ABUSE",
+    "PSYCHOSES",
+    "DEPRESSION",
+    "ELIX_SCORE",
+    "ELIX_WEIGHTED_VW",
+    "ELIX_WEIGHTED_AHRQ",
+    "VENT_TOTAL_HOURS",
+    "VENT_TOTAL_COUNT",
+    "SOFA",
+    "VENT_TIME_FROM_ICU",
+    "VENT_FIRST_48_ICU",
+    "MORTALITY_6MO_FROM_ICU_OUT"
+]
 
-def load_data_full():
-    """Get full, unaggregated data."""
-    return process_all()
 
+def aggregate_notes(df_annotations, df_neuroner):
+    """Collapse the notes, with their annotations and NeuroNER results, to
+    one row per hospital admission (SUBJECT_ID, HADM_ID)."""
+    df = df_annotations.merge(df_neuroner)
+    
+    df_n = aggregate(
+        df,
+        KEYS,
+        N_TEXTS=("TEXT_HASH", "nunique"),
+        ANNOTATION_CHILD=("ANNOTATION_CHILD", squish),
+        ANNOTATION_SPOUSE=("ANNOTATION_SPOUSE", squish),
+        ANNOTATION_BOTH=("ANNOTATION_BOTH", squish),
+        ANNOTATION_ANY=("ANNOTATION_ANY", squish),
+        ANNOTATION=("ANNOTATION", squish),
+        IDENTIFIED_CONV_GOC=("CAR", "any"),
+        IDENTIFIED_CONV_LIM=("LIM", "any")
+    ).reset_index()
+    
+    return df_n
 
-def load_data():
-    """Get hospital admission level data."""
-    df = load_data_full()
+
+def merge_sources(df_notes, tables):
+    """The MIMIC data (one row per ventilation event, or per ICU stay
+    without any) of the admissions with notes. The notes are already
+    aggregated (see aggregate_notes), so they don't multiply the rows."""
+    df = df_notes[KEYS].merge(mimic.load_data(tables=tables))
     
-    df_h = df.groupby("HADM_ID").agg(
+    return df
+
+
+def aggregate_mimic(df):
+    """Collapse the MIMIC data to hospital admission level."""
+    df_h = aggregate(
+        df,
+        "HADM_ID",
         SUBJECT_ID=("SUBJECT_ID", squish),
         SEX=("GENDER", squish),
         MARITAL_STATUS=("MARITAL_STATUS", squish),
@@ -55,18 +140,15 @@ def load_data():
         LOS_HADM=("LOS_HADM", squish),
         DISCHARGE_LOCATION=("DISCHARGE_LOCATION", squish),
         N_ICUSTAYS=("ICUSTAY_ID", "nunique"),
-        N_TEXTS=("TEXT", "nunique"),
-        ANNOTATION_CHILD=("ANNOTATION_CHILD", squish),
-        ANNOTATION_SPOUSE=("ANNOTATION_SPOUSE", squish),
-        ANNOTATION_BOTH=("ANNOTATION_BOTH", squish),
-        ANNOTATION_ANY=("ANNOTATION_ANY", squish),
-        ANNOTATION=("ANNOTATION", squish),
-        IDENTIFIED_CONV_GOC=("CAR", "any"),
-        IDENTIFIED_CONV_LIM=("LIM", "any"),
         HOSPITAL_EXPIRE_FLAG=("HOSPITAL_EXPIRE_FLAG", squish),
         MORTALITY_3MO_FROM_HADM_ADMIT=("MORTALITY_3MO_FROM_HADM_ADMIT", squish),
         MORTALITY_1Y_FROM_HADM_ADMIT=("MORTALITY_1Y_FROM_HADM_ADMIT", squish),
         HAS_READMISSION=("HAS_READMISSION", squish),
+        DAYS_TO_READMISSION=("DAYS_TO_READMISSION", squish),
+        READMISSION_30D=("READMISSION_30D", squish),
+        READMISSION_90D=("READMISSION_90D", squish),
+        READMISSION_365D=("READMISSION_365D", squish),
+        N_READMISSIONS=("N_READMISSIONS", squish),
         VENT_TIME_FROM_HADM=("VENT_TIME_FROM_HADM", "min"),
         VENT_FIRST_48_HADM=("VENT_FIRST_48_HADM", "any"),
         
@@ -106,17 +188,110 @@ def load_data():
         ELIX_WEIGHTED_AHRQ=("ELIX_WEIGHTED_AHRQ", squish)
     ).reset_index()
     
-    
-    # SOFA
-    df_h = df_h.merge(hadm.earliest_sofa(df))
+    return df_h
+
+
+def join_hadm(df_h, df_notes, df_vent_hours, df_vent_count, df_icu):
+    """Join the admission level MIMIC data (see aggregate_mimic), notes data
+    and features (see hadm)."""
+    # Notes
+    df_h = df_h.merge(df_notes, on=KEYS)
     
     # Ventilation
-    df_h = df_h.merge(hadm.vent_total_hours(df))
-    df_h = df_h.merge(hadm.vent_total_count(df))
-    df_h = df_h.merge(hadm.vent_time_from_first_icu(df))
-    df_h = df_h.merge(hadm.vent_first_48_first_icu(df))
+    df_h = df_h.merge(df_vent_hours)
+    df_h = df_h.merge(df_vent_count)
     
-    # Post ICU mortality
-    df_h = df_h.merge(hadm.post_icu_mortality(df))
-            
-    return df_h
+    # SOFA, ventilation and post ICU mortality of the first/last ICU stay
+    df_h = df_h.merge(df_icu)
+    
+    return df_h[HADM_COLUMNS]
+
+
+def aggregate_hadm(df, df_notes):
+    """Collapse the MIMIC data to hospital admission level and join the
+    admission level notes data."""
+    return join_hadm(aggregate_mimic(df),
+                     df_notes,
+                     hadm.vent_total_hours(df),
+                     hadm.vent_total_count(df),
+                     hadm.icu_features(df))
+
+
+# each stage takes the results of its inputs, in order
+STAGES = {
+    "mimic": Stage(mimic.load_tables, sources=mimic.source_paths),
+    "annotations": Stage(annotations.load_data, sources=annotations.source_paths),
+    "neuroner": Stage(neuroner.load_flags, sources=neuroner.source_paths),
+    "notes": Stage(aggregate_notes, ["annotations", "neuroner"]),
+    "merge": Stage(merge_sources, ["notes", "mimic"]),
+    "compute.time_to_vent": Stage(compute.time_to_vent, ["merge"]),
+    "compute.time_to_death": Stage(compute.time_to_death, ["compute.time_to_vent"]),
+    "compute.los_hadm": Stage(compute.los_hadm, ["compute.time_to_death"]),
+    "compute.admission_age": Stage(compute.admission_age, ["compute.los_hadm"]),
+    "compute.elixhauser_scores": Stage(compute.elixhauser_scores, ["compute.admission_age"]),
+    "compute.readmission": Stage(compute.readmission, ["compute.elixhauser_scores", "mimic"]),
+    "impute.admission_age": Stage(impute.admission_age, ["compute.readmission"]),
+    "collapse.hospital_expire_flag_to_bool": Stage(collapse.hospital_expire_flag_to_bool, ["impute.admission_age"]),
+    "collapse": Stage(collapse.collapse, ["collapse.hospital_expire_flag_to_bool"]),
+    "aggregate": Stage(aggregate_mimic, ["collapse"]),
+    "hadm.vent_total_hours": Stage(hadm.vent_total_hours, ["collapse"]),
+    "hadm.vent_total_count": Stage(hadm.vent_total_count, ["collapse"]),
+    "hadm.icu_features": Stage(hadm.icu_features, ["collapse"]),
+    "hadm": Stage(join_hadm, ["aggregate",
+                              "notes",
+                              "hadm.vent_total_hours",
+                              "hadm.vent_total_count",
+                              "hadm.icu_features"])
+}
+
+
+def process_all(use_cache=True, trace=None):
+    """Run (or load cached results of) every stage up to the full data.
+    See pipeline.run for profiling the stages with `trace`."""
+    return pipeline.run(STAGES, "collapse", use_cache, trace=trace)
+
+
+def load_mimic_full(use_cache=True, trace=None):
+    """Get full, unaggregated MIMIC data (one row per ventilation event, or
+    per ICU stay without any) of the admissions with notes. Unlike the former
+    load_data_full, this has none of the notes' columns (TEXT, annotations,
+    CAR/LIM): those are aggregated per admission separately (see
+    aggregate_notes), and joined in by load_data."""
+    return process_all(use_cache, trace)
+
+
+def load_data(use_cache=True, trace=None):
+    """Get hospital admission level data."""
+    return pipeline.run(STAGES, "hadm", use_cache, trace=trace)
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(
+        description="Run the cleaning pipeline, printing the time, memory "
+                    "and rows of each stage.")
+    parser.add_argument("target", nargs="?", default="hadm",
+                        choices=list(STAGES),
+                        help="stage to run up to, default hadm")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="run every stage, rather than loading cached "
+                             "results")
+    parser.add_argument("--trace", type=Path,
+                        help="JSON file to write the record of each stage to")
+
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    args = parse_args()
+    trace = []
+
+    pipeline.run(STAGES, args.target, not args.no_cache, trace=trace)
+
+    if args.trace:
+        pipeline.write_trace(trace, args.trace)
+
+    with pd.option_context("display.width", None,
+                           "display.max_columns", None):
+        print(pipeline.summarize(trace))
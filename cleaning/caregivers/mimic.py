@@ -1,38 +1,42 @@
-import pandas as pd
-
-from cleaning.utils import get_project_root
+from cleaning.cache import load_cached
+from cleaning.caregivers import schema
+from cleaning.utils import (
+    find_source,
+    get_project_root
+)
 
 
 PROJECT_ROOT = get_project_root()
 
 
 def path_to_mimic(file):
-    return PROJECT_ROOT / "data/raw/mimic-iii/{}.csv".format(file)
+    return find_source(PROJECT_ROOT / "data/raw/mimic-iii/{}.csv".format(file))
 
 
 def path_to_mimic_derived(file):
-    return PROJECT_ROOT / "data/raw/mimic-iii-derived/{}.csv".format(file)
+    return find_source(PROJECT_ROOT / "data/raw/mimic-iii-derived/{}.csv".format(file))
 
 
-def load_main_tables():
-    df_admissions = pd.read_csv(path_to_mimic("ADMISSIONS"))
-    df_icustays = pd.read_csv(path_to_mimic("ICUSTAYS"))
-    df_patients = pd.read_csv(path_to_mimic("PATIENTS"))
-    
-    df_admissions = df_admissions.drop(columns=["ROW_ID"])
-    df_icustays = df_icustays.drop(columns=["ROW_ID"])
-    df_patients = df_patients.drop(columns=["ROW_ID"])
-    
-    df = df_admissions.merge(df_patients,
-                             on="SUBJECT_ID")\
-                      .merge(df_icustays,
-                             on=["SUBJECT_ID", "HADM_ID"])
-    
-    return df
+def source_paths():
+    return [path_to_mimic("ADMISSIONS"),
+            path_to_mimic("ICUSTAYS"),
+            path_to_mimic("PATIENTS"),
+            path_to_mimic_derived("ventdurations"),
+            path_to_mimic_derived("sofa"),
+            path_to_mimic_derived("elixhauser")]
+
+
+def table_name(path):
+    return path.name.split(".")[0]
+
 
+def read_main_table(path):
+    """Reads the columns of a MIMIC table declared in `schema`."""
+    return schema.read_csv(path, schema.TABLES[table_name(path)])
 
-def load_ventduration_table():
-    df = pd.read_csv(path_to_mimic_derived("ventdurations"))
+
+def read_ventduration_table(path):
+    df = schema.read_csv(path, schema.VENTDURATIONS)
     
     # columns in this one are lowercase for some reason
     df.columns = df.columns.str.upper()
@@ -41,36 +45,94 @@ def load_ventduration_table():
     df = df.dropna(subset=["ICUSTAY_ID"])
     
     # now we can make ICUSTAY_ID into an int column
-    df["ICUSTAY_ID"] = df["ICUSTAY_ID"].astype(int)
+    df["ICUSTAY_ID"] = df["ICUSTAY_ID"].astype("int32")
 
     return df
 
 
-def load_sofa_table():
-    df = pd.read_csv(path_to_mimic_derived("sofa"))
+def read_derived_table(path):
+    df = schema.read_csv(path, schema.TABLES[table_name(path)])
     
-    # columns in this one are lowercase for some reason
+    # columns in these are lowercase for some reason
     df.columns = df.columns.str.upper()
     
     return df
 
 
-def load_elixhauser_table():
-    df = pd.read_csv(path_to_mimic_derived("elixhauser"))
+def load_table(path, read, namespace, use_cache=True):
+    """Loads a table through the Parquet cache. The declared schema is part
+    of the cache key, so editing it invalidates the cached copy."""
+    return load_cached(path, read,
+                       namespace=namespace,
+                       params=schema.TABLES[table_name(path)],
+                       use_cache=use_cache)
+
+
+def load_main_table(name, use_cache=True):
+    return load_table(path_to_mimic(name), read_main_table,
+                      "mimic-iii", use_cache)
+
+
+def load_ventduration_table(use_cache=True):
+    return load_table(path_to_mimic_derived("ventdurations"), read_ventduration_table,
+                      "mimic-iii-derived", use_cache)
+
+
+def load_sofa_table(use_cache=True):
+    return load_table(path_to_mimic_derived("sofa"), read_derived_table,
+                      "mimic-iii-derived", use_cache)
+
+
+def load_elixhauser_table(use_cache=True):
+    return load_table(path_to_mimic_derived("elixhauser"), read_derived_table,
+                      "mimic-iii-derived", use_cache)
+
+
+def load_tables(names=None, use_cache=True):
+    """Loads each MIMIC table once, keyed by table name, so that stages
+    needing only some of them don't have to reload (and remerge) everything.
     
-    df.columns = df.columns.str.upper()
+    names : Tables to load (default: all of schema.TABLES).
+    """
+    loaders = {
+        "ADMISSIONS": lambda: load_main_table("ADMISSIONS", use_cache),
+        "ICUSTAYS": lambda: load_main_table("ICUSTAYS", use_cache),
+        "PATIENTS": lambda: load_main_table("PATIENTS", use_cache),
+        "ventdurations": lambda: load_ventduration_table(use_cache),
+        "sofa": lambda: load_sofa_table(use_cache),
+        "elixhauser": lambda: load_elixhauser_table(use_cache)
+    }
     
-    return df
+    return {name: loaders[name]() for name in (names or loaders)}
 
 
-def load_data():
-    df_main = load_main_tables()
-    df_vent = load_ventduration_table()
-    df_sofa = load_sofa_table()
-    df_elix = load_elixhauser_table()
+def merge_main_tables(tables):
+    df = tables["ADMISSIONS"].merge(tables["PATIENTS"],
+                                    on="SUBJECT_ID")\
+                             .merge(tables["ICUSTAYS"],
+                                    on=["SUBJECT_ID", "HADM_ID"])
     
-    df = df_main.merge(df_vent, how="left")\
-                .merge(df_sofa, how="left")\
-                .merge(df_elix, how="left")
+    return df
+
+
+def merge_tables(tables):
+    df = merge_main_tables(tables)\
+         .merge(tables["ventdurations"], how="left")\
+         .merge(tables["sofa"], how="left")\
+         .merge(tables["elixhauser"], how="left")
     
     return df
+
+
+def load_main_tables(use_cache=True):
+    tables = load_tables(["ADMISSIONS", "ICUSTAYS", "PATIENTS"], use_cache)
+    
+    return merge_main_tables(tables)
+
+
+def load_data(use_cache=True, tables=None):
+    """Merged MIMIC data; pass already loaded `tables` to avoid reloading."""
+    if tables is None:
+        tables = load_tables(use_cache=use_cache)
+    
+    return merge_tables(tables)
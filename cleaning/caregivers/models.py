@@ -3,6 +3,8 @@ import pandas as pd
 import patsy
 import statsmodels.api as sm
 
+from concurrent.futures import ProcessPoolExecutor
+
 from cleaning.caregivers import (
     main
 )
@@ -27,6 +29,8 @@ COLS_TO_USE = [
     "MORTALITY_6MO_FROM_ICU_OUT"
 ]
 
+RESULTS_INDEX = ["outcome", "exposure", "variable"]
+
 
 def encode_binary_cols(df):
     df = df.copy()
@@ -48,14 +52,19 @@ def encode_binary_cols(df):
     return df
 
 
-def load_data():
-    df = main.load_data()
+def model_data(df):
+    """The columns of the admission level data (main.load_data) the models
+    use, with binary columns as 0/1."""
     df = df[COLS_TO_USE].copy()
     df = encode_binary_cols(df)
     
     return df
 
 
+def load_data():
+    return model_data(main.load_data())
+
+
 def format_logit_results(model):
     odds_ratios = np.exp(model.params)
     ci = np.exp(model.conf_int())
@@ -91,8 +100,114 @@ def format_logit_results(model):
     return results
 
 
+def drop_unused_categories(df):
+    """patsy makes a level of every category of a categorical column, even
+    of categories no row has any more (e.g. ANNOTATION NEITHER, after
+    filtering it out), which would make the model singular."""
+    cols = df.select_dtypes("category").columns
+    
+    return df.assign(**{col: df[col].cat.remove_unused_categories()
+                        for col in cols})
+
+
 def run_logit(formula, df, *args, **kwargs):
+    df = drop_unused_categories(df)
     y, X = patsy.dmatrices(formula, df, return_type="dataframe")
     model = sm.Logit(y, X).fit(*args, **kwargs)
 
     return model
+
+
+def control_matrix(df, control=None):
+    """The design matrix of the control covariates (a right hand side
+    formula, e.g. FORMULA_CONTROL of notebooks.models.ref), indexed like
+    df and without the rows patsy drops for missing values. Without
+    controls, only the intercept."""
+    if not control:
+        return pd.DataFrame({"Intercept": 1.0}, index=df.index)
+    
+    return patsy.dmatrix(control, df, return_type="dataframe")
+
+
+def exposure_matrix(df, exposure):
+    """The design matrix of only the exposure terms (e.g.
+    "C(ANNOTATION, Treatment(reference='SPOUSE'))"), to add to a
+    control_matrix. It is built with an intercept, so categorical
+    exposures are coded against their reference level as in the full
+    formula, but without the intercept column itself."""
+    X = patsy.dmatrix(exposure, df, return_type="dataframe")
+    
+    return X.drop(columns="Intercept", errors="ignore")
+
+
+def fit_exposure(df, control, outcome, exposure=None, **kwargs):
+    """Fits outcome ~ control + exposure, with control an already built
+    control_matrix of df. The same model as run_logit, with the
+    parameters in formula order: intercept, controls, then exposures."""
+    X = control
+    
+    if exposure:
+        X = X.join(exposure_matrix(df, exposure), how="inner")
+    
+    y = df.loc[X.index, outcome]
+    complete = y.notna()
+    
+    return sm.Logit(y[complete].astype("float64"), X[complete])\
+             .fit(**kwargs)
+
+
+# the data and control matrix of each worker process, so they are only
+# sent over once
+_DATA = None
+_CONTROL = None
+
+
+def _init_worker(df, control):
+    global _DATA, _CONTROL
+    _DATA = df
+    _CONTROL = control
+
+
+def _fit_spec(args):
+    outcome, exposure, fit_kwargs = args
+    model = fit_exposure(_DATA, _CONTROL, outcome, exposure, **fit_kwargs)
+    
+    return format_logit_results(model)
+
+
+def run_logits(df, specs, control=None, workers=1, **kwargs):
+    """Fits one logistic regression per (outcome, exposure) pair of specs,
+    all adjusted for the same control covariates, and returns their
+    format_logit_results as one frame indexed by RESULTS_INDEX.
+    
+    The control design matrix is built once and shared by every model;
+    only the exposure columns are built per model. With workers > 1, the
+    models are fit in that many worker processes. Any other keyword
+    arguments are passed on to each fit (e.g. disp=False).
+    
+    Usage:
+        run_logits(df,
+                   [(response, "C(ANNOTATION, Treatment(reference='SPOUSE'))")
+                    for response in responses],
+                   control=FORMULA_CONTROL,
+                   workers=4,
+                   disp=False)
+    """
+    df = drop_unused_categories(df)
+    control = control_matrix(df, control)
+    tasks = [(outcome, exposure, kwargs) for outcome, exposure in specs]
+    
+    if workers > 1:
+        with ProcessPoolExecutor(workers,
+                                 initializer=_init_worker,
+                                 initargs=(df, control)) as executor:
+            results = list(executor.map(_fit_spec, tasks))
+    
+    else:
+        _init_worker(df, control)
+        results = [_fit_spec(task) for task in tasks]
+        _init_worker(None, None)
+    
+    keys = [(outcome, exposure or "") for outcome, exposure in specs]
+    
+    return pd.concat(results, keys=keys, names=RESULTS_INDEX)
@@ -1,64 +1,377 @@
+import argparse
+import json
+import logging
+import time
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from cleaning.cache import load_cached
+from cleaning.caregivers import notes
 from cleaning.utils import get_project_root
 
 PROJECT_ROOT = get_project_root()
 
+PATH_OUTPUT = PROJECT_ROOT / "data/output_PM2018_NeuroNER_models"
+
+# results of the first run, over the whole cohort at once
+PATH_CAR = PATH_OUTPUT / "car_model/processed_2020-12-04_16-06-49-54894/brat/"
+PATH_LIM = PATH_OUTPUT / "lim_model/processed_2020-12-04_18-13-43-397123/brat/"
+
+# column -> NeuroNER model, whose results of each shard are below
+# <PATH_OUTPUT>/<model>/shards/<shard>/ (see scripts/run_car.sh)
+MODELS = {
+    "CAR": "car_model",
+    "LIM": "lim_model"
+}
+PATH_ORIGINAL = notes.PATH_ORIGINAL
+PATH_PROCESSED = PROJECT_ROOT / "data/processed"
+
+# files are small, so reading them is dominated by filesystem latency
+WORKERS = 16
+
+ENTITY_COLUMNS = ["ROW_ID", "START", "END", "TYPE", "TEXT"]
+
+# notes are exported in shards of roughly 1 / N_SHARDS of the cohort each
+N_SHARDS = 100
+CHUNKSIZE = 10000
+MANIFEST_FILE = "manifest.json"
+
+
+def result_files(results_path):
+    """The .ann files below a directory (or each of a list of them, in
+    order), as (ROW_ID, path) pairs.
 
-def load_neuroner_results(results_path, column_name):
-    """Takes .ann files in a given directory and loads them
-    as strings into a DataFrame under a given column name.
-    
     Assumes the filenames are integers corresponding to ROW_ID
     in the original data file."""
-    results_files = Path(results_path).rglob("*.ann")
-    
+    if isinstance(results_path, (str, Path)):
+        results_path = [results_path]
+
+    return [(int(path.stem), path)
+            for path_ in results_path if Path(path_).is_dir()
+            for path in Path(path_).rglob("*.ann")]
+
+
+def shard_results_dir(model, shard, output_dir=PATH_OUTPUT):
+    """The NeuroNER output folder (--output_folder) of a model on a shard."""
+    return Path(output_dir) / model / "shards" / shard
+
+
+def shard_results(model, output_dir=PATH_OUTPUT):
+    """Shard -> brat folder of the latest run of a model on each shard.
+
+    NeuroNER writes each run to a new <shard>_<timestamp> folder, so the
+    latest run sorts last."""
     results = {}
-    
-    for result_file in results_files:
-        with open(result_file, "r") as file:
-            contents = file.read()
-            
-        filename = int(result_file.stem)
-        
-        results[filename] = contents
-    
-    df = pd.DataFrame.from_dict(
-        results,
-        orient="index",
-        columns=[column_name]
-    )
-    
-    df = df.rename_axis("ROW_ID")\
-           .reset_index()
 
-    return df
+    for path in sorted((Path(output_dir) / model / "shards").glob("*/*/brat")):
+        results[path.parent.parent.name] = path
+
+    return results
+
+
+def model_results(column, output_dir=PATH_OUTPUT):
+    """The brat folders of every result of a model: those of the first run,
+    then the latest of each shard (which take precedence, see
+    results_frame)."""
+    first_run = {"CAR": PATH_CAR, "LIM": PATH_LIM}[column]
+
+    return [first_run] + list(shard_results(MODELS[column], output_dir).values())
+
+
+def map_files(func, files, workers=WORKERS):
+    with ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(func, files))
+
+
+def read_file(path):
+    with open(path, "r") as file:
+        return file.read()
+
+
+def results_frame(row_ids, values, column_name):
+    df = pd.DataFrame({"ROW_ID": row_ids, column_name: values})
+
+    # a ROW_ID found twice keeps its last file, as a dict would
+    return df.drop_duplicates("ROW_ID", keep="last")\
+             .reset_index(drop=True)
+
+
+def load_neuroner_results(results_path, column_name, workers=WORKERS):
+    """Takes .ann files in a given directory and loads them
+    as strings into a DataFrame under a given column name."""
+    files = result_files(results_path)
+    contents = map_files(read_file, [path for _, path in files], workers)
+
+    return results_frame([row_id for row_id, _ in files], contents, column_name)
+
+
+def load_neuroner_flags(results_path, column_name, workers=WORKERS):
+    """Whether NeuroNER found anything in each note, under a given column
+    name.
+
+    An .ann file is empty exactly when nothing was found, so this only
+    needs the size of each file rather than its contents."""
+    files = result_files(results_path)
+    sizes = map_files(lambda path: path.stat().st_size,
+                      [path for _, path in files],
+                      workers)
+
+    return results_frame([row_id for row_id, _ in files],
+                         [size > 0 for size in sizes],
+                         column_name)
+
+
+def parse_ann(path):
+    """The text-bound annotations ("T" lines) of a brat .ann file, as
+    (ROW_ID, START, END, TYPE, TEXT) tuples.
+
+    Line format: "T1<tab>TYPE START END<tab>TEXT". Discontinuous spans
+    ("TYPE 0 5;8 12") are reduced to their first start and last end."""
+    row_id = int(Path(path).stem)
+    entities = []
+
+    for line in read_file(path).splitlines():
+        if not line.startswith("T"):
+            continue
+
+        _, annotation, text = line.split("\t", 2)
+        entity_type, offsets = annotation.split(" ", 1)
+        offsets = offsets.replace(";", " ").split()
+
+        entities.append((row_id, int(offsets[0]), int(offsets[-1]), entity_type, text))
+
+    return entities
+
+
+def read_entities(results_path, workers=WORKERS):
+    """Every entity NeuroNER found below a directory, one row each."""
+    parsed = map_files(parse_ann,
+                       [path for _, path in result_files(results_path)],
+                       workers)
+
+    df = pd.DataFrame([entity for entities in parsed for entity in entities],
+                      columns=ENTITY_COLUMNS)
+
+    return df.astype({"ROW_ID": "int32", "START": "int32", "END": "int32"})\
+             .sort_values(["ROW_ID", "START", "END"], kind="mergesort")\
+             .reset_index(drop=True)
+
+
+def load_entities(results_path=PATH_CAR, use_cache=True):
+    """read_entities, cached until any file below the directory changes."""
+    # PATH_CAR and PATH_LIM are both named "brat", so key on the model
+    model = Path(results_path).resolve().parent.parent.name
+
+    return load_cached(Path(results_path),
+                       read_entities,
+                       namespace="neuroner/{}".format(model),
+                       use_cache=use_cache)
+
+
+def source_paths(output_dir=PATH_OUTPUT):
+    """The results of the first run and the shard results of each model,
+    as far as they exist."""
+    paths = [PATH_CAR, PATH_LIM] + [Path(output_dir) / model / "shards"
+                                    for model in MODELS.values()]
+
+    return [path for path in paths if path.is_dir()]
+
+
+def load_flags(output_dir=PATH_OUTPUT):
+    """ROW_ID and whether the CAR and LIM models found anything in it, by
+    their latest results (see model_results)."""
+    df_car = load_neuroner_flags(model_results("CAR", output_dir), "CAR")
+    df_lim = load_neuroner_flags(model_results("LIM", output_dir), "LIM")
+
+    return df_car.merge(df_lim, on="ROW_ID")
 
 
 def load_data(keep_string_cols=False):
-    path_car = PROJECT_ROOT / "data/output_PM2018_NeuroNER_models/car_model/processed_2020-12-04_16-06-49-54894/brat/"
-    path_lim = PROJECT_ROOT / "data/output_PM2018_NeuroNER_models/lim_model/processed_2020-12-04_18-13-43-397123/brat/"
-    
-    path_original = PROJECT_ROOT / "data/raw/caregivers_set13Jul2020.csv"
-    
+    """The original data with CAR and LIM columns (and the raw .ann
+    contents in RESULT_STRING_CAR/LIM if keep_string_cols).
+
+    The original data has TEXT_HASH in place of TEXT (see notes.load_notes).
+    The pipeline only needs load_flags, which leaves out the original data."""
+    df_o = notes.load_notes(PATH_ORIGINAL)
+
+    if not keep_string_cols:
+        return df_o.merge(load_flags(), on="ROW_ID")
+
     column_name_str_car = "RESULT_STRING_CAR"
     column_name_str_lim = "RESULT_STRING_LIM"
-    
-    column_name_car = "CAR"
-    column_name_lim = "LIM"
-    
-    df_car = load_neuroner_results(path_car, column_name_str_car)
-    df_lim = load_neuroner_results(path_lim, column_name_str_lim)
-    
-    df_o = pd.read_csv(path_original)
+
+    df_car = load_neuroner_results(model_results("CAR"), column_name_str_car)
+    df_lim = load_neuroner_results(model_results("LIM"), column_name_str_lim)
 
     df = df_o.merge(df_car, on="ROW_ID")\
              .merge(df_lim, on="ROW_ID")
-    
-    df[column_name_car] = df[column_name_str_car].str.len() != 0
-    df[column_name_lim] = df[column_name_str_lim].str.len() != 0
-    
-    if not keep_string_cols:
-        df = df.drop(columns=["RESULT_STRING_CAR", "RESULT_STRING_LIM"])
-    
-    return df
\ No newline at end of file
+
+    df["CAR"] = df[column_name_str_car].str.len() != 0
+    df["LIM"] = df[column_name_str_lim].str.len() != 0
+
+    return df
+
+
+def shard_name(row_id, n_shards=N_SHARDS):
+    return "{:03d}".format(int(row_id) % n_shards)
+
+
+def shard_dir(output_dir, shard):
+    """A dataset folder for NeuroNER (--dataset_text_folder)."""
+    return Path(output_dir) / "shards" / shard
+
+
+def note_path(output_dir, shard, row_id):
+    # NeuroNER requires the last folder be called "deploy"
+    return shard_dir(output_dir, shard) / "deploy" / "{}.txt".format(row_id)
+
+
+def write_note(item):
+    path, text = item
+
+    with open(path, "w") as file:
+        file.write(text)
+
+
+def load_manifest(output_dir):
+    """The manifest of the last export:
+        notes   : ROW_ID -> {shard, hash} of the notes exported.
+        pending : Shard -> time (as time.time()) it last changed, of the
+                  shards NeuroNER has yet to be rerun on.
+    """
+    path = Path(output_dir) / MANIFEST_FILE
+
+    if not path.is_file():
+        return {"notes": {}, "pending": {}}
+
+    with open(path) as file:
+        manifest = json.load(file)
+
+    # manifests written before "pending" only listed the shards changed by
+    # that export
+    if "pending" not in manifest:
+        manifest["pending"] = {shard: path.stat().st_mtime
+                               for shard in manifest.pop("changed", [])}
+
+    return manifest
+
+
+def save_manifest(notes, pending, output_dir):
+    with open(Path(output_dir) / MANIFEST_FILE, "w") as file:
+        json.dump({"notes": notes, "pending": pending}, file, indent=4, sort_keys=True)
+
+
+def rerun_shards(pending, results_dir=PATH_OUTPUT):
+    """The pending shards every model has been rerun on since they last
+    changed, i.e. whose latest run folder is newer than that."""
+    results = [shard_results(model, results_dir) for model in MODELS.values()]
+
+    return {shard for shard, changed_at in pending.items()
+            if all(shard in runs and runs[shard].parent.stat().st_mtime > changed_at
+                   for runs in results)}
+
+
+def export_notes(source=PATH_ORIGINAL, output_dir=PATH_PROCESSED,
+                 n_shards=N_SHARDS, workers=WORKERS, chunksize=CHUNKSIZE,
+                 results_dir=PATH_OUTPUT, store_dir=None):
+    """Writes the TEXT of each note in `source` to
+    <output_dir>/shards/<shard>/deploy/<ROW_ID>.txt for NeuroNER, and
+    returns the names of the shards NeuroNER needs to be rerun on.
+
+    Notes are read from the note store of `source` (see notes.load_store)
+    in chunks and written by a pool of threads. A note is only written if
+    it is new or its TEXT_HASH changed since the last export (as recorded
+    in <output_dir>/manifest.json), and files of notes no longer in
+    `source` are removed. The manifest also keeps the shards that
+    changed, in this or an earlier export, until every model has results
+    of them newer than that (in results_dir, see scripts/run_car.sh), so
+    NeuroNER only needs to be rerun on those.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    exported_at = time.time()
+    old_manifest = load_manifest(output_dir)
+    old_notes = old_manifest["notes"]
+    manifest = {}
+    changed = set()
+
+    # which notes changed is known from the store's hashes alone, so only
+    # the texts to write are read
+    store = notes.load_store(source, store_dir)
+    to_write = []
+
+    for row_id, hash_ in zip(store.index["ROW_ID"], store.index["TEXT_HASH"]):
+        entry = {"shard": shard_name(row_id, n_shards),
+                 "hash": hash_ if pd.notna(hash_) else None}
+        path = note_path(output_dir, entry["shard"], row_id)
+
+        if old_notes.get(str(row_id)) != entry or not path.is_file():
+            to_write.append((row_id, path))
+            changed.add(entry["shard"])
+
+        manifest[str(row_id)] = entry
+
+    for shard in {shard_name(row_id, n_shards) for row_id, _ in to_write}:
+        (shard_dir(output_dir, shard) / "deploy").mkdir(parents=True, exist_ok=True)
+
+    for start in range(0, len(to_write), chunksize):
+        chunk = to_write[start:start + chunksize]
+        texts = notes.read_texts(store, [row_id for row_id, _ in chunk])
+
+        # notes without text are written as empty files
+        map_files(write_note,
+                  [(path, text if pd.notna(text) else "")
+                   for (_, path), text in zip(chunk, texts)],
+                  workers)
+
+    # notes removed from the source, or moved to another shard
+    for row_id, entry in old_notes.items():
+        if manifest.get(row_id, {}).get("shard") != entry["shard"]:
+            path = note_path(output_dir, entry["shard"], row_id)
+
+            if path.is_file():
+                path.unlink()
+
+            changed.add(entry["shard"])
+
+    pending = dict(old_manifest["pending"], **{shard: exported_at for shard in changed})
+
+    for shard in rerun_shards(pending, results_dir):
+        del pending[shard]
+
+    logging.info("Exported {} notes, {} shards changed, {} to rerun NeuroNER on."
+                 .format(len(manifest), len(changed), len(pending)))
+    save_manifest(manifest, pending, output_dir)
+
+    return sorted(pending)
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(
+        description="Export the notes to NeuroNER dataset folders, printing "
+                    "the folders NeuroNER needs to be rerun on.")
+    parser.add_argument("--source", type=Path, default=PATH_ORIGINAL,
+                        help="CSV file of notes (ROW_ID, TEXT)")
+    parser.add_argument("--output-dir", type=Path, default=PATH_PROCESSED,
+                        help="directory to write the shards to")
+    parser.add_argument("--shards", type=int, default=N_SHARDS,
+                        help="number of shards")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="number of threads writing files")
+
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    args = parse_args()
+
+    pending = export_notes(args.source,
+                           args.output_dir,
+                           n_shards=args.shards,
+                           workers=args.workers)
+
+    for shard in pending:
+        print(shard_dir(args.output_dir, shard))
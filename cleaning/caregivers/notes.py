@@ -0,0 +1,139 @@
+"""The cohort's notes (annotations.PATH_ORIGINAL), with their TEXT kept out of
+the pipeline.
+
+The texts are written once to a note store under data/interim/cache/notes/:
+    * texts.<key>.bin     : every TEXT, UTF-8 encoded, back to back, and
+    * index.<key>.parquet : ROW_ID, OFFSET and LENGTH (in bytes) of each
+                            text in that file, and its TEXT_HASH.
+The key is a hash of the source file's fingerprint and of build_store, so
+the store is rebuilt whenever either changes.
+
+load_notes returns every other column of the notes plus TEXT_HASH, which
+stands in for the text wherever the pipeline compares or counts texts (e.g.
+N_TEXTS). The texts themselves are only read, through a memory map of the
+store, by whoever asks for them (see read_texts).
+"""
+import hashlib
+import mmap
+import numpy as np
+import pandas as pd
+
+from collections import namedtuple
+from contextlib import nullcontext
+from pathlib import Path
+
+from cleaning.cache import (
+    CACHE_DIR,
+    function_fingerprint,
+    make_key,
+    source_fingerprint,
+    write_cached,
+    write_parquet
+)
+from cleaning.caregivers import schema
+from cleaning.utils import get_project_root
+
+
+PROJECT_ROOT = get_project_root()
+
+PATH_ORIGINAL = PROJECT_ROOT / "data/raw/caregivers_set13Jul2020.csv"
+STORE_DIR = CACHE_DIR / "notes"
+
+CHUNKSIZE = 10000
+
+# path  : Path of the texts file.
+# index : DataFrame of ROW_ID, OFFSET, LENGTH and TEXT_HASH (missing for
+#         notes without text).
+NoteStore = namedtuple("NoteStore", ["path", "index"])
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def write_texts(source, path, chunksize=CHUNKSIZE):
+    """Writes the TEXT of each note in `source` to `path` and returns the
+    index of the texts in it."""
+    rows = []
+    offset = 0
+
+    chunks = pd.read_csv(source,
+                         usecols=["ROW_ID", "TEXT"],
+                         chunksize=chunksize)
+
+    with open(path, "wb") as file:
+        for chunk in chunks:
+            for row_id, text in zip(chunk["ROW_ID"], chunk["TEXT"]):
+                if pd.isna(text):
+                    rows.append((row_id, offset, 0, None))
+                    continue
+
+                data = text.encode()
+                file.write(data)
+
+                rows.append((row_id, offset, len(data), text_hash(text)))
+                offset += len(data)
+
+    return pd.DataFrame(rows, columns=["ROW_ID", "OFFSET", "LENGTH", "TEXT_HASH"])\
+             .astype({"ROW_ID": "int64", "OFFSET": "int64", "LENGTH": "int64"})
+
+
+def store_paths(source=PATH_ORIGINAL, store_dir=None):
+    key = make_key(source_fingerprint(source),
+                   function_fingerprint(write_texts))
+    store_dir = Path(store_dir or STORE_DIR)
+
+    return (store_dir / "texts.{}.bin".format(key),
+            store_dir / "index.{}.parquet".format(key))
+
+
+def load_store(source=PATH_ORIGINAL, store_dir=None):
+    """The note store of `source`, built first if it is missing or out of
+    date. Only the (small) index is loaded."""
+    path, path_index = store_paths(source, store_dir)
+
+    if path.is_file() and path_index.is_file():
+        return NoteStore(path, pd.read_parquet(path_index))
+
+    indexes = []
+    write_cached(lambda tmp_path: indexes.append(write_texts(source, tmp_path)),
+                 path)
+
+    # written last, so a store with an index is always complete
+    write_parquet(indexes[0], path_index)
+
+    return NoteStore(path, indexes[0])
+
+
+def read_texts(store, row_ids):
+    """The TEXT of each of `row_ids`, as a Series indexed by ROW_ID."""
+    index = store.index.set_index("ROW_ID").loc[list(row_ids)]
+    texts = []
+
+    # an empty file can't be memory mapped, but then every text is missing
+    empty = Path(store.path).stat().st_size == 0
+
+    with open(store.path, "rb") as file,\
+            nullcontext(b"") if empty else\
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for offset, length, hash_ in zip(index["OFFSET"],
+                                         index["LENGTH"],
+                                         index["TEXT_HASH"]):
+            texts.append(data[offset:offset + length].decode()
+                         if pd.notna(hash_) else np.nan)
+
+    return pd.Series(texts, index=index.index, name="TEXT", dtype=object)
+
+
+def read_text(store, row_id):
+    return read_texts(store, [row_id]).iloc[0]
+
+
+def load_notes(source=PATH_ORIGINAL, store_dir=None):
+    """The notes, with TEXT_HASH in place of TEXT."""
+    store = load_store(source, store_dir)
+    df = pd.read_csv(source, usecols=lambda col: col != "TEXT")
+
+    df = df.merge(store.index[["ROW_ID", "TEXT_HASH"]], how="left", on="ROW_ID")
+
+    return schema.parse_datetimes(df, schema.NOTES)
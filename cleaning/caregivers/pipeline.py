@@ -0,0 +1,302 @@
+"""A small runner for the stages of main.process_all.
+
+A stage is a function of the results of the stages it depends on (its
+inputs), plus any keyword parameters. Its key is a hash of
+    * its function's code (and that of the helpers it calls),
+    * the fingerprints of the source files it reads,
+    * its parameters, and
+    * the keys of its inputs,
+and its result is pickled under data/interim/cache/stages/ with that key.
+Pickles (rather than Parquet) round-trip every intermediate frame exactly,
+including object columns mixing strings, booleans and NaN.
+
+Running a stage with a cached result just loads it, without running (or even
+loading) anything upstream. Editing a stage reruns it and every stage after
+it, starting from the cached result of the stage before it.
+
+Pass a list as `trace` to run to profile it: a record of each stage run or
+loaded (see stage_record) is appended to it, which summarize turns into a
+table and write_trace into a JSON file.
+"""
+import json
+import logging
+import sys
+import time
+import pandas as pd
+
+from collections import Counter, namedtuple
+from pathlib import Path
+
+from cleaning.cache import (
+    CACHE_DIR,
+    function_fingerprint,
+    make_key,
+    source_fingerprint,
+    write_cached
+)
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, where peak RSS isn't recorded
+    resource = None
+
+
+STAGE_DIR = CACHE_DIR / "stages"
+
+# Linux only: memory use of this process, and the file resetting its peak
+PROC_STATUS = Path("/proc/self/status")
+PROC_CLEAR_REFS = Path("/proc/self/clear_refs")
+
+# sources : paths (or a function returning them) the stage reads directly
+Stage = namedtuple("Stage", ["func", "inputs", "sources", "params"],
+                   defaults=[(), (), None])
+
+
+def stage_keys(stages, target):
+    """Keys of `target` and every stage upstream of it."""
+    keys = {}
+
+    def key(name):
+        if name not in keys:
+            stage = stages[name]
+            sources = stage.sources() if callable(stage.sources) else stage.sources
+
+            keys[name] = make_key(name,
+                                  function_fingerprint(stage.func),
+                                  [source_fingerprint(source) for source in sources],
+                                  stage.params,
+                                  [key(dep) for dep in stage.inputs])
+
+        return keys[name]
+
+    key(target)
+
+    return keys
+
+
+def proc_status(field):
+    """A memory field (e.g. VmRSS, VmHWM) of /proc/self/status in bytes, or
+    None where there is none (anything but Linux)."""
+    try:
+        with open(PROC_STATUS) as file:
+            for line in file:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+
+    except OSError:
+        pass
+
+    return None
+
+
+def reset_peak_rss():
+    """Resets the peak RSS of this process to its current RSS and returns
+    that, in bytes, or None where the peak can't be reset."""
+    try:
+        with open(PROC_CLEAR_REFS, "w") as file:
+            file.write("5")
+
+    except OSError:
+        return None
+
+    return proc_status("VmRSS")
+
+
+def peak_rss():
+    """Peak resident set size of this process since the last
+    reset_peak_rss (or ever, where it can't be reset), in bytes (or None)."""
+    peak = proc_status("VmHWM")
+
+    if peak is not None or resource is None:
+        return peak
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def start_rss():
+    """The RSS a stage starts from, with the peak reset to it, so that the
+    stage's own peak can be measured. Where the peak can't be reset, the
+    peak so far, so that only a stage raising it shows."""
+    rss = reset_peak_rss()
+
+    return rss if rss is not None else peak_rss()
+
+
+def frame_stats(result):
+    """Rows and (deep) memory in bytes of a DataFrame or Series; None for
+    anything else. A dict of them (e.g. the MIMIC tables) has their total
+    memory, but no rows, as those of different tables don't add up."""
+    if isinstance(result, dict):
+        stats = [frame_stats(value) for value in result.values()]
+
+        if stats and all(stat is not None for stat in stats):
+            return None, sum(memory for _, memory in stats)
+
+        return None
+
+    if isinstance(result, pd.DataFrame):
+        return len(result), int(result.memory_usage(deep=True).sum())
+
+    if isinstance(result, pd.Series):
+        return len(result), int(result.memory_usage(deep=True))
+
+    return None
+
+
+def stage_record(name, cached, seconds, rss_before, rss_after, input_rows,
+                 result):
+    """What profiling records of one stage:
+        stage          : Its name.
+        cached         : Whether it was loaded from the cache rather than run.
+        seconds        : Wall time of running (or loading) it, not counting
+                         its inputs.
+        peak_rss_delta : How far the RSS peaked above where it started, in
+                         bytes. Where the peak can't be reset per stage
+                         (anything but Linux), how much it raised the peak
+                         of the process (0 if it stayed below an earlier
+                         one).
+        input_rows     : Rows of each of its inputs (none if loaded).
+        output_rows    : Rows of its result.
+        output_memory  : Memory of its result, in bytes.
+    """
+    output = frame_stats(result)
+
+    return {
+        "stage": name,
+        "cached": cached,
+        "seconds": seconds,
+        "peak_rss_delta": rss_after - rss_before
+                          if rss_before is not None else None,
+        "input_rows": input_rows,
+        "output_rows": output[0] if output is not None else None,
+        "output_memory": output[1] if output is not None else None
+    }
+
+
+def summarize(trace):
+    """The records of a trace as a table, one row per stage. INPUT_ROWS are
+    those of its largest input, and ROW_RATIO its output rows over those,
+    so a stage multiplying rows (e.g. a merge on a non-unique key) stands
+    out as above 1."""
+    df = pd.DataFrame(trace, columns=["stage",
+                                      "cached",
+                                      "seconds",
+                                      "peak_rss_delta",
+                                      "input_rows",
+                                      "output_rows",
+                                      "output_memory"])
+
+    # missing values (e.g. rows of a result that isn't a frame) become NaN
+    max_input_rows = df["input_rows"].map(
+        lambda rows: max([row for row in rows if row is not None] or [None]))\
+        .astype(float)
+    output_rows = df["output_rows"].astype(float)
+
+    return pd.DataFrame({
+        "CACHED": df["cached"],
+        "SECONDS": df["seconds"].round(3),
+        "PEAK_RSS_DELTA_MB": df["peak_rss_delta"].astype(float) / 2 ** 20,
+        "INPUT_ROWS": max_input_rows,
+        "OUTPUT_ROWS": output_rows,
+        "ROW_RATIO": output_rows / max_input_rows,
+        "OUTPUT_MEMORY_MB": df["output_memory"].astype(float) / 2 ** 20
+    }).set_index(df["stage"].rename("STAGE"))
+
+
+def write_trace(trace, path):
+    with open(path, "w") as file:
+        json.dump(trace, file, indent=4)
+
+
+def stage_path(name, key, cache_dir=None):
+    return Path(cache_dir or STAGE_DIR) / "{}.{}.pkl".format(name, key)
+
+
+def run(stages, target, use_cache=True, cache_dir=None, trace=None):
+    """Returns the result of stage `target`, running only the stages
+    (upstream of it) without a cached result.
+
+    stages : Dict of stage name -> Stage.
+    trace  : Optionally, a list to append a stage_record of each stage run
+             or loaded to, in order.
+    """
+    keys = stage_keys(stages, target)
+    results = {}
+
+    # how often each result is still needed, so it can be dropped after;
+    # only stages that will run fetch their inputs, cached ones don't
+    consumers = Counter()
+    planned = set()
+
+    def plan(name):
+        if name in planned:
+            return
+
+        planned.add(name)
+
+        if use_cache and stage_path(name, keys[name], cache_dir).is_file():
+            return
+
+        for dep in stages[name].inputs:
+            consumers[dep] += 1
+            plan(dep)
+
+    plan(target)
+
+    def get(name):
+        if name in results:
+            result = results[name]
+
+        else:
+            path = stage_path(name, keys[name], cache_dir)
+            cached = use_cache and path.is_file()
+            input_rows = []
+
+            if cached:
+                logging.info("Loading stage {} from {}...".format(name, path))
+                start = time.perf_counter()
+                rss_before = start_rss() if trace is not None else None
+                result = pd.read_pickle(path)
+
+            else:
+                stage = stages[name]
+
+                logging.info("Running stage {}...".format(name))
+                inputs = [get(dep) for dep in stage.inputs]
+
+                # counted before the stage runs, as it may modify its inputs
+                if trace is not None:
+                    input_rows = [stats[0] if stats is not None else None
+                                  for stats in map(frame_stats, inputs)]
+
+                start = time.perf_counter()
+                rss_before = start_rss() if trace is not None else None
+                result = stage.func(*inputs, **(stage.params or {}))
+
+            if trace is not None:
+                trace.append(stage_record(name,
+                                          cached,
+                                          time.perf_counter() - start,
+                                          rss_before,
+                                          peak_rss(),
+                                          input_rows,
+                                          result))
+
+            if use_cache and not cached:
+                write_cached(lambda tmp_path: pd.to_pickle(result, tmp_path),
+                             path)
+
+            results[name] = result
+
+        consumers[name] -= 1
+
+        if consumers[name] <= 0:
+            del results[name]
+
+        return result
+
+    return get(target)
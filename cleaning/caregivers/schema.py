@@ -0,0 +1,194 @@
+"""Declared column types for the MIMIC-III tables used by the pipeline.
+
+Only the columns listed here are read from each table (projection happens in
+the CSV reader itself), and each is converted to its declared type at read
+time:
+    * "int8"/"int32" : non-null integer columns (IDs, flags)
+    * "float64"      : numeric columns that may contain nulls
+    * "category"     : low-cardinality string columns
+    * "datetime"     : MIMIC timestamps ("YYYY-MM-DD HH:MM:SS")
+    * "date"         : MIMIC dates ("YYYY-MM-DD")
+
+Column names are upper case; derived tables with lower case headers are
+matched case-insensitively.
+
+Datetimes are parsed with their exact format (DATETIME_FORMATS) when a table
+is read, never by guessing which columns hold dates: by pyarrow in read_csv,
+or by utils.parse_datetime (see parse_datetimes) for the few tables read
+with pandas (NOTES, NOTEEVENTS). This is the one place their columns and
+formats are declared.
+"""
+import csv
+import gzip
+
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+
+from cleaning.utils import (
+    MIMIC_DATE_FORMAT,
+    MIMIC_DATETIME_FORMAT,
+    parse_datetime
+)
+
+
+ADMISSIONS = {
+    "SUBJECT_ID": "int32",
+    "HADM_ID": "int32",
+    "ADMITTIME": "datetime",
+    "DISCHTIME": "datetime",
+    "DISCHARGE_LOCATION": "category",
+    "LANGUAGE": "category",
+    "MARITAL_STATUS": "category",
+    "ETHNICITY": "category",
+    "HOSPITAL_EXPIRE_FLAG": "int8"
+}
+
+ICUSTAYS = {
+    "SUBJECT_ID": "int32",
+    "HADM_ID": "int32",
+    "ICUSTAY_ID": "int32",
+    "INTIME": "datetime",
+    "OUTTIME": "datetime"
+}
+
+PATIENTS = {
+    "SUBJECT_ID": "int32",
+    "GENDER": "category",
+    "DOB": "datetime",
+    "DOD": "datetime"
+}
+
+# ICUSTAY_ID has nulls here; mimic.read_ventduration_table drops them
+VENTDURATIONS = {
+    "ICUSTAY_ID": "float64",
+    "VENTNUM": "int32",
+    "STARTTIME": "datetime",
+    "ENDTIME": "datetime",
+    "DURATION_HOURS": "float64"
+}
+
+SOFA = {
+    "SUBJECT_ID": "int32",
+    "HADM_ID": "int32",
+    "ICUSTAY_ID": "int32",
+    "SOFA": "int32"
+}
+
+ELIXHAUSER = {
+    "SUBJECT_ID": "int32",
+    "HADM_ID": "int32",
+    "CONGESTIVE_HEART_FAILURE": "int8",
+    "CARDIAC_ARRHYTHMIAS": "int8",
+    "VALVULAR_DISEASE": "int8",
+    "PULMONARY_CIRCULATION": "int8",
+    "PERIPHERAL_VASCULAR": "int8",
+    "HYPERTENSION": "int8",
+    "PARALYSIS": "int8",
+    "OTHER_NEUROLOGICAL": "int8",
+    "CHRONIC_PULMONARY": "int8",
+    "DIABETES_UNCOMPLICATED": "int8",
+    "DIABETES_COMPLICATED": "int8",
+    "HYPOTHYROIDISM": "int8",
+    "RENAL_FAILURE": "int8",
+    "LIVER_DISEASE": "int8",
+    "PEPTIC_ULCER": "int8",
+    "AIDS": "int8",
+    "LYMPHOMA": "int8",
+    "METASTATIC_CANCER": "int8",
+    "SOLID_TUMOR": "int8",
+    "RHEUMATOID_ARTHRITIS": "int8",
+    "COAGULOPATHY": "int8",
+    "OBESITY": "int8",
+    "WEIGHT_LOSS": "int8",
+    "FLUID_ELECTROLYTE": "int8",
+    "BLOOD_LOSS_ANEMIA": "int8",
+    "DEFICIENCY_ANEMIAS": "int8",
+    "ALCOHOL_ABUSE": "int8",
+    "DRUG_ABUSE": "int8",
+    "PSYCHOSES": "int8",
+    "DEPRESSION": "int8"
+}
+
+# the cohort's notes (annotations.PATH_ORIGINAL), which are read with pandas
+# (their TEXT spans lines); only the columns to convert are declared
+NOTES = {
+    "CHARTDATE": "date"
+}
+
+# NOTEEVENTS (see noteevents.scan_notes), which is also read with pandas
+NOTEEVENTS = {
+    "CHARTDATE": "date",
+    "CHARTTIME": "datetime",
+    "STORETIME": "datetime"
+}
+
+TABLES = {
+    "ADMISSIONS": ADMISSIONS,
+    "ICUSTAYS": ICUSTAYS,
+    "PATIENTS": PATIENTS,
+    "ventdurations": VENTDURATIONS,
+    "sofa": SOFA,
+    "elixhauser": ELIXHAUSER
+}
+
+ARROW_TYPES = {
+    "int8": pa.int8(),
+    "int32": pa.int32(),
+    "float64": pa.float64(),
+    "category": pa.string(),
+    "datetime": pa.timestamp("ns"),
+    "date": pa.timestamp("ns")
+}
+
+DATETIME_FORMATS = {
+    "datetime": MIMIC_DATETIME_FORMAT,
+    "date": MIMIC_DATE_FORMAT
+}
+
+
+def read_header(path):
+    """Column names of a (possibly gzipped) CSV file."""
+    opener = gzip.open if str(path).endswith(".gz") else open
+
+    with opener(path, "rt", newline="") as file:
+        return next(csv.reader(file))
+
+
+def read_csv(path, schema):
+    """Reads only the columns of `path` declared in `schema`, converting each
+    to its declared type with pyarrow's multithreaded CSV reader."""
+    columns = [col for col in read_header(path) if col.upper() in schema]
+    dtypes = {col: schema[col.upper()] for col in columns}
+
+    # pyarrow takes the formats of all timestamp columns at once, so each
+    # must have one of those declared in the table
+    formats = sorted({DATETIME_FORMATS[dtype] for dtype in dtypes.values()
+                      if dtype in DATETIME_FORMATS})
+
+    table = pa_csv.read_csv(
+        path,
+        read_options=pa_csv.ReadOptions(use_threads=True),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=columns,
+            # match pandas, which reads empty strings as NaN
+            strings_can_be_null=True,
+            column_types={col: ARROW_TYPES[dtype] for col, dtype in dtypes.items()},
+            timestamp_parsers=formats
+        )
+    )
+
+    df = table.to_pandas()
+
+    for col, dtype in dtypes.items():
+        if dtype == "category":
+            df[col] = df[col].astype("category")
+
+    return df
+
+
+def parse_datetimes(df, schema):
+    """Parses the datetime (and date) columns declared in `schema` of a
+    table already read with pandas, each with its exact format."""
+    return df.assign(**{col: parse_datetime(df[col], DATETIME_FORMATS[dtype])
+                        for col, dtype in schema.items()
+                        if dtype in DATETIME_FORMATS and col in df.columns})
@@ -2,38 +2,98 @@ import json
 import pandas as pd
 
 
+# annotation values are small codes (e.g. 0, 1, 9), or missing if a label
+# was never annotated
+ANNOTATION_DTYPE = "Int8"
+
+
+def parse_annotation_values(values):
+    """Parse ClinicalRegex's 'annotationValues' 'JSON' strings (once each)
+    into one column per label (e.g. L1_annotation), with the same index."""
+    records = [json.loads(value) if isinstance(value, str) else {}
+               for value in values]
+
+    df = pd.DataFrame.from_records(records, index=values.index)
+
+    return df.astype(ANNOTATION_DTYPE)
+
+
 def reshape_cr_json(df):
     """Convert ClinicalRegex's 'annotationValues' from a 'JSON' string
     (into appropriate columns)."""
-    df = pd.json_normalize(df['annotationValues'].map(json.loads))
+    df = parse_annotation_values(df['annotationValues'])
 
-    return df
+    return df.reset_index(drop=True)
 
 
 def join_id_with_annotations(df):
     df = pd.concat([
         df[["id"]],
-        reshape_cr_json(df)
+        parse_annotation_values(df["annotationValues"])
     ], axis="columns")
-    
-    return df
+
+    return df.reset_index(drop=True)
 
 
 def get_full_cr_data(df):
-    df = pd.concat([
-        df,
-        reshape_cr_json(df)
-    ], axis="columns")
-    
-    df.drop(columns=["annotationValues"])
-    
+    df = df.drop(columns=["annotationValues"])\
+           .join(parse_annotation_values(df["annotationValues"]))
+
     return df
 
 
+def annotation_values_per_id(df, id_col="id"):
+    """Number of distinct values of each label for each id, of already
+    parsed annotations."""
+    return df.groupby(id_col).nunique()
+
+
 def has_only_one_annotation_value_per_id(df):
+    """Whether each label has exactly one value per id, of a raw
+    ClinicalRegex DataFrame."""
     df = join_id_with_annotations(df)
-    df = df.groupby("id", as_index=False)\
-           .agg("nunique")
-    df = df.drop("id", axis=1)
-    
-    return (df == 1).all()
+
+    return (annotation_values_per_id(df) == 1).all()
+
+
+def check_one_annotation_value_per_id(df, id_col="id"):
+    """Raises ValueError unless each label has exactly one value per id
+    (see has_only_one_annotation_value_per_id), of already parsed
+    annotations: an id with conflicting values for a label, or with a
+    label that was never annotated, is rejected."""
+    invalid = (annotation_values_per_id(df, id_col) != 1).any(axis="columns")
+
+    if invalid.any():
+        raise ValueError("Missing or conflicting annotation values for {} {}s, "
+                         "e.g. {}".format(invalid.sum(),
+                                          id_col,
+                                          invalid[invalid].index[:5].tolist()))
+
+
+def read_cr_data(path, columns=("id",), chunksize=None, validate=True):
+    """Reads a ClinicalRegex export, parsing 'annotationValues' into typed
+    columns (one per label) and dropping it along with every column not
+    in `columns`. The long 'text' column, in particular, is only kept if
+    asked for.
+
+    chunksize : Read (and parse) the file this many rows at a time, so the
+                raw columns of only one chunk are in memory at once.
+    validate  : Check that each id has exactly one value per label (see
+                check_one_annotation_value_per_id).
+    """
+    usecols = list(dict.fromkeys(list(columns) + ["annotationValues"]))
+
+    reader = pd.read_csv(path, usecols=usecols, chunksize=chunksize)
+    chunks = reader if chunksize else [reader]
+
+    df = pd.concat([get_full_cr_data(chunk[usecols]) for chunk in chunks],
+                   ignore_index=True)
+
+    # a label missing from some chunk would otherwise make it an object column
+    df = df.astype({col: ANNOTATION_DTYPE for col in df.columns
+                    if col not in usecols})
+
+    if validate:
+        check_one_annotation_value_per_id(df)
+
+    return df
@@ -0,0 +1,167 @@
+"""Keyword-in-context (concordance) tables: every match of a pattern in a set
+of notes, with the N tokens before and after it.
+
+The matches of a note are found in one pass, with a regex compiled once (or a
+dictionary_matcher automaton). Its context windows are then sliced from the
+text using the start/end offsets of its whitespace-separated tokens, rather
+than matched as part of the pattern. So, unlike the "(?:\\S+\\s+){0,N}"
+context groups of regex_match_with_window (in the keyword exclusion
+notebook), matches close to each other each get their own context, and there
+is no backtracking over the context.
+
+Results are built per batch of notes as columns (SPAN_COLUMNS) and can be
+written to a Parquet file batch by batch, so the full cohort fits in memory:
+    - ROW_ID: The note.
+    - START, END: The offsets of the match in the (preprocessed) text.
+    - MATCH: The matched text.
+    - CONTEXT_BEFORE, CONTEXT_AFTER: Up to window_size tokens before/after
+                                     the match, joined by single spaces.
+"""
+
+
+import re
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from cleaning.dictionary_matcher import Automaton, find_matches
+
+
+SPAN_COLUMNS = ['ROW_ID',
+                'START',
+                'END',
+                'MATCH',
+                'CONTEXT_BEFORE',
+                'CONTEXT_AFTER']
+
+ARROW_SCHEMA = pa.schema([('ROW_ID', pa.int64()),
+                          ('START', pa.int64()),
+                          ('END', pa.int64()),
+                          ('MATCH', pa.string()),
+                          ('CONTEXT_BEFORE', pa.string()),
+                          ('CONTEXT_AFTER', pa.string())])
+
+TOKEN_REGEX = re.compile(r'\S+')
+
+
+def token_bounds(text):
+    '''Start and end offsets of the whitespace-separated tokens of text, as
+       two sorted arrays.'''
+    bounds = np.array([match.span() for match in TOKEN_REGEX.finditer(text)],
+                      dtype=np.int64).reshape(-1, 2)
+
+    return bounds[:, 0], bounds[:, 1]
+
+
+def compile_pattern(pattern):
+    '''A function returning the (start, end) of each match in a text.
+
+       pattern : A regex (string or compiled), or an Automaton of
+                 dictionary_matcher.
+    '''
+    if isinstance(pattern, Automaton):
+        return lambda text: [match[:2] for match in find_matches(pattern, text)]
+
+    regex = re.compile(pattern)
+
+    return lambda text: [match.span() for match in regex.finditer(text)]
+
+
+def contexts(text, spans, window_size):
+    '''The (before, after) context of each (start, end) span in text.
+
+       The context before a match is made of the tokens ending at or before
+       its start, the context after of those starting at or after its end,
+       so a match inside a token does not include the rest of that token.
+    '''
+    if len(spans) == 0:
+        return []
+
+    starts, ends = token_bounds(text)
+    spans = np.asarray(spans)
+
+    # index of the first token after the context before (so the context is
+    # tokens [first_before, last_before)), and likewise after
+    last_before = np.searchsorted(ends, spans[:, 0], side='right')
+    first_before = np.maximum(last_before - window_size, 0)
+    first_after = np.searchsorted(starts, spans[:, 1], side='left')
+    last_after = np.minimum(first_after + window_size, len(starts))
+
+    def window(first, last):
+        return ' '.join(text[start:end] for start, end in
+                        zip(starts[first:last], ends[first:last]))
+
+    return [(window(*before), window(*after))
+            for before, after in zip(zip(first_before, last_before),
+                                     zip(first_after, last_after))]
+
+
+def concordance_batch(ids, texts, find, window_size, preprocess=None):
+    '''The concordance (SPAN_COLUMNS) of one batch of notes.
+
+       find : A function of compile_pattern.
+    '''
+    columns = {column: [] for column in SPAN_COLUMNS}
+
+    for id_, text in zip(ids, texts):
+        if not isinstance(text, str):
+            continue
+
+        if preprocess is not None:
+            text = preprocess(text)
+
+        spans = find(text)
+
+        for (start, end), (before, after) in zip(spans,
+                                                 contexts(text, spans,
+                                                          window_size)):
+            columns['ROW_ID'].append(id_)
+            columns['START'].append(start)
+            columns['END'].append(end)
+            columns['MATCH'].append(text[start:end])
+            columns['CONTEXT_BEFORE'].append(before)
+            columns['CONTEXT_AFTER'].append(after)
+
+    return pd.DataFrame(columns, columns=SPAN_COLUMNS)\
+             .astype({'START': 'int64', 'END': 'int64'})
+
+
+def scan_concordance(batches, pattern, window_size, preprocess=None):
+    '''Yields the concordance of each batch, an iterable of DataFrames with
+       ROW_ID and TEXT columns (e.g. noteevents.scan_notes).
+
+       preprocess : Function applied to each text first (e.g.
+                    text_preprocessing.preprocess_text); offsets then refer
+                    to the preprocessed text.
+    '''
+    find = compile_pattern(pattern)
+
+    for batch in batches:
+        yield concordance_batch(batch['ROW_ID'],
+                                batch['TEXT'],
+                                find,
+                                window_size,
+                                preprocess)
+
+
+def concordance(df, pattern, window_size, preprocess=None):
+    '''The concordance of the notes (ROW_ID, TEXT) of df.'''
+    return next(scan_concordance([df], pattern, window_size, preprocess))
+
+
+def write_concordance(path, batches, pattern, window_size, preprocess=None):
+    '''Writes the concordance of batches (see scan_concordance) to a Parquet
+       file, one row group per batch, and returns the number of matches.'''
+    n_matches = 0
+
+    with pq.ParquetWriter(str(path), ARROW_SCHEMA) as writer:
+        for df in scan_concordance(batches, pattern, window_size, preprocess):
+            if len(df) > 0:
+                writer.write_table(pa.Table.from_pandas(df,
+                                                        schema=ARROW_SCHEMA,
+                                                        preserve_index=False))
+
+            n_matches += len(df)
+
+    return n_matches
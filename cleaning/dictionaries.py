@@ -0,0 +1,47 @@
+"""Loading of the family member keyword dictionaries in dictionaries/.
+
+Two formats are in use:
+    - one term per line (e.g. child_phrase_dictionary.txt)
+    - comma-separated terms on a single line (e.g. child_dict_25Jun2020.txt)
+
+Both (and mixtures of the two) are handled by load_dictionary.
+"""
+
+
+from cleaning.utils import get_project_root
+
+
+PROJECT_ROOT = get_project_root()
+DICTIONARY_DIR = PROJECT_ROOT / 'dictionaries'
+
+
+def normalize_term(term):
+    '''Lower case, with curly apostrophes straightened and whitespace
+       squished.'''
+    return ' '.join(term.replace('’', "'").lower().split())
+
+
+def load_dictionary(path):
+    '''Returns the unique, normalized terms of a dictionary file, in the
+       order they first appear.'''
+    with open(path, encoding='utf-8') as file:
+        contents = file.read()
+
+    terms = (normalize_term(term)
+             for line in contents.splitlines()
+             for term in line.split(','))
+
+    return list(dict.fromkeys(term for term in terms if term))
+
+
+def minimal_substring_set(terms):
+    '''Drops every term that contains another term, e.g. "children" is
+       dropped if "child" is present. Any text containing one of the
+       original terms contains one of the remaining ones.'''
+    kept = []
+
+    for term in sorted(set(terms), key=len):
+        if not any(shorter in term for shorter in kept):
+            kept.append(term)
+
+    return kept
@@ -0,0 +1,214 @@
+"""Whole-word matching of the keyword dictionaries against note texts.
+
+All terms of all dictionaries are compiled into one Aho-Corasick automaton
+(a trie of the terms with failure links), which finds every occurrence of
+every term in a single left-to-right pass over a text, in time linear in the
+length of the text (plus the number of hits) no matter how many terms there
+are. Unlike an alternation regex (e.g. SPOUSE_REGEX in the keyword exclusion
+notebook) there is no backtracking.
+
+Texts are matched case-insensitively, with curly apostrophes straightened
+and line breaks/tabs read as spaces, as dictionary terms are (see
+dictionaries.normalize_term). A hit only counts if it is a whole word, i.e.
+not preceded or followed by a letter or digit.
+
+Usage:
+    automaton = build_automaton({'CHILD': DICTIONARY_DIR / 'child_dict_25Jun2020.txt',
+                                 'SPOUSE': DICTIONARY_DIR / 'spouse_dict_25Jun2020.txt'})
+    df = match_noteevents(automaton, workers=8, categories=['Nursing/other'])
+"""
+
+
+import pandas as pd
+
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from cleaning.dictionaries import load_dictionary, normalize_term
+from cleaning.noteevents import scan_notes
+
+
+SPAN_COLUMNS = ['ROW_ID', 'START', 'END', 'TERM', 'CATEGORY']
+
+# length-preserving, so offsets into the prepared text are offsets into the
+# original one
+TRANSLATION = str.maketrans({'’': "'",
+                             '\n': ' ',
+                             '\r': ' ',
+                             '\t': ' ',
+                             '\x0b': ' ',
+                             '\x0c': ' '})
+
+# goto    : One dict per state, of character -> next state.
+# fail    : The state to fall back to when a character has no transition.
+# outputs : (term, category) pairs ending at each state.
+Automaton = namedtuple('Automaton', ['goto', 'fail', 'outputs'])
+
+
+def build_automaton(dictionaries):
+    '''Compiles dictionaries, a dict of category -> dictionary file (in any
+       format load_dictionary reads) or list of terms.'''
+    goto = [{}]
+    outputs = [[]]
+
+    for category, terms in dictionaries.items():
+        if not isinstance(terms, (list, tuple, set)):
+            terms = load_dictionary(terms)
+
+        for term in dict.fromkeys(normalize_term(term) for term in terms):
+            state = 0
+
+            for char in term:
+                if char not in goto[state]:
+                    goto[state][char] = len(goto)
+                    goto.append({})
+                    outputs.append([])
+
+                state = goto[state][char]
+
+            outputs[state].append((term, category))
+
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+
+    # breadth first, so the failure state of each state is done before it
+    while queue:
+        state = queue.popleft()
+
+        for char, child in goto[state].items():
+            queue.append(child)
+
+            fallback = fail[state]
+
+            while fallback and char not in goto[fallback]:
+                fallback = fail[fallback]
+
+            fail[child] = goto[fallback].get(char, 0)
+            outputs[child] = outputs[child] + outputs[fail[child]]
+
+    return Automaton(goto, fail, outputs)
+
+
+def prepare_text(text):
+    prepared = text.translate(TRANSLATION).lower()
+
+    # a few characters (e.g. "İ") lower case to more than one character
+    if len(prepared) != len(text):
+        prepared = ''.join(char.lower()[0] for char in text.translate(TRANSLATION))
+
+    return prepared
+
+
+def longest_matches(matches):
+    '''The leftmost-longest non-overlapping matches, as an alternation
+       regex with longer alternatives first would find them.'''
+    kept = []
+    last_end = 0
+
+    for match in sorted(matches, key=lambda match: (match[0], -match[1])):
+        if kept and match[:2] == kept[-1][:2]:
+            kept.append(match)   # the same term in another category
+
+        elif match[0] >= last_end:
+            kept.append(match)
+            last_end = match[1]
+
+    return kept
+
+
+def find_matches(automaton, text, overlapping=False):
+    '''Returns the (start, end, term, category) of the whole-word matches in
+       text, sorted by start.
+
+       overlapping : If True, return every match (e.g. both "ex" and
+                     "ex-wife" in "ex-wife"), otherwise only the longest
+                     of overlapping matches.
+    '''
+    goto, fail, outputs = automaton
+    text = prepare_text(text)
+    length = len(text)
+    matches = []
+    state = 0
+
+    for end, char in enumerate(text, 1):
+        while state and char not in goto[state]:
+            state = fail[state]
+
+        state = goto[state].get(char, 0)
+
+        for term, category in outputs[state]:
+            start = end - len(term)
+
+            if (start == 0 or not text[start - 1].isalnum()) and\
+                    (end == length or not text[end].isalnum()):
+                matches.append((start, end, term, category))
+
+    if overlapping:
+        return sorted(matches, key=lambda match: match[:2])
+
+    return longest_matches(matches)
+
+
+def match_texts(automaton, ids, texts, overlapping=False):
+    '''The matches of each text as (id, start, end, term, category) tuples.
+       Missing texts have no matches.'''
+    return [(id_,) + match
+            for id_, text in zip(ids, texts)
+            if isinstance(text, str)
+            for match in find_matches(automaton, text, overlapping)]
+
+
+# the automaton of each worker process, so it is only sent over once
+_AUTOMATON = None
+
+
+def _init_worker(automaton):
+    global _AUTOMATON
+    _AUTOMATON = automaton
+
+
+def _match_batch(args):
+    ids, texts, overlapping = args
+
+    return match_texts(_AUTOMATON, ids, texts, overlapping)
+
+
+def match_batches(automaton, batches, workers=1, overlapping=False):
+    '''Returns a DataFrame of the matches (SPAN_COLUMNS) in batches, an
+       iterable of DataFrames with ROW_ID and TEXT columns, using a pool of
+       worker processes if workers > 1.'''
+    tasks = ((batch['ROW_ID'].tolist(), batch['TEXT'].tolist(), overlapping)
+             for batch in batches)
+
+    if workers > 1:
+        results = []
+        pending = deque()
+
+        with ProcessPoolExecutor(workers,
+                                 initializer=_init_worker,
+                                 initargs=(automaton,)) as executor:
+            # only read ahead a few batches, so memory use stays bounded
+            for task in tasks:
+                pending.append(executor.submit(_match_batch, task))
+
+                if len(pending) >= 2 * workers:
+                    results.append(pending.popleft().result())
+
+            results += [future.result() for future in pending]
+
+    else:
+        results = [match_texts(automaton, ids, texts, overlapping)
+                   for ids, texts, overlapping in tasks]
+
+    return pd.DataFrame([match for matches in results for match in matches],
+                        columns=SPAN_COLUMNS)
+
+
+def match_noteevents(automaton, path=None, workers=1, overlapping=False,
+                     **scan_kwargs):
+    '''match_batches over NOTEEVENTS, read in batches by
+       noteevents.scan_notes (which also takes any filters, e.g.
+       categories or hadm_ids, and the chunksize).'''
+    batches = scan_notes(path, columns=['ROW_ID', 'TEXT'], **scan_kwargs)
+
+    return match_batches(automaton, batches, workers, overlapping)
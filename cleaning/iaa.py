@@ -0,0 +1,257 @@
+"""Inter-annotator agreement (IAA) of ClinicalRegex annotation rounds, for
+any number of annotators and labels.
+
+The annotations of all annotators are encoded once as one integer array,
+codes[item, annotator, label], indexing into a shared list of categories
+(the annotation values, e.g. 0, 1, 5, 9). Every statistic below is then
+computed with array operations over that array, including over a leading
+axis of bootstrap resamples, so confidence intervals cost one batched
+computation rather than a Python loop per resample:
+    - confusion_matrices : Per annotator pair and label.
+    - cohen_kappa        : Per annotator pair and label.
+    - fleiss_kappa       : Per label, over all annotators.
+
+Usage:
+    frames = {'khuyen': read_cr_data(FILE_K), 'sandra': read_cr_data(FILE_S)}
+    result = agreement(frames, {'L1_annotation': 'child',
+                                'L2_annotation': 'spouse'})
+    result.kappas
+"""
+
+
+import itertools
+import logging
+import numpy as np
+import pandas as pd
+
+from collections import namedtuple
+
+
+KAPPA_COLUMNS = ['LABEL',
+                 'STATISTIC',
+                 'ANNOTATOR_1',
+                 'ANNOTATOR_2',
+                 'KAPPA',
+                 'CI_LOWER',
+                 'CI_UPPER']
+
+# ids         : Items annotated by every annotator, in the order of codes.
+# annotators  : Annotator names, in the order of codes.
+# labels      : Label names, in the order of codes.
+# categories  : Annotation value of each code.
+# codes       : Array of codes[item, annotator, label].
+Ratings = namedtuple('Ratings',
+                     ['ids', 'annotators', 'labels', 'categories', 'codes'])
+
+# kappas     : DataFrame of KAPPA_COLUMNS.
+# confusion  : Dict of (label, annotator 1, annotator 2) -> DataFrame of
+#              counts (rows: annotator 1's values, columns: annotator 2's).
+Agreement = namedtuple('Agreement', ['ratings', 'kappas', 'confusion'])
+
+
+def resolve_annotations(df, labels, id_col='id'):
+    '''One value per id and label. ClinicalRegex sometimes has several rows
+       per id; their values must agree, except that 0 and 1 resolve to 1.'''
+    grouped = df.groupby(id_col)[list(labels)]
+
+    n_values = grouped.nunique()
+    lowest = grouped.min()
+    highest = grouped.max()
+
+    either = (n_values == 2) & (lowest == 0) & (highest == 1)
+
+    if ((n_values > 1) & ~either).any(axis=None):
+        unclear = n_values.index[((n_values > 1) & ~either).any(axis=1)]
+        raise ValueError('Resolution of annotations unclear/undefined for '
+                         '{}s {}'.format(id_col, unclear.tolist()))
+
+    return highest.where(either, lowest)
+
+
+def encode_ratings(frames, labels, id_col='id', ids=None):
+    '''Ratings of the items annotated by every annotator.
+
+       frames : Dict of annotator -> DataFrame of ClinicalRegex annotations
+                (see clinical_regex.read_cr_data).
+       labels : Dict of label column -> label name (or a list of columns).
+       ids    : Optionally, only use these ids.
+    '''
+    if not isinstance(labels, dict):
+        labels = {label: label for label in labels}
+
+    resolved = [resolve_annotations(df, labels, id_col)
+                for df in frames.values()]
+
+    common = resolved[0].index
+
+    for df in resolved[1:]:
+        common = common.intersection(df.index)
+
+    if ids is not None:
+        common = common.intersection(pd.Index(list(ids)))
+
+    # shape (annotator, item, label)
+    values = np.stack([df.loc[common].astype('float64').to_numpy()
+                       for df in resolved])
+
+    complete = ~np.isnan(values).any(axis=(0, 2))
+
+    if not complete.all():
+        logging.warning('Dropping {} items not annotated by everyone.'
+                        .format((~complete).sum()))
+
+    values = values[:, complete]
+
+    categories, codes = np.unique(values, return_inverse=True)
+
+    return Ratings(ids=common[complete].tolist(),
+                   annotators=list(frames),
+                   labels=list(labels.values()),
+                   categories=categories.astype(int).tolist(),
+                   codes=codes.reshape(values.shape).transpose(1, 0, 2))
+
+
+def annotator_pairs(n_annotators):
+    return list(itertools.combinations(range(n_annotators), 2))
+
+
+def confusion_matrices(codes, n_categories):
+    '''Counts of each pair of values of each annotator pair and label.
+
+       codes  : Array of shape (..., item, annotator, label).
+       Returns: Array of shape (..., pair, label, category, category).
+    '''
+    pairs = annotator_pairs(codes.shape[-2])
+    first = codes[..., [a for a, _ in pairs], :]
+    second = codes[..., [b for _, b in pairs], :]
+
+    categories = np.arange(n_categories)
+    one_hot_first = first[..., None] == categories    # (..., item, pair, label, cat)
+    one_hot_second = second[..., None] == categories
+
+    return np.einsum('...ipla,...iplb->...plab',
+                     one_hot_first.astype(np.int64),
+                     one_hot_second.astype(np.int64))
+
+
+def kappa_from_confusion(confusion):
+    '''Cohen's kappa of confusion matrices, over the last two axes.'''
+    n = confusion.sum(axis=(-2, -1))
+    observed = np.trace(confusion, axis1=-2, axis2=-1) / n
+    expected = (confusion.sum(axis=-1) * confusion.sum(axis=-2)).sum(axis=-1) /\
+        n ** 2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (observed - expected) / (1 - expected)
+
+
+def cohen_kappa(codes, n_categories):
+    '''Cohen's kappa of each annotator pair (see annotator_pairs) and label,
+       as an array of shape (..., pair, label).'''
+    return kappa_from_confusion(confusion_matrices(codes, n_categories))
+
+
+def fleiss_kappa(codes, n_categories):
+    '''Fleiss' kappa over all annotators of each label, as an array of
+       shape (..., label).'''
+    n_items, n_annotators = codes.shape[-3], codes.shape[-2]
+
+    # number of annotators giving each item each value: (..., item, label, cat)
+    counts = (codes[..., None] == np.arange(n_categories)).sum(axis=-3)
+
+    agreement = ((counts ** 2).sum(axis=-1) - n_annotators) /\
+        (n_annotators * (n_annotators - 1))
+    observed = agreement.mean(axis=-2)
+
+    proportions = counts.sum(axis=-3) / (n_items * n_annotators)
+    expected = (proportions ** 2).sum(axis=-1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (observed - expected) / (1 - expected)
+
+
+def bootstrap(statistic, codes, n_categories, n_resamples=1000, seed=0,
+              batch_size=250):
+    '''statistic(codes, n_categories) of n_resamples resamples (with
+       replacement) of the items, as an array with a leading resample axis.
+       Resamples are computed batch_size at a time.'''
+    rng = np.random.RandomState(seed)
+    n_items = codes.shape[0]
+    samples = []
+
+    for start in range(0, n_resamples, batch_size):
+        size = min(batch_size, n_resamples - start)
+        items = rng.randint(0, n_items, size=(size, n_items))
+
+        samples.append(statistic(codes[items], n_categories))
+
+    return np.concatenate(samples)
+
+
+def confidence_interval(samples, level=0.95):
+    '''Percentile interval of bootstrap samples, along the first axis.'''
+    tail = (1 - level) / 2 * 100
+
+    return (np.nanpercentile(samples, tail, axis=0),
+            np.nanpercentile(samples, 100 - tail, axis=0))
+
+
+def kappa_table(ratings, n_resamples=1000, level=0.95, seed=0):
+    '''Cohen's kappa of each annotator pair and Fleiss' kappa of all
+       annotators, per label, with bootstrap confidence intervals.'''
+    n_categories = len(ratings.categories)
+    pairs = annotator_pairs(len(ratings.annotators))
+
+    rows = []
+
+    for name, statistic, groups in [
+            ('cohen', cohen_kappa, pairs),
+            ('fleiss', fleiss_kappa, [(None, None)])]:
+
+        kappas = statistic(ratings.codes, n_categories).reshape(len(groups), -1)
+        lower, upper = confidence_interval(
+            bootstrap(statistic, ratings.codes, n_categories, n_resamples,
+                      seed),
+            level)
+
+        lower = lower.reshape(len(groups), -1)
+        upper = upper.reshape(len(groups), -1)
+
+        for g, (a, b) in enumerate(groups):
+            for l, label in enumerate(ratings.labels):
+                rows.append((label,
+                             name,
+                             ratings.annotators[a] if a is not None else 'all',
+                             ratings.annotators[b] if b is not None else 'all',
+                             kappas[g, l],
+                             lower[g, l],
+                             upper[g, l]))
+
+    return pd.DataFrame(rows, columns=KAPPA_COLUMNS)
+
+
+def confusion_frames(ratings):
+    '''Confusion matrices of each label and annotator pair, as DataFrames
+       indexed by annotation value.'''
+    matrices = confusion_matrices(ratings.codes, len(ratings.categories))
+    frames = {}
+
+    for p, (a, b) in enumerate(annotator_pairs(len(ratings.annotators))):
+        for l, label in enumerate(ratings.labels):
+            frames[(label, ratings.annotators[a], ratings.annotators[b])] =\
+                pd.DataFrame(matrices[p, l],
+                             index=ratings.categories,
+                             columns=ratings.categories)
+
+    return frames
+
+
+def agreement(frames, labels, id_col='id', ids=None, n_resamples=1000,
+              level=0.95, seed=0):
+    '''Kappas (with confidence intervals) and confusion matrices of the
+       annotations of several annotators (see encode_ratings).'''
+    ratings = encode_ratings(frames, labels, id_col, ids)
+
+    return Agreement(ratings=ratings,
+                     kappas=kappa_table(ratings, n_resamples, level, seed),
+                     confusion=confusion_frames(ratings))
@@ -1,31 +1,66 @@
 #!/usr/bin/env python
 
-"""Loops through data/raw/label-studio-annotations/*.json files and outputs a
-Pandas DataFrame with the following columns:
+"""Loops through data/raw/label-studio-annotations/*.json files and outputs two
+Pandas DataFrames:
+
+Spans, one row per annotated span, with the following columns:
+    - LS_FILE: The export file the span was read from.
+    - LS_TASK_ID: The Label Studio task the span belongs to.
+    - LS_TEXT_STRING: The string of LS_NOTE_TEXT that corresponds to LS_LABEL.
+    - LS_FIRST_INDEX: The start index of LS_TEXT_STRING within LS_NOTE_TEXT.
+    - LS_LAST_INDEX: The last index of LS_TEXT_STRING within LS_NOTE_TEXT.
+    - LS_LABEL: The annotation/label.
+
+Notes, one row per export file, so that each note's text is only stored once
+per file:
+    - LS_FILE: The export file.
+    - LS_TASK_ID: The Label Studio task (its id, as a string). The same task
+                  can be in several files (e.g. re-exports, or one per
+                  annotator), so notes are keyed by LS_FILE and LS_TASK_ID.
     - LS_NOTE_TEXT: The full note text. (Note: Label Studio note text may
                                          differ slightly from original, hence
                                          the prefix.)
-    - LS_TEXT_STRING: The string of NOTE_TEXT_LS that corresponds to LABEL_VAR.
-    - LS_FIRST_INDEX: The start index of TEXT_STRING within NOTE_TEXT_LS.
-    - LS_LAST_INDEX: The last index of TEXT_STRING within NOTE_TEXT_LS.
-    - LS_LABEL: The annotation/label.
+
+Both are written to data/interim/label-studio-annotations/ as Parquet files.
+
+Processing is incremental: each export file is parsed into its own shard
+(under shards/, named after the file's content hash), and a manifest records
+which shard belongs to which file. Only new or changed files are parsed on
+later runs; the outputs are then rebuilt from the shards. Files can be parsed
+in parallel with --workers.
+
+Usage:
+    python cleaning/label_studio_processing.py [--workers N] [--full]
 """
 
 
-import glob
+import argparse
+import hashlib
 import json
 import logging
 import pandas as pd
 
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from cleaning.cache import write_cached
 
 PATH = Path(__file__).resolve()
 PROJECT_ROOT = PATH.parent.parent
 DATA_DIR = PROJECT_ROOT / 'data/raw/label-studio-annotations/'
 INTERIM_DIR = PROJECT_ROOT / 'data/interim/label-studio-annotations/'
-FILES = DATA_DIR.glob('*.json')
 
-OUTPUT_FILE = INTERIM_DIR / 'ls-annotations.csv'
+OUTPUT_FILE = 'ls-annotations.parquet'
+OUTPUT_FILE_NOTES = 'ls-notes.parquet'
+MANIFEST_FILE = 'manifest.json'
+
+NOTE_KEYS = ['LS_FILE', 'LS_TASK_ID']
+
+SPAN_COLUMNS = ['LS_FILE',
+                'LS_TASK_ID',
+                'LS_TEXT_STRING',
+                'LS_FIRST_INDEX',
+                'LS_LAST_INDEX',
+                'LS_LABEL']
 
 LIMIT_RESULT_STRING_LENGTH = 2000   # skip results with long annotation strings
 
@@ -36,87 +71,238 @@ def pretty_json(data):
     return json.dumps(data, sort_keys=True, indent=4)
 
 
-# For checking each row only has one label
-def has_only_one_item_per_row(series):
-    return (series.apply(len) == 1).all()
+def parse_file(file_path):
+    '''Returns the (spans, notes) DataFrames described above for a single
+       export file, built once from column buffers.'''
+    spans = {column: [] for column in SPAN_COLUMNS}
 
+    logging.info('Reading data from {}...'.format(file_path))
 
-def process_files(files):
-    df = pd.DataFrame()
+    with open(file_path) as file:
+        ls_data = json.load(file)
 
-    for file_path in files:
-        logging.info('Reading data from {}...'.format(file_path))
+    assert 'text' in ls_data['data'].keys()
 
-        with open(file_path) as file:
-            ls_data = json.load(file)
+    # exports of single tasks are named after the task id; a string either
+    # way, so that the ids of all files have one type
+    task_id = str(ls_data.get('id', Path(file_path).stem))
+    file_name = Path(file_path).name
 
-            assert 'text' in ls_data['data'].keys()
+    for completion in ls_data['completions']:
+        completion_id = completion['id']
+        completion_results = completion['result']
 
-            ls_text = ls_data['data']['text']
+        for result in completion_results:
+            try:
+                result_id = result['id']
+                result_index_start = result['value']['start']
+                result_index_end = result['value']['end']
+                result_string = result['value']['text']
+                result_labels = result['value']['labels']
 
-            for completion in ls_data['completions']:
-                completion_id = completion['id']
-                completion_results = completion['result']
+            except KeyError as error:
+                logging.warning('Reading file: {}\n'
+                                'No annotation info in this completion'
+                                ' (id = {:>8}). Skipping...\n'
+                                '\tKeyError: Key {} not found.'
+                                .format(file_path,
+                                        completion_id,
+                                        error))
+                continue
 
-                for result in completion_results:
-                    try:
-                        result_id = result['id']
-                        result_index_start = result['value']['start']
-                        result_index_end = result['value']['end']
-                        result_string = result['value']['text']
-                        result_labels = result['value']['labels']
+            # Check for overly long "annotations"
+            if len(result_string) >= LIMIT_RESULT_STRING_LENGTH:
+                logging.warning('Very long annotation string '
+                                'encountered, skipping...')
+                continue
 
-                        # Check for overly long "annotations"
-                        if len(result_string) >= LIMIT_RESULT_STRING_LENGTH:
-                            logging.warning('Very long annotation string '
-                                            'encountered, skipping...')
-                            continue
+            if len(result_labels) != 1:
+                raise ValueError('Some entry has multiple labels associated '
+                                 'with it.')
 
-                        else:
-                            df = df.append({"LS_NOTE_TEXT": ls_text,
-                                            "LS_FIRST_INDEX": result_index_start,
-                                            "LS_LAST_INDEX": result_index_end,
-                                            "LS_TEXT_STRING": result_string,
-                                            "LS_LABEL": result_labels},
-                                           ignore_index=True)
+            spans['LS_FILE'].append(file_name)
+            spans['LS_TASK_ID'].append(task_id)
+            spans['LS_TEXT_STRING'].append(result_string)
+            spans['LS_FIRST_INDEX'].append(result_index_start)
+            spans['LS_LAST_INDEX'].append(result_index_end)
+            spans['LS_LABEL'].append(result_labels[0])
 
-                    except KeyError as error:
-                        logging.warning('Reading file: {}\n'
-                                        'No annotation info in this completion'
-                                        ' (id = {:>8}). Skipping...\n'
-                                        '\tKeyError: Key {} not found.'
-                                        .format(file_path,
-                                                completion_id,
-                                                error))
-                        continue
+    df_notes = pd.DataFrame({'LS_FILE': [file_name],
+                             'LS_TASK_ID': [task_id],
+                             'LS_NOTE_TEXT': [ls_data['data']['text']]})
 
-    if has_only_one_item_per_row(df['LS_LABEL']):
-        df['LS_LABEL'] = df['LS_LABEL'].apply(lambda items: items[0])
+    return pd.DataFrame(spans, columns=SPAN_COLUMNS), df_notes
 
-    else:
-        raise ValueError('Some entry has multiple labels associated with it.')
 
-    return df
+def parse_all(files, workers=1):
+    '''parse_file of each file, in order, using a pool of worker processes
+       if workers > 1.'''
+    files = list(files)
 
+    if workers > 1 and len(files) > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            return list(executor.map(parse_file, files))
 
-if __name__ == '__main__':
-    processed_df = process_files(FILES)
+    return [parse_file(file_path) for file_path in files]
+
+
+def combine(parsed):
+    '''Concatenates (spans, notes) pairs into a single pair.'''
+    if len(parsed) == 0:
+        return (pd.DataFrame(columns=SPAN_COLUMNS),
+                pd.DataFrame(columns=NOTE_KEYS + ['LS_NOTE_TEXT']))
+
+    df_spans = pd.concat([spans for spans, _ in parsed], ignore_index=True)
+    df_notes = pd.concat([notes for _, notes in parsed], ignore_index=True)
+
+    return df_spans, df_notes
+
+
+def parse_files(files, workers=1):
+    '''Returns the (spans, notes) DataFrames of all files.'''
+    return combine(parse_all(files, workers))
+
+
+def process_files(files, workers=1):
+    '''Spans joined with the text of their notes (of the same file), as a
+       single DataFrame.'''
+    df_spans, df_notes = parse_files(files, workers)
+
+    df = df_spans.merge(df_notes, on=NOTE_KEYS, how='left',
+                        validate='many_to_one')
+
+    return df.drop(columns=NOTE_KEYS)
+
+
+def file_hash(file_path):
+    with open(file_path, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+def shard_paths(output_dir, digest):
+    shard_dir = Path(output_dir) / 'shards'
+
+    return (shard_dir / '{}.spans.parquet'.format(digest),
+            shard_dir / '{}.notes.parquet'.format(digest))
+
+
+def load_manifest(output_dir):
+    '''File name -> {size, mtime, hash} of the files processed last time.'''
+    path = Path(output_dir) / MANIFEST_FILE
+
+    if not path.is_file():
+        return {}
 
-    print('Writing to {}...'.format(OUTPUT_FILE))
+    with open(path) as file:
+        return json.load(file)
 
-    if OUTPUT_FILE.is_file():
-        overwrite = input('Output file {} already exists, overwrite? [y/N]: '
-                          .format(OUTPUT_FILE))
 
-        while True:
-            if overwrite == '' or overwrite.lower() == 'n':
-                print('Canceling write...')
-                break
+def save_manifest(manifest, output_dir):
+    def write(path):
+        with open(path, 'w') as file:
+            json.dump(manifest, file, indent=4, sort_keys=True)
+
+    write_cached(write, Path(output_dir) / MANIFEST_FILE, remove_stale=False)
+
+
+def write_output(df, path):
+    '''Atomically writes df to path, so that an interrupted run never leaves
+       a truncated shard (which would be trusted as complete) or output.'''
+    write_cached(lambda tmp_path: df.to_parquet(tmp_path, index=False),
+                 path,
+                 remove_stale=False)
+
+
+def process_directory(data_dir=DATA_DIR, output_dir=INTERIM_DIR, workers=1,
+                      incremental=True):
+    '''Parses the new or changed *.json files in data_dir into shards, then
+       writes the combined spans and notes of all files to output_dir.
+
+       incremental : If False, reparse every file.
+    '''
+    output_dir = Path(output_dir)
+    (output_dir / 'shards').mkdir(parents=True, exist_ok=True)
+
+    old_manifest = load_manifest(output_dir) if incremental else {}
+    manifest = {}
+    to_parse = {}
+
+    for file_path in sorted(Path(data_dir).glob('*.json')):
+        stat = file_path.stat()
+        entry = old_manifest.get(file_path.name, {})
+
+        # only rehash files that were touched since the last run
+        if (entry.get('size'), entry.get('mtime')) !=\
+                (stat.st_size, stat.st_mtime_ns):
+            entry = {'size': stat.st_size,
+                     'mtime': stat.st_mtime_ns,
+                     'hash': file_hash(file_path)}
+
+        manifest[file_path.name] = entry
+
+        spans_path, notes_path = shard_paths(output_dir, entry['hash'])
+
+        if not (incremental and spans_path.is_file() and notes_path.is_file()):
+            to_parse[entry['hash']] = file_path
+
+    logging.info('Parsing {} of {} files...'.format(len(to_parse),
+                                                     len(manifest)))
+
+    for digest, (df_spans, df_notes) in zip(to_parse,
+                                            parse_all(to_parse.values(),
+                                                      workers)):
+        spans_path, notes_path = shard_paths(output_dir, digest)
+        write_output(df_spans, spans_path)
+        write_output(df_notes, notes_path)
+
+    # shards of files that were changed or removed
+    digests = {entry['hash'] for entry in manifest.values()}
+
+    for shard in (output_dir / 'shards').glob('*.parquet'):
+        if shard.name.split('.')[0] not in digests:
+            shard.unlink()
+
+    # files with the same content share a shard, so LS_FILE is set here
+    df_spans, df_notes = combine([
+        tuple(pd.read_parquet(path).assign(LS_FILE=name)
+              for path in shard_paths(output_dir, entry['hash']))
+        for name, entry in sorted(manifest.items())
+    ])
+
+    write_output(df_spans, output_dir / OUTPUT_FILE)
+    write_output(df_notes, output_dir / OUTPUT_FILE_NOTES)
+
+    # last, once every shard it lists is in place
+    save_manifest(manifest, output_dir)
+
+    return df_spans, df_notes
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(
+        description='Combine Label Studio exports into Parquet files.')
+    parser.add_argument('--data-dir', type=Path, default=DATA_DIR,
+                        help='directory of Label Studio *.json exports')
+    parser.add_argument('--output-dir', type=Path, default=INTERIM_DIR,
+                        help='directory to write the outputs to')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes parsing files')
+    parser.add_argument('--full', action='store_true',
+                        help='reparse every file, not only new/changed ones')
+
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    args = parse_args()
 
-            elif overwrite.lower() == 'y':
-                print('Overwriting file {}.'.format(OUTPUT_FILE))
-                processed_df.to_csv(OUTPUT_FILE, index=False)
-                break
+    df_spans, df_notes = process_directory(args.data_dir,
+                                           args.output_dir,
+                                           workers=args.workers,
+                                           incremental=not args.full)
 
-            else:
-                overwrite = input('Invalid input, please try again: ')
+    print('Wrote {} spans of {} notes to {}.'.format(len(df_spans),
+                                                     len(df_notes),
+                                                     args.output_dir))
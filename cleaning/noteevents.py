@@ -0,0 +1,126 @@
+"""Streaming access to MIMIC-III's NOTEEVENTS table.
+
+NOTEEVENTS.csv is ~4 GB, so rather than loading it whole, scan_notes reads it
+in fixed-size batches and applies any filters (category, HADM_ID, keyword
+prefilter) to each batch before it is handed back. Memory use is bounded by
+the batch size regardless of the size of the file.
+"""
+
+
+import pandas as pd
+
+from cleaning.caregivers import schema
+from cleaning.dictionaries import minimal_substring_set, normalize_term
+from cleaning.utils import find_source, get_project_root
+
+
+PROJECT_ROOT = get_project_root()
+NOTEEVENTS = PROJECT_ROOT / 'data/raw/mimic-iii/NOTEEVENTS.csv'
+
+CHUNKSIZE = 20000
+
+# declared up front so that every batch comes back with the same types
+NOTE_DTYPES = {
+    'ROW_ID': 'int32',
+    'SUBJECT_ID': 'int32',
+    'HADM_ID': 'float64',
+    'CATEGORY': 'object',
+    'DESCRIPTION': 'object',
+    'CGID': 'float64',
+    'ISERROR': 'float64',
+    'TEXT': 'object'
+}
+
+# parsed with their exact format (see schema.NOTEEVENTS), rather than
+# letting pandas guess it
+NOTE_DATETIME_COLS = list(schema.NOTEEVENTS)
+
+
+def keyword_prefilter(keywords):
+    '''Returns a function mapping a Series of texts to a boolean mask of
+       the texts containing (as a case-insensitive substring) any keyword.
+
+       This is deliberately cheap and permissive, e.g. "ex" matches "next";
+       exact whole-word matching should be done on the (much smaller) set
+       of texts that pass.'''
+    keywords = minimal_substring_set(normalize_term(keyword)
+                                     for keyword in keywords)
+
+    def contains_any(texts):
+        return pd.Series([any(keyword in text for keyword in keywords)
+                          for text in texts.fillna('').str.lower()],
+                         index=texts.index,
+                         dtype=bool)
+
+    return contains_any
+
+
+def scan_notes(path=None, columns=None, categories=None, hadm_ids=None,
+               keywords=None, chunksize=CHUNKSIZE):
+    '''Yields DataFrames of at most chunksize notes each.
+
+       columns    : Columns to return (default: all).
+       categories : Only keep notes with these CATEGORY values (compared
+                    ignoring surrounding whitespace and case).
+       hadm_ids   : Only keep notes with these HADM_IDs.
+       keywords   : Only keep notes whose TEXT contains any of these
+                    (see keyword_prefilter).
+    '''
+    path = find_source(path or NOTEEVENTS)
+
+    usecols = None
+
+    if columns is not None:
+        filter_cols = [col for col, used in [('CATEGORY', categories),
+                                             ('HADM_ID', hadm_ids),
+                                             ('TEXT', keywords)]
+                       if used is not None]
+        usecols = list(dict.fromkeys(list(columns) + filter_cols))
+
+    if categories is not None:
+        categories = {category.strip().lower() for category in categories}
+
+    if hadm_ids is not None:
+        hadm_ids = set(hadm_ids)
+
+    contains_any = keyword_prefilter(keywords) if keywords is not None\
+        else None
+
+    reader = pd.read_csv(path,
+                         usecols=usecols,
+                         dtype=NOTE_DTYPES,
+                         chunksize=chunksize)
+
+    for chunk in reader:
+        if categories is not None:
+            chunk = chunk[chunk['CATEGORY'].str.strip()
+                                           .str.lower()
+                                           .isin(categories)]
+
+        if hadm_ids is not None:
+            chunk = chunk[chunk['HADM_ID'].isin(hadm_ids)]
+
+        if contains_any is not None and len(chunk) > 0:
+            chunk = chunk[contains_any(chunk['TEXT'])]
+
+        if len(chunk) == 0:
+            continue
+
+        chunk = schema.parse_datetimes(chunk, schema.NOTEEVENTS)
+
+        if columns is not None:
+            chunk = chunk[list(columns)]
+
+        yield chunk
+
+
+def load_notes(*args, **kwargs):
+    '''Concatenates the batches of scan_notes; only sensible when the
+       filters leave a subset of the notes that fits in memory.'''
+    chunks = list(scan_notes(*args, **kwargs))
+
+    if len(chunks) == 0:
+        return pd.DataFrame(columns=kwargs.get('columns') or
+                            list(NOTE_DTYPES) + NOTE_DATETIME_COLS)
+
+    return pd.concat(chunks, ignore_index=True)
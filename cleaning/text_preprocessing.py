@@ -1,4 +1,8 @@
 import re
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
 
 
 def remove_redactions(text):
@@ -31,10 +35,113 @@ def remove_non_alphabetic(text):
     return re.sub(r'[^a-zA-Z\s]', ' ', text)
 
 
+# Batch preprocessing
+#
+# preprocess_text used to lower case, remove redactions, remove non-alphabetic
+# characters and squish whitespace as four passes over each text. The first
+# and third of these only ever replace a character by one or more characters
+# (or spaces), so both are folded into a single translation table.
+
+REDACTION_REGEX = re.compile(r'\[.*?\]')
+
+
+def _translate(ordinal):
+    '''The lower cased character if it is a letter a-z, else a space. Some
+       characters lower case to more than one character (e.g. "İ").'''
+    return ''.join(char if 'a' <= char <= 'z' else ' '
+                   for char in chr(ordinal).lower())
+
+
+class _TranslationTable(dict):
+    '''Character ordinal -> _translate(ordinal), filled in on first use for
+       characters outside ASCII.'''
+    def __missing__(self, ordinal):
+        self[ordinal] = _translate(ordinal)
+
+        return self[ordinal]
+
+
+TRANSLATION_TABLE = _TranslationTable({ordinal: _translate(ordinal)
+                                       for ordinal in range(128)})
+
+
 def preprocess_text(text):
-    text = text.lower()
-    text = remove_redactions(text)
-    text = remove_non_alphabetic(text)
-    text = remove_carriage_returns_and_repeated_spaces(text)
+    text = REDACTION_REGEX.sub(' ', text)
+    text = text.translate(TRANSLATION_TABLE)
+
+    return ' '.join(text.split())
+
+
+def preprocess_text_with_offsets(text):
+    '''Returns preprocess_text(text) and, for each of its characters, the
+       index of the character of text it comes from. A space stands for
+       everything removed between two words, and maps to the first removed
+       character.'''
+    chars = []
+    offsets = []
+    space_at = None   # where the run of removed characters started
+
+    redactions = [match.span() for match in REDACTION_REGEX.finditer(text)]
+    position = 0
+
+    for start, end in redactions + [(len(text), len(text))]:
+        for index in range(position, start):
+            for char in TRANSLATION_TABLE[ord(text[index])]:
+                if char == ' ':
+                    if space_at is None:
+                        space_at = index
+
+                    continue
+
+                if space_at is not None and chars:
+                    chars.append(' ')
+                    offsets.append(space_at)
+
+                space_at = None
+                chars.append(char)
+                offsets.append(index)
+
+        if start < end and space_at is None:
+            space_at = start
+
+        position = end
+
+    return ''.join(chars), np.array(offsets, dtype=np.int64)
+
+
+def _preprocess_batch(args):
+    texts, offsets = args
+    preprocess = preprocess_text_with_offsets if offsets else preprocess_text
+
+    return [preprocess(text) if isinstance(text, str) else text
+            for text in texts]
+
+
+def preprocess_texts(texts, offsets=False, workers=1, chunksize=1000):
+    '''preprocess_text of each of texts (an iterable, e.g. a Series), as a
+       list, or a Series with the same index if texts is one. Missing texts
+       are passed through.
+
+       offsets   : If True, return (text, offsets) pairs instead (see
+                   preprocess_text_with_offsets).
+       workers   : Number of worker processes; batches of chunksize texts
+                   are preprocessed in parallel if more than 1.
+    '''
+    values = list(texts)
+    batches = [(values[i:i + chunksize], offsets)
+               for i in range(0, len(values), chunksize)]
+
+    if workers > 1 and len(batches) > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(_preprocess_batch, batches))
+
+    else:
+        results = [_preprocess_batch(batch) for batch in batches]
+
+    results = [result for batch in results for result in batch]
+
+    if isinstance(texts, pd.Series):
+        return pd.Series(results, index=texts.index, name=texts.name,
+                         dtype=object)
 
-    return text
+    return results
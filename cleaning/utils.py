@@ -2,10 +2,27 @@ import pandas as pd
 from pathlib import Path
 
 
+# MIMIC-III's timestamps and dates
+MIMIC_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+MIMIC_DATE_FORMAT = "%Y-%m-%d"
+
+
 def get_project_root() -> Path:
     return Path(__file__).parent.parent
 
 
+def find_source(path) -> Path:
+    """Prefer an uncompressed CSV, but fall back to the .csv.gz files
+    the MIMIC distribution ships with."""
+    path = Path(path)
+    path_gz = path.with_name(path.name + ".gz")
+
+    if not path.is_file() and path_gz.is_file():
+        return path_gz
+
+    return path
+
+
 def get_cols_with_na_values(df):
     return df.columns[df.isna().any()]
 
@@ -23,18 +40,19 @@ def remove_constant_cols(df):
     return df.loc[:, (df != df.iloc[0]).any()]
 
 
-def handle_datetime_types(df):
-    """Attempts to automatically convert datetime columns to the correct type.
-    """
-    for col in df.columns:
-        if df[col].dtype == "object":
-            try:
-                df[col] = pd.to_datetime(df[col])
-
-            except ValueError:
-                pass
-
-    return df
+def parse_datetime(values, format=MIMIC_DATETIME_FORMAT):
+    """Same as pd.to_datetime(values, format=format) for a Series, but with
+    each distinct value parsed only once (dates and times repeat a lot
+    across rows). Missing values become NaT."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    
+    codes, uniques = pd.factorize(values)
+    parsed = pd.DatetimeIndex(pd.to_datetime(uniques, format=format))
+    
+    return pd.Series(parsed.take(codes, allow_fill=True, fill_value=pd.NaT),
+                     index=values.index,
+                     name=values.name)
 
 
 def handle_datetime_cols(df, datetime_cols):
@@ -80,3 +98,49 @@ def squish(s: pd.Series):
 
     else:
         raise IndexError("Values not unique, can't squish.")
+
+
+def squish_groups(df, group_by, columns):
+    """Vectorized equivalent of df.groupby(group_by)[columns].agg(squish).
+
+    Counts the distinct values (NaN included) of every column per group in
+    one pass and takes each group's first row where they are constant.
+    Raises an IndexError naming every conflicting column and (some of the)
+    conflicting groups otherwise.
+    """
+    nunique = df.groupby(group_by)[columns].nunique(dropna=False)
+    conflicts = nunique > 1
+
+    if conflicts.any().any():
+        cols = list(conflicts.columns[conflicts.any()])
+        groups = list(conflicts.index[conflicts.any(axis=1)])
+
+        raise IndexError("Values not unique, can't squish. "
+                         "Columns: {}; {} {} groups, e.g. {}"
+                         .format(cols, len(groups), group_by, groups[:10]))
+
+    first = df.drop_duplicates(group_by).set_index(group_by)[columns]
+
+    return first.reindex(nunique.index)
+
+
+def aggregate(df, group_by, **aggregations):
+    """Same as df.groupby(group_by).agg(**aggregations), except that all
+    aggregations using squish are done at once by squish_groups.
+    """
+    squished = {name: col for name, (col, func) in aggregations.items()
+                if func is squish}
+    others = {name: agg for name, agg in aggregations.items()
+              if name not in squished}
+
+    parts = []
+
+    if squished:
+        df_s = squish_groups(df, group_by, list(dict.fromkeys(squished.values())))
+        parts.append(pd.DataFrame({name: df_s[col]
+                                   for name, col in squished.items()}))
+
+    if others:
+        parts.append(df.groupby(group_by).agg(**others))
+
+    return pd.concat(parts, axis="columns")[list(aggregations)]
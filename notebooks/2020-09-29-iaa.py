@@ -1,175 +1,124 @@
 import streamlit as st
-import pandas as pd
-from sklearn.metrics import cohen_kappa_score, confusion_matrix
-from cleaning.clinical_regex import get_full_cr_data 
+import numpy as np
+from cleaning.clinical_regex import read_cr_data
+from cleaning.iaa import agreement
 
 
-# khuyen and sandra
-FILE_K = '../data/raw/2020-09-22-kd-200-annotations.csv'
-FILE_S = '../data/raw/2020-09-28-sz-200-annotations.csv'
+# annotator -> ClinicalRegex export
+ANNOTATORS = {'Khuyen': '../data/raw/2020-09-22-kd-200-annotations.csv',
+              'Sandra': '../data/raw/2020-09-28-sz-200-annotations.csv'}
 
-# annotation column names
-COL_CHILD = 'child'
-COL_SPOUSE = 'spouse'
-
-ANNOTATION_COLS = [COL_CHILD,
-                   COL_SPOUSE]
+# clinical regex label column -> annotation name
+LABELS = {'L1_annotation': 'child',
+          'L2_annotation': 'spouse'}
 
 # clinical regex column names
 COL_CR_ID = 'id'
-COL_CR_L1_ANNOTATION = 'L1_annotation'
-COL_CR_L2_ANNOTATION = 'L2_annotation'
 COL_CR_TEXT = 'text'
 
 # this had to be computed semi-manually, see notebook on why this is
 N_ROWS = 234
 N_EXPECTED_ANNOTATIONS = 200
 
-df_k = pd.read_csv(FILE_K)
-df_s = pd.read_csv(FILE_S)
-
-ids_k = df_k[:N_ROWS][COL_CR_ID]
-ids_s = df_s[:N_ROWS][COL_CR_ID]
-
-common_ids = set(ids_k) & set(ids_s)
-
-assert ids_k.equals(ids_s)
-assert len(common_ids) == N_EXPECTED_ANNOTATIONS
+N_RESAMPLES = 1000
 
 
 # ============ processing steps ============ #
+# cached, so that they only run once rather than on every interaction
 
-def resolve_annotations(annotations):
-    """Clinical Regex appears to provide the data in a denormalized format;
-       multiple annotations seem to occur sometimes for a given id."""
-
-    if len(annotations) <= 0:
-        return annotations
+@st.cache(allow_output_mutation=True)
+def load_annotations(annotators=ANNOTATORS):
+    return {name: read_cr_data(path,
+                               columns=[COL_CR_ID, COL_CR_TEXT],
+                               validate=False)
+            for name, path in annotators.items()}
 
-    unique = set(annotations)
 
-    if len(unique) == 1:
-        return list(annotations)[0]
+@st.cache(allow_output_mutation=True)
+def compute_agreement(annotators=ANNOTATORS, labels=LABELS, n_rows=N_ROWS):
+    frames = load_annotations(annotators)
 
-    elif unique == {0, 1}:
-        return 1
+    ids = [df[:n_rows][COL_CR_ID] for df in frames.values()]
 
-    else:
-        raise ValueError('Resolution of annotations unclear/undefined.',
-                         annotations)
+    assert all(ids_.equals(ids[0]) for ids_ in ids)
 
+    common_ids = set(ids[0])
 
-def get_annotation_values(df,
-                          COL_ID=COL_CR_ID,
-                          COL_L1=COL_CR_L1_ANNOTATION,
-                          COL_L2=COL_CR_L2_ANNOTATION,
-                          COL_TEXT=COL_CR_TEXT):
-    return df.groupby(COL_ID)\
-             .agg({COL_L1: resolve_annotations,
-                   COL_L2: resolve_annotations,
-                   COL_TEXT: list})\
-             .reset_index()
+    assert len(common_ids) == N_EXPECTED_ANNOTATIONS
 
+    return agreement(frames, labels, COL_CR_ID, common_ids, N_RESAMPLES)
 
-def rename_columns(df):
-    return df.rename(columns={COL_CR_L1_ANNOTATION: COL_CHILD,
-                              COL_CR_L2_ANNOTATION: COL_SPOUSE})
 
+@st.cache
+def get_text_df(annotator_1, value_1, annotator_2, value_2, label):
+    result = compute_agreement()
+    ratings = result.ratings
 
-def select_common_rows(df,
-                       ids=common_ids,
-                       COL_ID=COL_CR_ID):
-    """Select the rows annotated by both annotators."""
-    return df[df[COL_ID].isin(ids)]
-
-# =========================================== #
-
-df_k = df_k.pipe(get_full_cr_data)\
-           .pipe(get_annotation_values)\
-           .pipe(rename_columns)\
-           .pipe(select_common_rows)
-
-df_s = df_s.pipe(get_full_cr_data)\
-           .pipe(get_annotation_values)\
-           .pipe(rename_columns)\
-           .pipe(select_common_rows)
-
-df_both = df_k.merge(df_s,
-                     on=COL_CR_ID,
-                     suffixes=('_khuyen', '_sandra')
-                    ).drop(columns=['text_khuyen', 'text_sandra'])
+    a = ratings.annotators.index(annotator_1)
+    b = ratings.annotators.index(annotator_2)
+    l = ratings.labels.index(label)
 
-df_value_counts = df_both.drop(columns=[COL_CR_ID])\
-                         .apply(pd.Series.value_counts)\
-                         .fillna(0)
+    values = np.array(ratings.categories)[ratings.codes[:, [a, b], l]]
+    selected = np.array(ratings.ids)[(values[:, 0] == value_1) &
+                                     (values[:, 1] == value_2)]
+    df = load_annotations()[annotator_1]
 
-kappa_cols = ANNOTATION_COLS[:] 
-kappa_values = {col: cohen_kappa_score(df_k[col], df_s[col])
-                for col in kappa_cols}
+    # the first annotator's texts in theory are the same as the others'
+    #   it turns out this is not exactly the case
+    #     (if you look carefully, you can find an id where the
+    #      texts differ between files),
+    #   but we'll say this is good enough for here for now
+    return df[df[COL_CR_ID].isin(selected)][[COL_CR_ID, COL_CR_TEXT]]
 
-annotation_values = list(set(df_k[COL_CHILD]) |
-                         set(df_s[COL_CHILD]) |
-                         set(df_k[COL_SPOUSE]) |
-                         set(df_s[COL_SPOUSE]))
+# ============================================ #
 
-cm_child = confusion_matrix(df_k[COL_CHILD],
-                            df_s[COL_CHILD])
+result = compute_agreement()
+annotators = result.ratings.annotators
+annotation_values = result.ratings.categories
 
-cm_spouse = confusion_matrix(df_k[COL_SPOUSE],
-                             df_s[COL_SPOUSE])
+annotator_1 = st.sidebar.selectbox('Annotator 1', options=annotators, index=0)
+annotator_2 = st.sidebar.selectbox('Annotator 2', options=annotators,
+                                   index=min(1, len(annotators) - 1))
+value_1 = st.sidebar.selectbox(annotator_1, options=annotation_values)
+value_2 = st.sidebar.selectbox(annotator_2, options=annotation_values)
+label = st.sidebar.selectbox('Label', options=result.ratings.labels)
 
+st.sidebar.header('Kappa Values')
 
-@st.cache
-def get_text_df(k, s, col):
-    selected = (df_k[col] == k) & (df_s[col] == s)
-    cols_keep = [COL_CR_ID, COL_CR_TEXT]
+st.sidebar.write(result.kappas)
 
-    # df_k in theory should give the same texts as df_s
-    #   it turns out this is not exactly the case
-    #     (if you look carefully, you can find an id where the
-    #      text in df_k is different from the one in df_s),
-    #   but we'll say this is good enough for here for now
-    return df_k[selected][cols_keep]
+st.sidebar.header('Value Counts')
+st.sidebar.text("rows : {}\n"
+                "columns : {}\n\n"
+                "0 : 'true negative'\n"
+                "1 : 'true positive'\n"
+                "5 : 'ambiguous'\n"
+                "9 : 'false positive'".format(annotator_1, annotator_2))
 
-# ============================================ # 
-value_k = st.sidebar.selectbox('Khuyen', options=annotation_values)
-value_s = st.sidebar.selectbox('Sandra', options=annotation_values)
-label = st.sidebar.selectbox('Label', options=ANNOTATION_COLS)
+for label_ in result.ratings.labels:
+    st.sidebar.subheader(label_.capitalize())
 
-st.sidebar.header('Kappa Values')
+    key = (label_, annotator_1, annotator_2)
 
-st.sidebar.write(pd.DataFrame(kappa_values, index=['cohen_kappa']))
+    if key in result.confusion:
+        st.sidebar.dataframe(result.confusion[key])
 
-st.sidebar.header('Value Counts')
-st.sidebar.text("rows : Khuyen\n"\
-                "columns : Sandra\n\n"\
-                "0 : 'true negative'\n"\
-                "1 : 'true positive'\n"\
-                "5 : 'ambiguous'\n"\
-                "9 : 'false positive'")
-st.sidebar.subheader('Child')
-st.sidebar.dataframe(pd.DataFrame(cm_child,
-                          columns=annotation_values,
-                          index=annotation_values)
-                          )
-
-st.sidebar.subheader('Spouse')
-st.sidebar.dataframe(pd.DataFrame(cm_spouse,
-                          columns=annotation_values,
-                          index=annotation_values)
-                          )
+    elif (label_, annotator_2, annotator_1) in result.confusion:
+        st.sidebar.dataframe(result.confusion[(label_, annotator_2, annotator_1)].T)
 
 st.sidebar.write("The following HADM_IDs did not have matching texts between Khuyen and Sandra's files.")
 st.sidebar.write([143414, 163321, 182863, 193351])
 
 st.header('Example Texts')
 
-if value_k is not None and value_s is not None:
-    text_df = get_text_df(value_k,
-                          value_s,
+if value_1 is not None and value_2 is not None:
+    text_df = get_text_df(annotator_1,
+                          value_1,
+                          annotator_2,
+                          value_2,
                           label)
 
-    text_id_options = text_df[COL_CR_ID].tolist()
+    text_id_options = text_df[COL_CR_ID].drop_duplicates().tolist()
 
     if len(text_id_options) > 0:
         text_id = st.selectbox('HADM_ID', options=text_id_options)
@@ -1,5 +1,20 @@
-neuroner --train_model=False\
-         --use_pretrained_model=True\
-         --dataset_text_folder=data/processed\
-         --pretrained_model_folder=models/PM2018_NeuroNER_models/trained_models/lim_model\
-         --output_folder=data/output_PM2018_NeuroNER_models/lim_model
\ No newline at end of file
+# usage: scripts/run_lim.sh [shard folder ...]
+#
+# Runs the LIM model on each shard folder (by default every shard in
+# data/processed/shards), writing the results of a shard to
+# data/output_PM2018_NeuroNER_models/lim_model/shards/<shard>/, where
+# cleaning.caregivers.neuroner.load_flags reads them. To only run the shards
+# whose notes changed since they were last run, pass those printed by
+#     python -m cleaning.caregivers.neuroner
+if [ $# -eq 0 ]; then
+    set -- data/processed/shards/*/
+fi
+
+for shard in "$@"; do
+    neuroner --train_model=False\
+             --use_pretrained_model=True\
+             --dataset_text_folder="$shard"\
+             --pretrained_model_folder=models/PM2018_NeuroNER_models/trained_models/lim_model\
+             --output_folder=data/output_PM2018_NeuroNER_models/lim_model/shards/$(basename "$shard")\
+        || exit 1
+done
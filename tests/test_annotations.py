@@ -0,0 +1,39 @@
+import pandas as pd
+from cleaning.caregivers.annotations import process
+
+
+def test_process():
+    df_annotations = pd.DataFrame({
+        'id': [1, 1, 2, 3, 4, 5],
+        'L1_annotation': pd.array([1, 1, 9, 0, 5, None], dtype='Int8'),
+        'L2_annotation': pd.array([1, 1, 0, 1, 0, 0], dtype='Int8'),
+    })
+    df_original = pd.DataFrame({'HADM_ID': [5, 4, 3, 2, 1, 6]})
+
+    df = process(df_annotations, df_original)
+
+    assert df['HADM_ID'].tolist() == [5, 4, 3, 2, 1, 6]
+    assert df['ANNOTATION_CHILD'].tolist() ==\
+        [False, True, False, False, True, False]
+    assert df['ANNOTATION_BOTH'].tolist() ==\
+        [False, False, False, False, True, False]
+    assert df['ANNOTATION'].tolist() ==\
+        ['NEITHER', 'CHILD', 'SPOUSE', 'NEITHER', 'BOTH', 'NEITHER']
+    assert df['ANNOTATION'].cat.categories.tolist() ==\
+        ['BOTH', 'CHILD', 'NEITHER', 'SPOUSE']
+
+
+def test_process_more_labels():
+    df_annotations = pd.DataFrame({'id': [1, 2, 3],
+                                   'L1_annotation': [1, 0, 1],
+                                   'L2_annotation': [0, 0, 1],
+                                   'L3_annotation': [1, 1, 1]})
+    labels = {'L1_annotation': 'ANNOTATION_CHILD',
+              'L2_annotation': 'ANNOTATION_SPOUSE',
+              'L3_annotation': 'ANNOTATION_SIBLING'}
+
+    df = process(df_annotations, pd.DataFrame({'HADM_ID': [1, 2, 3]}), labels)
+
+    assert df['ANNOTATION_SIBLING'].all()
+    assert df['ANNOTATION'].tolist() ==\
+        ['CHILD+SIBLING', 'SIBLING', 'CHILD+SPOUSE+SIBLING']
@@ -0,0 +1,68 @@
+import json
+import pandas as pd
+import pytest
+from cleaning.caregivers import build
+from cleaning.caregivers.build import Artifact
+
+
+def count_rows(df, column):
+    return df.groupby(column).size().to_frame("N")
+
+
+def column_sum(df, column):
+    return df[[column]].sum().to_frame("SUM")
+
+
+ARTIFACTS = {
+    "tables/counts": Artifact(count_rows, {"column": "ANNOTATION"}),
+    "tables/sum": Artifact(column_sum, {"column": "AGE"})
+}
+
+
+@pytest.fixture
+def load_data():
+    calls = []
+
+    def load():
+        calls.append(1)
+
+        return pd.DataFrame({"ANNOTATION": ["CHILD", "SPOUSE", "CHILD"],
+                             "AGE": [60, 70, 80]})
+
+    load.calls = calls
+
+    return load
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_build(tmp_path, load_data, workers):
+    built = build.build(ARTIFACTS, load_data, "data-1", tmp_path, workers)
+
+    assert built == ["tables/counts", "tables/sum"]
+    assert pd.read_csv(tmp_path / "tables/counts.csv")["N"].tolist() == [2, 1]
+    assert pd.read_csv(tmp_path / "tables/sum.csv")["SUM"].tolist() == [210]
+    assert set(json.loads((tmp_path / "manifest.json").read_text())) ==\
+        set(ARTIFACTS)
+
+    # up to date: the data is not even loaded
+    assert build.build(ARTIFACTS, load_data, "data-1", tmp_path, workers) == []
+    assert len(load_data.calls) == 1
+
+
+def test_build_outdated(tmp_path, load_data):
+    build.build(ARTIFACTS, load_data, "data-1", tmp_path)
+
+    changed = dict(ARTIFACTS, **{"tables/sum": Artifact(column_sum,
+                                                        {"column": "ANNOTATION"})})
+
+    assert build.build(changed, load_data, "data-1", tmp_path) == ["tables/sum"]
+
+    (tmp_path / "tables/counts.csv").unlink()
+
+    assert build.outdated(changed, "data-1", tmp_path) == \
+        {"tables/counts": build.artifact_key("tables/counts",
+                                             changed["tables/counts"],
+                                             "data-1")}
+    assert set(build.outdated(changed, "data-2", tmp_path)) == set(changed)
+    assert build.build(changed, load_data, "data-1", tmp_path, force=True) ==\
+        ["tables/counts", "tables/sum"]
@@ -0,0 +1,98 @@
+import gzip
+import os
+import pandas as pd
+import pytest
+from cleaning.cache import content_hash, load_cached
+
+
+CSV = 'ROW_ID,SUBJECT_ID,ADMITTIME\n'\
+      '1,10,2100-01-01 00:00:00\n'\
+      '2,11,2100-01-02 12:30:00\n'
+
+
+@pytest.fixture
+def gzipped_csv(tmp_path):
+    path = tmp_path / 'ADMISSIONS.csv.gz'
+
+    with gzip.open(path, 'wt') as file:
+        file.write(CSV)
+
+    return path
+
+
+def counting_reader(calls):
+    def read(path):
+        calls.append(path)
+        return pd.read_csv(path, parse_dates=['ADMITTIME'])
+
+    return read
+
+
+def test_load_cached_reuses_parquet(gzipped_csv, tmp_path):
+    calls = []
+    read = counting_reader(calls)
+    cache_dir = tmp_path / 'cache'
+
+    first = load_cached(gzipped_csv, read, 'mimic', cache_dir=cache_dir)
+    second = load_cached(gzipped_csv, read, 'mimic', cache_dir=cache_dir)
+
+    assert len(calls) == 1
+    pd.testing.assert_frame_equal(first, second, check_index_type=False)
+    assert len(list((cache_dir / 'mimic').glob('*.parquet'))) == 1
+
+
+def test_load_cached_invalidates_on_change(gzipped_csv, tmp_path):
+    calls = []
+    read = counting_reader(calls)
+    cache_dir = tmp_path / 'cache'
+
+    load_cached(gzipped_csv, read, 'mimic', cache_dir=cache_dir)
+
+    with gzip.open(gzipped_csv, 'at') as file:
+        file.write('3,12,2100-01-03 00:00:00\n')
+
+    stat = gzipped_csv.stat()
+    os.utime(gzipped_csv, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    df = load_cached(gzipped_csv, read, 'mimic', cache_dir=cache_dir)
+
+    assert len(calls) == 2
+    assert len(df) == 3
+    assert len(list((cache_dir / 'mimic').glob('*.parquet'))) == 1
+
+
+def test_load_cached_invalidates_on_same_size_and_mtime(gzipped_csv, tmp_path):
+    calls = []
+    read = counting_reader(calls)
+    cache_dir = tmp_path / 'cache'
+
+    load_cached(gzipped_csv, read, 'mimic', cache_dir=cache_dir)
+
+    # rewritten as with `cp -p`: same size and modification time
+    stat = gzipped_csv.stat()
+    data = gzipped_csv.read_bytes()
+
+    with gzip.open(gzipped_csv, 'wt') as file:
+        file.write(CSV.replace('10,', '12,'))
+
+    assert gzipped_csv.stat().st_size == len(data)
+    os.utime(gzipped_csv, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    df = load_cached(gzipped_csv, read, 'mimic', cache_dir=cache_dir)
+
+    assert len(calls) == 2
+    assert df['SUBJECT_ID'].tolist() == [12, 11]
+
+
+def test_content_hash_of_large_files(tmp_path):
+    path = tmp_path / 'large.csv'
+    path.write_bytes(b'a' * 100)
+
+    first = content_hash(path, block=10)
+
+    # only the ends are hashed
+    path.write_bytes(b'a' * 50 + b'b' + b'a' * 49)
+    assert content_hash(path, block=10) == first
+
+    path.write_bytes(b'a' * 99 + b'b')
+    assert content_hash(path, block=10) != first
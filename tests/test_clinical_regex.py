@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+from cleaning.clinical_regex import (
+    get_full_cr_data,
+    has_only_one_annotation_value_per_id,
+    read_cr_data
+)
+
+
+def cr_export(rows):
+    return 'id,text,L1,L2,annotationValues,labels\n' +\
+        ''.join('{},"{}",[],[],"{}",{{}}\n'.format(id_, text,
+                                                   values.replace('"', '""'))
+                for id_, text, values in rows)
+
+
+@pytest.fixture
+def annotations(tmp_path):
+    path = tmp_path / 'annotations.csv'
+    path.write_text(cr_export([
+        (100, 'Wife at bedside.', '{"L1_annotation": 0, "L2_annotation": 1}'),
+        (100, 'Wife at bedside.', '{"L1_annotation": 0, "L2_annotation": 1}'),
+        (101, 'Son called.', '{"L1_annotation": 1, "L2_annotation": 9}'),
+        (102, 'No family.', '{"L1_annotation": 0}')
+    ]))
+
+    return path
+
+
+@pytest.mark.parametrize('chunksize', [None, 1])
+def test_read_cr_data(annotations, chunksize):
+    # 102 has no L2 value, which validation would reject
+    df = read_cr_data(annotations, chunksize=chunksize, validate=False)
+
+    assert df.columns.tolist() == ['id', 'L1_annotation', 'L2_annotation']
+    assert df['L1_annotation'].dtype == 'Int8'
+    assert df['L2_annotation'].tolist()[:3] == [1, 1, 9]
+    assert df['L2_annotation'].isna().tolist() == [False, False, False, True]
+
+
+def test_read_cr_data_keeps_columns(annotations):
+    df = read_cr_data(annotations, columns=['id', 'text'], validate=False)
+
+    assert df.columns.tolist() == ['id', 'text', 'L1_annotation',
+                                   'L2_annotation']
+
+
+def test_read_cr_data_validates(tmp_path):
+    path = tmp_path / 'annotations.csv'
+    path.write_text(cr_export([(100, 'a', '{"L1_annotation": 0}'),
+                               (100, 'a', '{"L1_annotation": 1}')]))
+
+    with pytest.raises(ValueError):
+        read_cr_data(path)
+
+    assert len(read_cr_data(path, validate=False)) == 2
+
+
+def test_read_cr_data_validates_missing_labels(annotations, tmp_path):
+    # a label that was never annotated for an id isn't taken as a negative
+    with pytest.raises(ValueError, match='Missing'):
+        read_cr_data(annotations)
+
+    path = tmp_path / 'complete.csv'
+    path.write_text(cr_export([(100, 'a', '{"L1_annotation": 0}'),
+                               (100, 'a', '{"L1_annotation": 0}'),
+                               (101, 'b', '{"L1_annotation": 1}')]))
+
+    assert read_cr_data(path)['L1_annotation'].tolist() == [0, 0, 1]
+
+
+def test_get_full_cr_data(annotations):
+    df_raw = pd.read_csv(annotations)
+    df = get_full_cr_data(df_raw)
+
+    assert 'annotationValues' not in df.columns
+    assert df['L1_annotation'].tolist() == [0, 0, 1, 0]
+    assert has_only_one_annotation_value_per_id(df_raw).tolist() ==\
+        [True, False]
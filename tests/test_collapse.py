@@ -0,0 +1,38 @@
+import pandas as pd
+from cleaning.caregivers.collapse import collapse, collapse_column, RULES
+
+
+def test_collapse():
+    df = pd.DataFrame({
+        'ETHNICITY': ['WHITE - RUSSIAN', 'ASIAN - CHINESE', 'UNABLE TO OBTAIN',
+                      None],
+        'MARITAL_STATUS': ['MARRIED', 'WIDOWED', None, 'SINGLE'],
+        'LANGUAGE': ['ENGL', 'CANT', None, 'SPAN'],
+        'DISCHARGE_LOCATION': ['HOSPICE-HOME', 'HOME HEALTH CARE', 'ICF',
+                               'DEAD/EXPIRED']
+    }).astype('category')
+
+    df = collapse(df)
+
+    assert df['ETHNICITY'].tolist()[:3] ==\
+        ['(NON-HISPANIC) WHITE', 'OTHER', 'UNKNOWN/NOT SPECIFIED']
+    assert pd.isna(df['ETHNICITY'][3])
+    assert df['MARITAL_STATUS'].tolist() ==\
+        ['MARRIED', 'NOT MARRIED', 'UNKNOWN/NOT SPECIFIED', 'NOT MARRIED']
+    assert df['LANGUAGE'].tolist() == ['ENGL', 'OTHER', 'OTHER', 'SPAN']
+    assert df['DISCHARGE_LOCATION'].tolist() ==\
+        ['FACILITY', 'HOME', 'FACILITY', 'DEATH']
+
+    assert (df.dtypes == 'category').all()
+    assert df['DISCHARGE_LOCATION'].cat.categories.tolist() ==\
+        ['DEATH', 'FACILITY', 'HOME']
+
+
+def test_collapse_column_only_used_categories():
+    s = pd.Series(['MARRIED', 'SINGLE'],
+                  dtype=pd.CategoricalDtype(['MARRIED', 'SINGLE', 'WIDOWED']))
+
+    s = collapse_column(s, RULES['MARITAL_STATUS'])
+
+    assert s.cat.categories.tolist() == ['MARRIED', 'NOT MARRIED']
+    assert s.cat.codes.dtype == 'int8'
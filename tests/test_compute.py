@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+from cleaning.caregivers.compute import readmission, readmissions
+
+
+T = pd.Timestamp
+
+
+def admissions():
+    # subject 1: three admissions, out of order, the second exactly 30 days
+    #            after the first's discharge
+    # subject 2: a single admission
+    # subject 4: the next admission one hour past 30 days after discharge
+    return pd.DataFrame({
+        'SUBJECT_ID': [1, 2, 1, 4, 1, 4],
+        'HADM_ID': [103, 201, 101, 401, 102, 402],
+        'ADMITTIME': [T('2100-06-01'), T('2100-01-01'), T('2100-01-01'),
+                      T('2100-01-01'), T('2100-02-04'),
+                      T('2100-02-01 01:00')],
+        'DISCHTIME': [T('2100-06-03'), T('2100-01-02'), T('2100-01-05'),
+                      T('2100-01-02'), T('2100-02-10'), T('2100-02-03')]
+    })
+
+
+def test_readmissions():
+    df = readmissions(admissions()).set_index('HADM_ID')
+
+    assert df.index.tolist() == [101, 102, 103, 201, 401, 402]
+    assert df['HAS_READMISSION'].tolist() ==\
+        [True, True, False, False, True, False]
+    np.testing.assert_allclose(df['DAYS_TO_READMISSION'],
+                               [30, 111, np.nan, np.nan, 30 + 1 / 24, np.nan])
+    assert df['READMISSION_30D'].tolist() ==\
+        [True, False, False, False, False, False]
+    assert df['READMISSION_90D'].tolist() ==\
+        [True, False, False, False, True, False]
+    assert df['READMISSION_365D'].tolist() ==\
+        [True, True, False, False, True, False]
+    assert df['N_READMISSIONS'].tolist() == [2, 1, 0, 0, 1, 0]
+
+
+def test_readmission_only_counts_icu_admissions():
+    tables = {
+        'ADMISSIONS': admissions(),
+        # admission 102 has no ICU stay, admission 101 has two
+        'ICUSTAYS': pd.DataFrame({'SUBJECT_ID': [1, 1, 1, 2, 4, 4],
+                                  'HADM_ID': [101, 101, 103, 201, 401, 402],
+                                  'ICUSTAY_ID': [1, 2, 3, 4, 5, 6]})
+    }
+    df = pd.DataFrame({'SUBJECT_ID': [1, 1, 2],
+                       'HADM_ID': [101, 101, 201],
+                       'ICUSTAY_ID': [1, 2, 4]})
+
+    df = readmission(df, tables)
+
+    assert df['ICUSTAY_ID'].tolist() == [1, 2, 4]
+    assert df['HAS_READMISSION'].tolist() == [True, True, False]
+    np.testing.assert_allclose(df['DAYS_TO_READMISSION'],
+                               [147, 147, np.nan])
+    assert df['N_READMISSIONS'].tolist() == [1, 1, 0]
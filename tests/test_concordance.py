@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+from cleaning.concordance import concordance, contexts, write_concordance
+from cleaning.dictionary_matcher import build_automaton
+from cleaning.text_preprocessing import preprocess_text
+
+
+SPOUSE_REGEX = r'(ex(-?))?(wi(f|v)e|husband)(\'?e?s?\'?)'
+
+
+@pytest.fixture
+def notes():
+    return pd.DataFrame({'ROW_ID': [1, 2, 3],
+                         'TEXT': ['Met with pt and his WIFE today, wife '
+                                  'updated on plan.',
+                                  None,
+                                  'Husband at bedside']})
+
+
+def test_contexts():
+    text = 'a b  c wife d e\nf'
+
+    assert contexts(text, [(7, 11)], 2) == [('b c', 'd e')]
+    assert contexts(text, [(0, 1), (16, 17)], 8) == [('', 'b c wife d e f'),
+                                                      ('a b c wife d e', '')]
+    # a match inside a token leaves the rest of the token out
+    assert contexts('exwife xx', [(2, 6)], 1) == [('', 'xx')]
+
+
+def test_concordance(notes):
+    df = concordance(notes, SPOUSE_REGEX, 3, preprocess=preprocess_text)
+
+    assert df['ROW_ID'].tolist() == [1, 1, 3]
+    assert df['MATCH'].tolist() == ['wife', 'wife', 'husband']
+    # close matches each get their own context
+    assert df['CONTEXT_BEFORE'].tolist() == ['pt and his', 'his wife today', '']
+    assert df['CONTEXT_AFTER'].tolist() == ['today wife updated',
+                                            'updated on plan',
+                                            'at bedside']
+
+
+def test_concordance_with_automaton(notes):
+    automaton = build_automaton({'SPOUSE': ['wife', 'husband']})
+
+    df = concordance(notes, automaton, 1)
+
+    assert df['MATCH'].tolist() == ['WIFE', 'wife', 'Husband']
+    assert df['CONTEXT_AFTER'].tolist() == ['today,', 'updated', 'at']
+
+
+def test_write_concordance(notes, tmp_path):
+    path = tmp_path / 'concordance.parquet'
+    batches = [notes.iloc[:2], notes.iloc[2:2], notes.iloc[2:]]
+
+    assert write_concordance(path, batches, SPOUSE_REGEX, 3,
+                             preprocess=preprocess_text) == 3
+
+    assert pd.read_parquet(path).equals(
+        concordance(notes, SPOUSE_REGEX, 3, preprocess=preprocess_text))
@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+from cleaning.dictionary_matcher import (
+    build_automaton,
+    find_matches,
+    match_batches,
+    match_noteevents
+)
+
+
+@pytest.fixture
+def automaton(tmp_path):
+    path = tmp_path / 'spouse.txt'
+    path.write_text('wife,ex,ex-wife,significant other,husband’s')
+
+    return build_automaton({'SPOUSE': path,
+                            'CHILD': ['son', 'daughter', 'step-son']})
+
+
+def test_find_matches(automaton):
+    text = 'Pt\'s Wife and SON at bedside; ex-wife called.\nHusband\'s '\
+           'significant\nother. Person, wifes, sonny, next.'
+
+    matches = find_matches(automaton, text)
+
+    assert [text[start:end] for start, end, _, _ in matches] ==\
+        ['Wife', 'SON', 'ex-wife', 'Husband\'s', 'significant\nother']
+    assert matches[0] == (5, 9, 'wife', 'SPOUSE')
+    assert matches[1][2:] == ('son', 'CHILD')
+
+
+def test_find_overlapping_matches(automaton):
+    matches = find_matches(automaton, 'ex-wife, step-son', overlapping=True)
+
+    assert [term for _, _, term, _ in matches] ==\
+        ['ex', 'ex-wife', 'wife', 'step-son', 'son']
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_match_batches(automaton, workers):
+    batches = [pd.DataFrame({'ROW_ID': [1, 2], 'TEXT': ['wife', None]}),
+               pd.DataFrame({'ROW_ID': [3], 'TEXT': ['son, daughter']})]
+
+    df = match_batches(automaton, batches, workers=workers)
+
+    assert df.values.tolist() == [[1, 0, 4, 'wife', 'SPOUSE'],
+                                  [3, 0, 3, 'son', 'CHILD'],
+                                  [3, 5, 13, 'daughter', 'CHILD']]
+
+
+def test_match_noteevents(automaton, tmp_path):
+    path = tmp_path / 'NOTEEVENTS.csv'
+    path.write_text('ROW_ID,HADM_ID,CATEGORY,TEXT\n'
+                    '1,100,Nursing/other,"Wife at bedside."\n'
+                    '2,100,Radiology,"No son."\n')
+
+    df = match_noteevents(automaton, path, categories=['Nursing/other'])
+
+    assert df['ROW_ID'].tolist() == [1]
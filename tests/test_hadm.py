@@ -0,0 +1,53 @@
+import pandas as pd
+from cleaning.caregivers.hadm import icu_features, icu_index
+
+
+T = pd.Timestamp
+
+
+def icu_stays():
+    # admission 1: tied INTIMEs and OUTTIMEs, and NaT in both
+    # admission 2: tied OUTTIMEs, rows out of order
+    # admission 3: a single ICU stay
+    return pd.DataFrame({
+        'HADM_ID': [2, 1, 1, 1, 2, 2, 3],
+        'INTIME': [T('2100-01-02'), pd.NaT, T('2100-01-01'), T('2100-01-01'),
+                   T('2100-01-02'), T('2100-01-01 12:00'), T('2100-03-01')],
+        'OUTTIME': [T('2100-01-05'), T('2100-01-09'), pd.NaT, T('2100-01-09'),
+                    T('2100-01-05'), T('2100-01-03'), T('2100-03-02')],
+        'SOFA': [1, 2, 3, 4, 5, 6, 7],
+        'VENT_TIME_FROM_ICU': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0],
+        'VENT_FIRST_48_ICU': [True, False, True, False, True, False, True],
+        'MORTALITY_6MO_FROM_ICU_OUT': [False, True, False, False, True, False,
+                                       True]
+    }, index=[10, 11, 12, 13, 14, 15, 16])
+
+
+def test_icu_index_matches_idxmin_idxmax():
+    df = icu_stays()
+
+    index = icu_index(df)
+
+    pd.testing.assert_series_equal(
+        index['FIRST'],
+        df.groupby('HADM_ID')['INTIME'].idxmin(),
+        check_names=False)
+    pd.testing.assert_series_equal(
+        index['LAST'],
+        df.groupby('HADM_ID')['OUTTIME'].idxmax(),
+        check_names=False)
+
+    # ties resolve to the first row, as idxmin/idxmax do
+    assert index.loc[1].tolist() == [12, 11]
+    assert index.loc[2].tolist() == [15, 10]
+
+
+def test_icu_features():
+    df = icu_stays()
+
+    df_features = icu_features(df)
+
+    assert df_features['HADM_ID'].tolist() == [1, 2, 3]
+    assert df_features['SOFA'].tolist() == [3, 6, 7]
+    assert df_features['MORTALITY_6MO_FROM_ICU_OUT'].tolist() ==\
+        [True, False, True]
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+from cleaning.iaa import (
+    agreement,
+    bootstrap,
+    cohen_kappa,
+    encode_ratings,
+    fleiss_kappa,
+    resolve_annotations
+)
+
+
+LABELS = {'L1_annotation': 'child', 'L2_annotation': 'spouse'}
+
+
+def annotations(ids, child, spouse):
+    return pd.DataFrame({'id': ids,
+                         'L1_annotation': pd.array(child, dtype='Int8'),
+                         'L2_annotation': pd.array(spouse, dtype='Int8')})
+
+
+@pytest.fixture
+def frames():
+    return {'a': annotations([1, 2, 3, 4, 4, 5], [1, 0, 0, 9, 9, 1], [0, 0, 1, 1, 1, 0]),
+            'b': annotations([1, 2, 3, 4, 6], [1, 0, 1, 9, 1], [0, 1, 1, 1, 0]),
+            'c': annotations([1, 2, 3, 4], [1, 0, 1, 0], [0, 0, 1, 1])}
+
+
+def test_resolve_annotations():
+    df = annotations([1, 1, 2, 2], [0, 1, 9, 9], [5, 5, 0, 0])
+
+    assert resolve_annotations(df, LABELS).values.tolist() == [[1, 5], [9, 0]]
+
+    with pytest.raises(ValueError):
+        resolve_annotations(annotations([1, 1], [1, 9], [0, 0]), LABELS)
+
+
+def test_encode_ratings(frames):
+    ratings = encode_ratings(frames, LABELS)
+
+    assert ratings.ids == [1, 2, 3, 4]
+    assert ratings.categories == [0, 1, 9]
+    assert ratings.codes.shape == (4, 3, 2)
+    assert ratings.codes[3, :, 0].tolist() == [2, 2, 0]
+
+
+def test_cohen_kappa(frames):
+    ratings = encode_ratings(frames, LABELS)
+    kappas = cohen_kappa(ratings.codes, len(ratings.categories))
+
+    # pairs (a, b), (a, c), (b, c)
+    assert kappas.shape == (3, 2)
+    # child, a vs b: observed 3/4, expected (2*1 + 1*2 + 1*1) / 16
+    observed = 3 / 4
+    expected = (2 * 1 + 1 * 2 + 1 * 1) / 16
+    assert kappas[0, 0] == pytest.approx((observed - expected) / (1 - expected))
+    # spouse, b vs c: observed 3/4, expected (1*2 + 3*2) / 16
+    assert kappas[2, 1] == pytest.approx(0.5)
+
+
+def test_fleiss_kappa():
+    # perfect agreement, and agreement no better than chance
+    codes = np.array([[[0, 0], [0, 1]],
+                      [[1, 1], [1, 0]]]).transpose(0, 2, 1)
+
+    assert fleiss_kappa(codes, 2).tolist() == [1.0, -1.0]
+
+
+def test_bootstrap(frames):
+    ratings = encode_ratings(frames, LABELS)
+
+    samples = bootstrap(fleiss_kappa, ratings.codes, 3, n_resamples=10,
+                        batch_size=3)
+
+    assert samples.shape == (10, 2)
+    # batching does not change the resamples
+    np.testing.assert_array_equal(samples,
+                                  bootstrap(fleiss_kappa, ratings.codes, 3,
+                                            n_resamples=10))
+
+
+def test_agreement(frames):
+    result = agreement(frames, LABELS, ids={1, 2, 3}, n_resamples=20)
+
+    assert result.ratings.ids == [1, 2, 3]
+    assert len(result.kappas) == 3 * 2 + 2
+    assert (result.kappas['CI_LOWER'] <= result.kappas['CI_UPPER']).all()
+    assert result.confusion[('child', 'a', 'b')].values.tolist() ==\
+        [[1, 1], [0, 1]]
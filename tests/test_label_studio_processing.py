@@ -1,7 +1,11 @@
+import json
 import logging
+import shutil
 import pytest
 from pathlib import Path
-from cleaning.label_studio_processing import process_files
+from cleaning import label_studio_processing
+from cleaning.label_studio_processing import parse_files, process_files, \
+                                             process_directory
 
 
 PATH = Path(__file__).resolve()
@@ -36,3 +40,120 @@ def test_process_files_long_annotation_warning(long_annotation, caplog):
 
     assert 'Very long annotation string encountered, skipping...'\
         in caplog.text
+
+
+def test_parse_files_stores_note_text_once(normal_file, long_annotation):
+    df_spans, df_notes = parse_files([normal_file, long_annotation])
+
+    assert df_notes['LS_TASK_ID'].tolist() == ['101', '102']
+    assert 'LS_NOTE_TEXT' not in df_spans.columns
+    assert df_spans['LS_TASK_ID'].tolist() == ['101', '101', '101', '102']
+    assert df_spans['LS_LABEL'].tolist() == ['Spouse', 'Child',
+                                             'Family meeting', 'Child']
+
+
+def test_process_directory_is_incremental(normal_file, long_annotation,
+                                          tmp_path, monkeypatch):
+    data_dir = tmp_path / 'raw'
+    output_dir = tmp_path / 'interim'
+    data_dir.mkdir()
+    shutil.copy(normal_file, data_dir)
+
+    parsed = []
+    parse_file = label_studio_processing.parse_file
+
+    def counting_parse_file(file_path):
+        parsed.append(Path(file_path).name)
+        return parse_file(file_path)
+
+    monkeypatch.setattr(label_studio_processing, 'parse_file',
+                        counting_parse_file)
+
+    process_directory(data_dir, output_dir)
+    shutil.copy(long_annotation, data_dir)
+    df_spans, df_notes = process_directory(data_dir, output_dir)
+
+    assert parsed == [normal_file.name, long_annotation.name]
+    assert len(df_spans) == 4
+    assert len(df_notes) == 2
+    assert (output_dir / 'ls-annotations.parquet').is_file()
+
+    (data_dir / normal_file.name).unlink()
+    df_spans, df_notes = process_directory(data_dir, output_dir)
+
+    assert len(parsed) == 2
+    assert df_notes['LS_TASK_ID'].tolist() == ['102']
+    assert len(list((output_dir / 'shards').glob('*.parquet'))) == 2
+
+
+def test_process_directory_task_id_from_file_name(normal_file, tmp_path):
+    data_dir = tmp_path / 'raw'
+    data_dir.mkdir()
+    shutil.copy(normal_file, data_dir)
+
+    # an export without an id is named after its task
+    ls_data = json.loads(normal_file.read_text())
+    del ls_data['id']
+    (data_dir / '205.json').write_text(json.dumps(ls_data))
+
+    df_spans, df_notes = process_directory(data_dir, tmp_path / 'interim')
+
+    assert df_notes['LS_TASK_ID'].tolist() == ['205', '101']
+    assert set(df_spans['LS_TASK_ID']) == {'101', '205'}
+
+
+def test_process_files_task_in_several_files(normal_file, tmp_path):
+    # a re-export of the same task, with one span fewer
+    ls_data = json.loads(normal_file.read_text())
+    ls_data['completions'][0]['result'].pop()
+    ls_data['data']['text'] += ' Edited.'
+    re_export = tmp_path / 're-export.json'
+    re_export.write_text(json.dumps(ls_data))
+
+    df = process_files([normal_file, re_export])
+
+    # each span is joined with the note of its own file only
+    assert len(df) == 5
+    assert df['LS_NOTE_TEXT'].str.endswith(' Edited.').tolist() ==\
+        [False] * 3 + [True] * 2
+
+
+def test_process_directory_task_in_several_files(normal_file, tmp_path):
+    data_dir = tmp_path / 'raw'
+    data_dir.mkdir()
+    shutil.copy(normal_file, data_dir / 'annotator-1.json')
+    shutil.copy(normal_file, data_dir / 'annotator-2.json')
+
+    df_spans, df_notes = process_directory(data_dir, tmp_path / 'interim')
+
+    assert df_notes['LS_FILE'].tolist() == ['annotator-1.json',
+                                            'annotator-2.json']
+    assert df_notes['LS_TASK_ID'].tolist() == ['101', '101']
+    assert df_spans.groupby('LS_FILE').size().tolist() == [3, 3]
+
+
+def test_process_directory_rebuilds_interrupted_shards(normal_file, tmp_path,
+                                                       monkeypatch):
+    data_dir = tmp_path / 'raw'
+    output_dir = tmp_path / 'interim'
+    data_dir.mkdir()
+    shutil.copy(normal_file, data_dir)
+
+    def interrupted_to_parquet(self, path, **kwargs):
+        Path(path).write_bytes(b'PAR1')
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as patch:
+        patch.setattr('pandas.DataFrame.to_parquet', interrupted_to_parquet)
+
+        with pytest.raises(KeyboardInterrupt):
+            process_directory(data_dir, output_dir)
+
+    # only the temporary file was truncated, so the shard is parsed again
+    assert list((output_dir / 'shards').glob('*.parquet')) == []
+    assert not (output_dir / 'manifest.json').is_file()
+
+    df_spans, df_notes = process_directory(data_dir, output_dir)
+
+    assert len(df_spans) == 3
+    assert len(df_notes) == 1
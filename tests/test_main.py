@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+import pytest
+from cleaning.caregivers import main
+from cleaning.caregivers.main import (
+    KEYS,
+    aggregate_hadm,
+    aggregate_notes,
+    merge_sources
+)
+from cleaning.caregivers.schema import ELIXHAUSER
+from cleaning.utils import aggregate, squish
+
+
+def test_aggregate_notes():
+    df_annotations = pd.DataFrame({
+        'ROW_ID': [1, 2, 3, 4, 5],
+        'SUBJECT_ID': [10, 10, 10, 20, 30],
+        'HADM_ID': [100, 100, 100, 200, 300],
+        'TEXT_HASH': ['a', 'b', 'a', 'c', 'd'],
+        'ANNOTATION_CHILD': [True, True, True, False, False],
+        'ANNOTATION_SPOUSE': [False, False, False, False, True],
+        'ANNOTATION_BOTH': [False] * 5,
+        'ANNOTATION_ANY': [True, True, True, False, True],
+        'ANNOTATION': pd.Categorical(['CHILD', 'CHILD', 'CHILD', 'NEITHER',
+                                      'SPOUSE'])
+    })
+    # no NeuroNER results for note 5, so admission 300 has no notes left
+    df_neuroner = pd.DataFrame({'ROW_ID': [1, 2, 3, 4],
+                                'CAR': [False, True, False, False],
+                                'LIM': [False, False, False, False]})
+
+    df = aggregate_notes(df_annotations, df_neuroner)
+
+    assert df['HADM_ID'].tolist() == [100, 200]
+    assert df['N_TEXTS'].tolist() == [2, 1]
+    assert df['IDENTIFIED_CONV_GOC'].tolist() == [True, False]
+    assert df['IDENTIFIED_CONV_LIM'].tolist() == [False, False]
+    assert df['ANNOTATION'].tolist() == ['CHILD', 'NEITHER']
+
+
+T = pd.Timestamp
+
+
+@pytest.fixture
+def cohort():
+    """Notes, NeuroNER flags and MIMIC rows (one per ventilation event, or
+    per ICU stay without one, as after the compute stages) of:
+        * admission 100: three notes (two distinct texts), and two ICU
+          stays, the first with two ventilation events,
+        * admission 200: one note, one ICU stay with one ventilation event,
+        * admission 300: MIMIC rows but no notes.
+    """
+    df_annotations = pd.DataFrame({
+        'ROW_ID': [1, 2, 3, 4],
+        'SUBJECT_ID': [10, 10, 10, 20],
+        'HADM_ID': [100, 100, 100, 200],
+        'TEXT_HASH': ['a', 'b', 'a', 'c'],
+        'ANNOTATION_CHILD': [True, True, True, False],
+        'ANNOTATION_SPOUSE': [False, False, False, True],
+        'ANNOTATION_BOTH': [False] * 4,
+        'ANNOTATION_ANY': [True] * 4,
+        'ANNOTATION': pd.Categorical(['CHILD', 'CHILD', 'CHILD', 'SPOUSE'],
+                                     categories=['BOTH', 'CHILD', 'NEITHER',
+                                                 'SPOUSE'])
+    })
+    df_neuroner = pd.DataFrame({'ROW_ID': [1, 2, 3, 4],
+                                'CAR': [False, True, False, False],
+                                'LIM': [False, False, False, True]})
+
+    rows = [
+        # HADM_ID, SUBJECT_ID, ICUSTAY_ID, INTIME, VENTNUM, DURATION_HOURS
+        (100, 10, 1, T('2100-01-01'), 1, 5.0),
+        (100, 10, 1, T('2100-01-01'), 2, 7.5),
+        (100, 10, 2, T('2100-01-04'), np.nan, np.nan),
+        (200, 20, 3, T('2100-02-01'), 1, 12.0),
+        (300, 30, 4, T('2100-03-01'), 1, 1.0)
+    ]
+    df_mimic = pd.DataFrame(rows, columns=['HADM_ID', 'SUBJECT_ID',
+                                           'ICUSTAY_ID', 'INTIME', 'VENTNUM',
+                                           'DURATION_HOURS'])
+    n = len(df_mimic)
+    per_hadm = df_mimic['HADM_ID'] // 100
+
+    df_mimic = df_mimic.assign(
+        OUTTIME=df_mimic['INTIME'] + pd.Timedelta(days=2),
+        GENDER=['F', 'F', 'F', 'M', 'M'],
+        MARITAL_STATUS=['MARRIED'] * 3 + ['NOT MARRIED', 'MARRIED'],
+        ETHNICITY='OTHER',
+        LANGUAGE='ENGL',
+        ADMISSION_AGE=60.0 + per_hadm,
+        LOS_HADM=5.0 + per_hadm,
+        DISCHARGE_LOCATION=['HOME'] * 3 + ['DEATH', 'HOME'],
+        HOSPITAL_EXPIRE_FLAG=[False] * 3 + [True, False],
+        MORTALITY_3MO_FROM_HADM_ADMIT=[False] * 3 + [True, False],
+        MORTALITY_1Y_FROM_HADM_ADMIT=[False] * 3 + [True, False],
+        HAS_READMISSION=[True] * 3 + [False, False],
+        DAYS_TO_READMISSION=[40.0] * 3 + [np.nan, np.nan],
+        READMISSION_30D=False,
+        READMISSION_90D=[True] * 3 + [False, False],
+        READMISSION_365D=[True] * 3 + [False, False],
+        N_READMISSIONS=[1] * 3 + [0, 0],
+        VENT_TIME_FROM_HADM=[10.0, 60.0, np.nan, 2.0, 1.0],
+        VENT_FIRST_48_HADM=[True, False, False, True, True],
+        SOFA=[3, 3, 6, 8, 1],
+        VENT_TIME_FROM_ICU=[10.0, 60.0, np.nan, 2.0, 1.0],
+        VENT_FIRST_48_ICU=[True, False, False, True, True],
+        MORTALITY_6MO_FROM_ICU_OUT=[False, False, True, True, False],
+        ELIX_UNWEIGHTED=per_hadm,
+        ELIX_WEIGHTED_VW=per_hadm * 2,
+        ELIX_WEIGHTED_AHRQ=per_hadm * 3,
+        **{col: np.zeros(n, dtype='int8') for col in ELIXHAUSER
+           if col not in KEYS}
+    )
+
+    return df_annotations, df_neuroner, df_mimic
+
+
+def fan_out_hadm(df_annotations, df_neuroner, df_mimic):
+    """The admission level data as it was built before aggregate_notes: the
+    notes joined with every MIMIC row of their admission (notes x ICU stays
+    x ventilation events) and aggregated from that one frame."""
+    df = df_annotations.merge(df_mimic).merge(df_neuroner)
+
+    df_notes = aggregate(
+        df,
+        KEYS,
+        N_TEXTS=('TEXT_HASH', 'nunique'),
+        ANNOTATION_CHILD=('ANNOTATION_CHILD', squish),
+        ANNOTATION_SPOUSE=('ANNOTATION_SPOUSE', squish),
+        ANNOTATION_BOTH=('ANNOTATION_BOTH', squish),
+        ANNOTATION_ANY=('ANNOTATION_ANY', squish),
+        ANNOTATION=('ANNOTATION', squish),
+        IDENTIFIED_CONV_GOC=('CAR', 'any'),
+        IDENTIFIED_CONV_LIM=('LIM', 'any')
+    ).reset_index()
+
+    return aggregate_hadm(df, df_notes)
+
+
+def test_aggregate_hadm_matches_fan_out(cohort, monkeypatch):
+    df_annotations, df_neuroner, df_mimic = cohort
+    monkeypatch.setattr(main.mimic, 'load_data', lambda tables: df_mimic)
+
+    df_notes = aggregate_notes(df_annotations, df_neuroner)
+    df = merge_sources(df_notes, tables=None)
+
+    # only the MIMIC rows of admissions with notes, not multiplied by them
+    assert len(df) == 4
+
+    df_h = aggregate_hadm(df, df_notes)
+
+    pd.testing.assert_frame_equal(
+        df_h, fan_out_hadm(df_annotations, df_neuroner, df_mimic))
+
+    assert df_h['HADM_ID'].tolist() == [100, 200]
+    assert df_h['N_TEXTS'].tolist() == [2, 1]
+    assert df_h['N_ICUSTAYS'].tolist() == [2, 1]
+    assert df_h['VENT_TOTAL_HOURS'].tolist() == [12.5, 12.0]
+    assert df_h['VENT_TOTAL_COUNT'].tolist() == [2, 1]
+    assert df_h['SOFA'].tolist() == [3, 8]
+    assert df_h['MORTALITY_6MO_FROM_ICU_OUT'].tolist() == [True, True]
+    assert df_h['IDENTIFIED_CONV_GOC'].tolist() == [True, False]
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+from cleaning.caregivers.models import (
+    format_logit_results,
+    run_logit,
+    run_logits
+)
+
+
+CONTROL = "C(SEX, Treatment(reference='M')) + ADMISSION_AGE"
+EXPOSURE = "C(ANNOTATION, Treatment(reference='SPOUSE'))"
+
+
+@pytest.fixture
+def df():
+    rng = np.random.RandomState(0)
+    n = 400
+
+    df = pd.DataFrame({
+        'SEX': rng.choice(['M', 'F'], n),
+        'ADMISSION_AGE': rng.normal(65, 10, n),
+        'ANNOTATION': pd.Categorical(rng.choice(['CHILD', 'SPOUSE', 'BOTH'], n),
+                                     categories=['BOTH', 'CHILD', 'NEITHER',
+                                                 'SPOUSE']),
+        'IDENTIFIED_CONV_GOC': rng.randint(0, 2, n),
+        'HOSPITAL_EXPIRE_FLAG': rng.randint(0, 2, n).astype(float),
+    })
+    df.loc[3, 'ADMISSION_AGE'] = np.nan
+    df.loc[5, 'HOSPITAL_EXPIRE_FLAG'] = np.nan
+
+    return df
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_run_logits(df, workers):
+    specs = [('IDENTIFIED_CONV_GOC', EXPOSURE),
+             ('HOSPITAL_EXPIRE_FLAG', EXPOSURE),
+             ('HOSPITAL_EXPIRE_FLAG', 'IDENTIFIED_CONV_GOC + ' + EXPOSURE)]
+
+    results = run_logits(df, specs, CONTROL, workers=workers, disp=False)
+
+    assert results.index.names == ['outcome', 'exposure', 'variable']
+
+    for outcome, exposure in specs:
+        expected = format_logit_results(
+            run_logit('{} ~ {} + {}'.format(outcome, CONTROL, exposure),
+                      df,
+                      disp=False))
+        result = results.loc[(outcome, exposure)]
+
+        assert sorted(result.index) == sorted(expected.index)
+        pd.testing.assert_frame_equal(result.loc[expected.index], expected,
+                                      check_names=False)
+
+
+def test_run_logits_unadjusted(df):
+    results = run_logits(df, [('IDENTIFIED_CONV_GOC', EXPOSURE),
+                              ('IDENTIFIED_CONV_GOC', None)], disp=False)
+
+    expected = format_logit_results(
+        run_logit('IDENTIFIED_CONV_GOC ~ ' + EXPOSURE, df, disp=False))
+
+    pd.testing.assert_frame_equal(
+        results.loc[('IDENTIFIED_CONV_GOC', EXPOSURE)], expected,
+        check_names=False)
+    assert results.loc[('IDENTIFIED_CONV_GOC', '')].index.tolist() ==\
+        ['Intercept']
@@ -0,0 +1,163 @@
+import json
+import pytest
+from cleaning.caregivers import neuroner
+from cleaning.caregivers.neuroner import (
+    export_notes,
+    load_entities,
+    load_flags,
+    load_neuroner_flags,
+    load_neuroner_results,
+    source_paths
+)
+from cleaning.caregivers.notes import load_store, text_hash
+
+
+@pytest.fixture
+def brat(tmp_path):
+    path = tmp_path / 'car_model' / 'processed' / 'brat'
+    deploy = path / 'deploy'
+    deploy.mkdir(parents=True)
+
+    (deploy / '1.ann').write_text('T1\tCAR 0 2\tpt\nT2\tCAR 10 17;20 24\twife at home\n')
+    (deploy / '1.txt').write_text('pt is with wife at home')
+    (deploy / '2.ann').write_text('')
+    (deploy / '3.ann').write_text('T1\tCAR 5 8\tson\n#1\tAnnotatorNotes T1\tnote\n')
+
+    return path
+
+
+def test_flags_match_results(brat):
+    df_results = load_neuroner_results(brat, 'RESULT_STRING_CAR')
+    df_flags = load_neuroner_flags(brat, 'CAR')
+
+    df = df_results.merge(df_flags, on='ROW_ID')
+
+    assert len(df) == 3
+    assert ((df['RESULT_STRING_CAR'].str.len() != 0) == df['CAR']).all()
+
+
+def test_load_entities(brat, tmp_path, monkeypatch):
+    monkeypatch.setattr('cleaning.cache.CACHE_DIR', tmp_path / 'cache')
+
+    df = load_entities(brat)
+
+    assert df.values.tolist() == [[1, 0, 2, 'CAR', 'pt'],
+                                  [1, 10, 24, 'CAR', 'wife at home'],
+                                  [3, 5, 8, 'CAR', 'son']]
+    assert len(list((tmp_path / 'cache' / 'neuroner' / 'car_model').iterdir())) == 1
+
+    # served from the cache
+    assert load_entities(brat).equals(df)
+
+
+def write_notes(path, notes):
+    path.write_text('ROW_ID,TEXT\n' +
+                    ''.join('{},"{}"\n'.format(row_id, text)
+                            for row_id, text in notes))
+
+
+def test_export_notes(tmp_path):
+    source = tmp_path / 'notes.csv'
+    output_dir = tmp_path / 'processed'
+    results_dir = tmp_path / 'output'
+
+    write_notes(source, [(1, 'Pt with wife.\n'), (102, 'Son at bedside.'), (3, '')])
+
+    assert export_notes(source, output_dir, n_shards=10,
+                        results_dir=results_dir,
+                        store_dir=tmp_path / 'store') == ['001', '002', '003']
+    assert (output_dir / 'shards/002/deploy/102.txt').read_text() == 'Son at bedside.'
+    assert (output_dir / 'shards/003/deploy/3.txt').read_text() == ''
+
+    # the manifest has the note store's hashes, none for a note without text
+    manifest = json.loads((output_dir / 'manifest.json').read_text())['notes']
+    store = load_store(source, tmp_path / 'store')
+
+    assert {row_id: entry['hash'] for row_id, entry in manifest.items()} ==\
+        {str(row_id): hash_ if isinstance(hash_, str) else None
+         for row_id, hash_ in zip(store.index['ROW_ID'],
+                                  store.index['TEXT_HASH'])}
+    assert manifest['102']['hash'] == text_hash('Son at bedside.')
+    assert manifest['3']['hash'] is None
+
+    # unchanged notes are not rewritten
+    mtime = (output_dir / 'shards/002/deploy/102.txt').stat().st_mtime_ns
+
+    assert export_notes(source, output_dir, n_shards=10,
+                        results_dir=results_dir,
+                        store_dir=tmp_path / 'store') == ['001', '002', '003']
+    assert (output_dir / 'shards/002/deploy/102.txt').stat().st_mtime_ns == mtime
+
+    write_notes(source, [(1, 'Pt with wife.\n'), (102, 'Daughter at bedside.'), (14, 'New.')])
+
+    assert export_notes(source, output_dir, n_shards=10,
+                        results_dir=results_dir,
+                        store_dir=tmp_path / 'store') == ['001', '002', '003', '004']
+    assert (output_dir / 'shards/002/deploy/102.txt').read_text() == 'Daughter at bedside.'
+    assert not (output_dir / 'shards/003/deploy/3.txt').exists()
+
+
+def test_export_notes_pending_until_rerun(tmp_path):
+    source = tmp_path / 'notes.csv'
+    output_dir = tmp_path / 'processed'
+    results_dir = tmp_path / 'output'
+
+    write_notes(source, [(1, 'Pt with wife.'), (2, 'Son at bedside.')])
+    assert export_notes(source, output_dir, n_shards=10,
+                        results_dir=results_dir,
+                        store_dir=tmp_path / 'store') == ['001', '002']
+
+    # a second export before NeuroNER ran keeps the first one's shards
+    write_notes(source, [(1, 'Pt with wife.'), (2, 'Son at bedside.'), (3, 'New.')])
+    assert export_notes(source, output_dir, n_shards=10,
+                        results_dir=results_dir,
+                        store_dir=tmp_path / 'store') == ['001', '002', '003']
+
+    # shard 001 rerun by both models, shard 002 only by one
+    for model in ['car_model', 'lim_model']:
+        (results_dir / model / 'shards/001/001_2021-01-01/brat').mkdir(parents=True)
+
+    (results_dir / 'car_model/shards/002/002_2021-01-01/brat').mkdir(parents=True)
+
+    assert export_notes(source, output_dir, n_shards=10,
+                        results_dir=results_dir,
+                        store_dir=tmp_path / 'store') == ['002', '003']
+
+    # a changed note makes its shard pending again
+    write_notes(source, [(1, 'Pt with daughter.'), (2, 'Son at bedside.'), (3, 'New.')])
+    assert export_notes(source, output_dir, n_shards=10,
+                        results_dir=results_dir,
+                        store_dir=tmp_path / 'store') == ['001', '002', '003']
+
+def write_results(brat, results):
+    deploy = brat / 'deploy'
+    deploy.mkdir(parents=True)
+
+    for row_id, ann in results.items():
+        (deploy / '{}.ann'.format(row_id)).write_text(ann)
+
+
+def test_load_flags_from_shards(tmp_path, monkeypatch):
+    output_dir = tmp_path / 'output'
+    found = 'T1\tCAR 0 2\tpt\n'
+
+    for column, model in [('CAR', 'car_model'), ('LIM', 'lim_model')]:
+        first_run = output_dir / model / 'processed_2020-12-04' / 'brat'
+        monkeypatch.setattr(neuroner, 'PATH_' + column, first_run)
+        write_results(first_run, {1: found, 2: ''})
+
+        shards = output_dir / model / 'shards'
+        # shard 001 was rerun twice, and note 1 no longer has results
+        write_results(shards / '001/001_2021-01-01_10-00-00-000001/brat',
+                      {1: found})
+        write_results(shards / '001/001_2021-02-01_10-00-00-000001/brat',
+                      {1: ''})
+        write_results(shards / '003/003_2021-01-01_10-00-00-000001/brat',
+                      {3: found if column == 'CAR' else ''})
+
+    df = load_flags(output_dir).sort_values('ROW_ID')
+
+    assert df.values.tolist() == [[1, False, False],
+                                  [2, False, False],
+                                  [3, True, False]]
+    assert len(source_paths(output_dir)) == 4
@@ -0,0 +1,64 @@
+import pytest
+from cleaning.dictionaries import load_dictionary, minimal_substring_set
+from cleaning.noteevents import keyword_prefilter, load_notes, scan_notes
+
+
+NOTES = 'ROW_ID,SUBJECT_ID,HADM_ID,CHARTDATE,CATEGORY,TEXT\n'\
+        '1,10,100,2100-01-01,Nursing/other,"Pt\'s wife at bedside.\n\nCalm."\n'\
+        '2,10,100,2100-01-01,Radiology,"No acute process."\n'\
+        '3,11,,2100-01-02,Physician ,"Discussed with DAUGHTER."\n'\
+        '4,12,102,2100-01-03,Nursing/other,"Plan: continue."\n'
+
+
+@pytest.fixture
+def noteevents(tmp_path):
+    path = tmp_path / 'NOTEEVENTS.csv'
+    path.write_text(NOTES)
+
+    return path
+
+
+@pytest.fixture
+def dictionary(tmp_path):
+    path = tmp_path / 'dict.txt'
+    path.write_text('Wife\nwife’s\nson,daughter, daughters\n\n')
+
+    return path
+
+
+def test_load_dictionary(dictionary):
+    assert load_dictionary(dictionary) == ['wife', "wife's", 'son',
+                                           'daughter', 'daughters']
+
+
+def test_minimal_substring_set():
+    assert minimal_substring_set(['daughters', 'daughter', 'son']) ==\
+        ['son', 'daughter']
+
+
+def test_keyword_prefilter(noteevents):
+    texts = load_notes(noteevents)['TEXT']
+
+    assert keyword_prefilter(['wife', 'daughter'])(texts).tolist() ==\
+        [True, False, True, False]
+
+
+def test_scan_notes_is_chunked(noteevents):
+    chunks = list(scan_notes(noteevents, chunksize=2))
+
+    assert [len(chunk) for chunk in chunks] == [2, 2]
+
+
+def test_scan_notes_filters(noteevents):
+    df = load_notes(noteevents,
+                    columns=['ROW_ID'],
+                    categories=['nursing/other', 'physician'],
+                    keywords=['wife', 'daughter'],
+                    chunksize=1)
+
+    assert df['ROW_ID'].tolist() == [1, 3]
+    assert df.columns.tolist() == ['ROW_ID']
+
+    df = load_notes(noteevents, hadm_ids={100})
+
+    assert df['ROW_ID'].tolist() == [1, 2]
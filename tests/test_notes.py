@@ -0,0 +1,97 @@
+import mmap
+import numpy as np
+import pandas as pd
+import pytest
+from cleaning.caregivers import notes
+from cleaning.caregivers.notes import (
+    load_notes,
+    load_store,
+    read_text,
+    read_texts,
+    text_hash
+)
+
+
+def write_source(path, texts):
+    pd.DataFrame({
+        'ROW_ID': [3, 1, 2, 4][:len(texts)],
+        'HADM_ID': [100, 100, 200, 300][:len(texts)],
+        'CHARTDATE': ['2100-01-01'] * len(texts),
+        'TEXT': texts
+    }).to_csv(path, index=False)
+
+
+def test_store(tmp_path):
+    source = tmp_path / 'notes.csv'
+    write_source(source, ['pt with wife', 'son at bedside\nmulti-line',
+                          'pt with wife', 'naïve'])
+
+    store = load_store(source, tmp_path / 'store')
+
+    assert read_texts(store, [4, 1, 3]).tolist() ==\
+        ['naïve', 'son at bedside\nmulti-line', 'pt with wife']
+    assert read_text(store, 2) == 'pt with wife'
+    assert store.index['TEXT_HASH'].tolist() ==\
+        [text_hash(text) for text in ['pt with wife',
+                                      'son at bedside\nmulti-line',
+                                      'pt with wife', 'naïve']]
+
+    # an unchanged source reuses the store
+    assert load_store(source, tmp_path / 'store').path == store.path
+
+
+def test_store_rebuilt(tmp_path):
+    source = tmp_path / 'notes.csv'
+    write_source(source, ['a', 'b'])
+    store = load_store(source, tmp_path / 'store')
+
+    write_source(source, ['a', 'c', 'd'])
+    store_new = load_store(source, tmp_path / 'store')
+
+    assert read_texts(store_new, [3, 1, 2]).tolist() == ['a', 'c', 'd']
+    assert not store.path.exists()
+    assert len(list((tmp_path / 'store').iterdir())) == 2
+
+
+def test_load_notes(tmp_path):
+    source = tmp_path / 'notes.csv'
+    write_source(source, ['a', np.nan, 'a'])
+
+    df = load_notes(source, tmp_path / 'store')
+
+    assert 'TEXT' not in df.columns
+    assert df['ROW_ID'].tolist() == [3, 1, 2]
+    assert df['TEXT_HASH'][0] == df['TEXT_HASH'][2] == text_hash('a')
+    assert pd.isna(df['TEXT_HASH'][1])
+    assert df['CHARTDATE'].dtype == 'datetime64[ns]'
+
+    store = load_store(source, tmp_path / 'store')
+    assert pd.isna(read_text(store, 1))
+
+
+def test_read_texts_closes_the_store(tmp_path, monkeypatch):
+    source = tmp_path / 'notes.csv'
+    write_source(source, ['pt with wife', 'naïve'])
+    store = load_store(source, tmp_path / 'store')
+
+    maps = []
+
+    class RecordingMmap(mmap.mmap):
+        def __init__(self, *args, **kwargs):
+            maps.append(self)
+
+    monkeypatch.setattr(notes.mmap, 'mmap', RecordingMmap)
+
+    # cut in the middle of 'ï'
+    store.index.loc[store.index['ROW_ID'] == 1, 'LENGTH'] = 3
+
+    with pytest.raises(UnicodeDecodeError):
+        read_texts(store, [1])
+
+    assert maps and all(data.closed for data in maps)
+
+    # a store of only missing texts has nothing to map
+    write_source(source, [np.nan, np.nan])
+    store = load_store(source, tmp_path / 'store')
+
+    assert read_texts(store, [3, 1]).isna().all()
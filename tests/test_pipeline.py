@@ -0,0 +1,144 @@
+import gc
+import json
+import numpy as np
+import pandas as pd
+import pytest
+import weakref
+from cleaning.caregivers.pipeline import (
+    Stage,
+    reset_peak_rss,
+    run,
+    summarize,
+    write_trace
+)
+
+
+def make_stages(calls, source):
+    def load():
+        calls.append('load')
+        return pd.read_csv(source)
+
+    def double(df):
+        calls.append('double')
+        df['x'] = df['x'] * 2
+        return df
+
+    def total(df):
+        calls.append('total')
+        return df['x'].sum()
+
+    return {'load': Stage(load, sources=[source]),
+            'double': Stage(double, ['load']),
+            'total': Stage(total, ['double'])}
+
+
+def test_run_caches_stages(tmp_path):
+    source = tmp_path / 'source.csv'
+    source.write_text('x\n1\n2\n')
+    cache_dir = tmp_path / 'stages'
+    calls = []
+
+    stages = make_stages(calls, source)
+
+    assert run(stages, 'total', cache_dir=cache_dir) == 6
+    assert run(stages, 'total', cache_dir=cache_dir) == 6
+    assert calls == ['load', 'double', 'total']
+
+    # only the stage itself runs when its own target is requested again
+    pd.testing.assert_frame_equal(run(stages, 'double', cache_dir=cache_dir),
+                                  pd.DataFrame({'x': [2, 4]}))
+    assert calls == ['load', 'double', 'total']
+
+
+def test_run_reruns_after_source_change(tmp_path):
+    source = tmp_path / 'source.csv'
+    source.write_text('x\n1\n2\n')
+    cache_dir = tmp_path / 'stages'
+    calls = []
+
+    stages = make_stages(calls, source)
+    run(stages, 'total', cache_dir=cache_dir)
+
+    source.write_text('x\n1\n2\n3\n')
+
+    assert run(stages, 'total', cache_dir=cache_dir) == 12
+    assert calls == ['load', 'double', 'total'] * 2
+    assert len(list(cache_dir.glob('total.*.pkl'))) == 1
+
+
+def test_run_trace(tmp_path):
+    source = tmp_path / 'source.csv'
+    source.write_text('x\n1\n2\n')
+    cache_dir = tmp_path / 'stages'
+
+    stages = make_stages([], source)
+    stages['fan_out'] = Stage(lambda df: pd.concat([df] * 3), ['double'])
+
+    trace = []
+    run(stages, 'fan_out', cache_dir=cache_dir, trace=trace)
+
+    assert [record['stage'] for record in trace] == ['load', 'double', 'fan_out']
+    assert [record['input_rows'] for record in trace] == [[], [2], [2]]
+    assert [record['output_rows'] for record in trace] == [2, 2, 6]
+    assert not any(record['cached'] for record in trace)
+
+    summary = summarize(trace)
+
+    assert summary['ROW_RATIO'].tolist()[1:] == [1, 3]
+    assert (summary['OUTPUT_MEMORY_MB'] > 0).all()
+
+    write_trace(trace, tmp_path / 'trace.json')
+    assert json.loads((tmp_path / 'trace.json').read_text()) == trace
+
+    # stages loaded from the cache are recorded too, without inputs
+    trace = []
+    assert run(stages, 'total', cache_dir=cache_dir, trace=trace) == 6
+    assert [(record['stage'], record['cached']) for record in trace] ==\
+        [('double', True), ('total', False)]
+
+
+@pytest.mark.skipif(reset_peak_rss() is None,
+                    reason='the peak RSS can only be reset on Linux')
+def test_run_trace_peak_rss_per_stage(tmp_path):
+    def allocate(size):
+        # touched, so it is resident, but freed before the stage returns
+        return lambda *inputs: int(np.ones(size // 8).sum())
+
+    stages = {'large': Stage(allocate(256 * 2 ** 20)),
+              'small': Stage(allocate(64 * 2 ** 20), ['large'])}
+
+    trace = []
+    run(stages, 'small', use_cache=False, cache_dir=tmp_path, trace=trace)
+
+    # the later stage peaks below the earlier one, yet its own peak shows
+    deltas = [record['peak_rss_delta'] for record in trace]
+    assert deltas[0] > deltas[1] >= 32 * 2 ** 20
+
+
+def test_run_drops_results_of_partly_cached_runs(tmp_path):
+    source = tmp_path / 'source.csv'
+    source.write_text('x\n1\n2\n')
+    loaded, alive = [], []
+
+    def other(df, factor):
+        loaded.append(weakref.ref(df))
+        return df * factor
+
+    def combine(df_double, df_other):
+        gc.collect()
+        alive.append(loaded[-1]() is not None)
+        return len(df_double) + len(df_other)
+
+    stages = make_stages([], source)
+    stages['other'] = Stage(other, ['load'], params={'factor': 2})
+    stages['combine'] = Stage(combine, ['double', 'other'])
+
+    assert run(stages, 'combine', cache_dir=tmp_path) == 4
+
+    # only 'other' (and 'combine') run again
+    stages['other'] = Stage(other, ['load'], params={'factor': 3})
+
+    assert run(stages, 'combine', cache_dir=tmp_path) == 4
+
+    # no longer needed by then, as the cached 'double' doesn't fetch it
+    assert alive[-1] is False
@@ -0,0 +1,63 @@
+import gzip
+import pandas as pd
+import pyarrow as pa
+import pytest
+from cleaning.caregivers.schema import (
+    ADMISSIONS,
+    ICUSTAYS,
+    VENTDURATIONS,
+    read_csv
+)
+
+
+def test_read_csv(tmp_path):
+    path = tmp_path / 'ADMISSIONS.csv.gz'
+
+    with gzip.open(path, 'wt') as file:
+        file.write('ROW_ID,SUBJECT_ID,HADM_ID,ADMITTIME,DISCHTIME,'
+                   'LANGUAGE,HOSPITAL_EXPIRE_FLAG\n'
+                   '1,10,100,2100-01-01 00:00:00,2100-01-05 12:30:00,'
+                   'ENGL,0\n'
+                   '2,11,101,2100-02-01 08:00:00,,,1\n')
+
+    df = read_csv(path, ADMISSIONS)
+
+    # only declared columns are read, in the order of the file
+    assert list(df.columns) == ['SUBJECT_ID', 'HADM_ID', 'ADMITTIME',
+                                'DISCHTIME', 'LANGUAGE',
+                                'HOSPITAL_EXPIRE_FLAG']
+    assert df.dtypes.astype(str).tolist() == ['int32', 'int32',
+                                              'datetime64[ns]',
+                                              'datetime64[ns]', 'category',
+                                              'int8']
+
+    assert df['DISCHTIME'][0] == pd.Timestamp('2100-01-05 12:30:00')
+    assert pd.isna(df['DISCHTIME'][1])
+    assert df['LANGUAGE'].tolist()[0] == 'ENGL'
+    assert pd.isna(df['LANGUAGE'][1])
+
+
+def test_read_csv_lower_case_header(tmp_path):
+    path = tmp_path / 'ventdurations.csv'
+    path.write_text('icustay_id,ventnum,starttime,endtime,duration_hours\n'
+                    '1000,1,2100-01-01 00:00:00,2100-01-01 06:00:00,6\n'
+                    ',2,2100-01-02 00:00:00,2100-01-02 01:30:00,1.5\n')
+
+    df = read_csv(path, VENTDURATIONS)
+
+    assert list(df.columns) == ['icustay_id', 'ventnum', 'starttime',
+                                'endtime', 'duration_hours']
+    assert df.dtypes.astype(str).tolist() == ['float64', 'int32',
+                                              'datetime64[ns]',
+                                              'datetime64[ns]', 'float64']
+    assert pd.isna(df['icustay_id'][1])
+    assert df['duration_hours'].tolist() == [6, 1.5]
+
+
+def test_read_csv_enforces_datetime_format(tmp_path):
+    path = tmp_path / 'ICUSTAYS.csv'
+    path.write_text('SUBJECT_ID,HADM_ID,ICUSTAY_ID,INTIME,OUTTIME\n'
+                    '10,100,1000,01/02/2100 10:00,2100-01-03 10:00:00\n')
+
+    with pytest.raises(pa.ArrowInvalid):
+        read_csv(path, ICUSTAYS)
@@ -1,6 +1,9 @@
 import logging
+import pandas as pd
 import pytest
 from cleaning.text_preprocessing import preprocess_text, \
+                                        preprocess_text_with_offsets, \
+                                        preprocess_texts, \
                                         remove_redactions
 
 
@@ -22,3 +25,29 @@ def test_preprocess_text(typical_note):
 
 def test_remove_redactions(obfuscation):
     assert remove_redactions(obfuscation) == ' '
+
+
+def test_preprocess_text_with_offsets(typical_note):
+    text, offsets = preprocess_text_with_offsets(typical_note)
+
+    assert text == preprocess_text(typical_note)
+    assert typical_note[offsets[4]:offsets[10] + 1] == 'patient'
+    # the space before "yo" stands for " 81"
+    assert typical_note[offsets[16]:offsets[18] + 1] == ' 81yo'
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_preprocess_texts(typical_note, workers):
+    texts = pd.Series([typical_note, None, 'WIFE [**Name**] at\nbedside'],
+                      index=[3, 4, 5])
+
+    result = preprocess_texts(texts, workers=workers, chunksize=1)
+
+    assert result.index.tolist() == [3, 4, 5]
+    assert result.tolist() == [preprocess_text(typical_note), None,
+                               'wife at bedside']
+
+    text, offsets = preprocess_texts(texts.tolist(), offsets=True)[2]
+
+    assert text == 'wife at bedside'
+    assert offsets.tolist()[:6] == [0, 1, 2, 3, 4, 16]
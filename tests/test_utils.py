@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+from cleaning.utils import aggregate, parse_datetime, squish, squish_groups
+
+
+@pytest.fixture
+def fanned_out():
+    return pd.DataFrame({'HADM_ID': [2, 1, 1, 2, 3],
+                         'SEX': ['F', 'M', 'M', 'F', 'M'],
+                         'SOFA': [np.nan, 3, 3, np.nan, 1],
+                         'ICUSTAY_ID': [20, 10, 11, 21, 30]})
+
+
+def test_squish_groups_matches_squish(fanned_out):
+    expected = fanned_out.groupby('HADM_ID')[['SEX', 'SOFA']].agg(squish)
+
+    pd.testing.assert_frame_equal(
+        squish_groups(fanned_out, 'HADM_ID', ['SEX', 'SOFA']),
+        expected,
+        check_dtype=False)
+
+
+def test_squish_groups_reports_conflicts(fanned_out):
+    with pytest.raises(IndexError, match=r"\['ICUSTAY_ID'\]; 2 HADM_ID"):
+        squish_groups(fanned_out, 'HADM_ID', ['SEX', 'ICUSTAY_ID'])
+
+
+def test_aggregate(fanned_out):
+    df = aggregate(fanned_out, 'HADM_ID',
+                   N_ICUSTAYS=('ICUSTAY_ID', 'nunique'),
+                   SEX=('SEX', squish))
+
+    assert df.columns.tolist() == ['N_ICUSTAYS', 'SEX']
+    assert df['N_ICUSTAYS'].tolist() == [2, 2, 1]
+    assert df['SEX'].tolist() == ['M', 'F', 'M']
+
+
+def test_parse_datetime():
+    values = pd.Series(['2100-01-01 00:00:00', None, '2100-01-01 00:00:00',
+                        '2101-02-03 04:05:06'], index=[5, 6, 7, 8], name='X')
+
+    pd.testing.assert_series_equal(parse_datetime(values),
+                                   pd.to_datetime(values))
+
+    with pytest.raises(ValueError):
+        parse_datetime(pd.Series(['01/02/2100']))